@@ -0,0 +1,186 @@
+"""
+遅いバッチの検出と診断情報の取得
+バッチごとの1行あたり処理時間を直近のバッチの中央値・MAD（中央絶対偏差）と比較し、
+外れ値のバッチを検出した時点で PostgreSQL（pg_stat_activity / pg_locks / 待機イベント）または
+SQL Server（sys.dm_exec_requests / セッションの待機統計）の状態を取得して結果に残す
+"""
+
+import logging
+import statistics
+from collections import deque
+from config import DatabaseConfig
+from db_connections import create_sql_server_connection
+
+logger = logging.getLogger(__name__)
+
+# MADを標準偏差相当に換算する係数（正規分布の場合）
+_MAD_SCALE = 1.4826
+
+_PG_ACTIVITY_QUERY = """
+SELECT pid, usename, application_name, state, wait_event_type, wait_event,
+       round(extract(epoch FROM now() - xact_start)::numeric, 3) AS xact_seconds,
+       round(extract(epoch FROM now() - query_start)::numeric, 3) AS query_seconds,
+       pg_blocking_pids(pid) AS blocked_by, left(query, 200) AS query
+FROM pg_stat_activity
+WHERE datname = current_database() AND state <> 'idle' AND pid <> pg_backend_pid()
+ORDER BY xact_start
+LIMIT 20
+"""
+
+_PG_LOCKS_QUERY = """
+SELECT l.pid, l.locktype, l.mode, l.granted, l.relation::regclass::text AS relation
+FROM pg_locks l
+WHERE l.pid <> pg_backend_pid() AND (NOT l.granted OR l.relation = to_regclass(%s))
+LIMIT 50
+"""
+
+_PG_WAIT_EVENTS_QUERY = """
+SELECT wait_event_type, wait_event, count(*) AS sessions
+FROM pg_stat_activity
+WHERE wait_event IS NOT NULL AND state <> 'idle'
+GROUP BY wait_event_type, wait_event
+ORDER BY sessions DESC
+"""
+
+_SQL_SERVER_REQUESTS_QUERY = """
+SELECT TOP 20 r.session_id, r.status, r.command, r.wait_type, r.wait_time, r.last_wait_type, r.wait_resource,
+       r.blocking_session_id, r.cpu_time, r.total_elapsed_time, r.reads, r.logical_reads, r.writes
+FROM sys.dm_exec_requests r
+WHERE r.session_id = %s OR r.blocking_session_id <> 0
+   OR r.session_id IN (SELECT blocking_session_id FROM sys.dm_exec_requests WHERE blocking_session_id <> 0)
+"""
+
+_SQL_SERVER_SESSION_WAITS_QUERY = """
+SELECT TOP 10 wait_type, waiting_tasks_count, wait_time_ms, signal_wait_time_ms
+FROM sys.dm_exec_session_wait_stats
+WHERE session_id = %s
+ORDER BY wait_time_ms DESC
+"""
+
+
+class SlowBatchDetector:
+    """直近のバッチの中央値・MADから外れ値のバッチを検出するクラス"""
+
+    def __init__(self, name):
+        """
+        初期化
+
+        Args:
+            name (str): 'fetch'（SQL Serverからの取得）または 'load'（PostgreSQLへのロード）
+        """
+        self.name = name
+        self.history = deque(maxlen=DatabaseConfig.get_optional_env('SLOW_BATCH_WINDOW', 50))
+        self.min_samples = DatabaseConfig.get_optional_env('SLOW_BATCH_MIN_SAMPLES', 5)
+        self.threshold = float(DatabaseConfig.get_optional_env('SLOW_BATCH_THRESHOLD', '5'))
+        self.min_ratio = float(DatabaseConfig.get_optional_env('SLOW_BATCH_MIN_RATIO', '3'))
+        self.min_seconds = float(DatabaseConfig.get_optional_env('SLOW_BATCH_MIN_SECONDS', '1'))
+        self.batch_count = 0
+
+    def observe(self, row_count, seconds):
+        """
+        1バッチの処理時間を記録し、外れ値か判定
+
+        1行あたりの処理時間で比較する（バッチサイズの変化や最後の端数バッチの影響を除く）
+
+        Args:
+            row_count (int): バッチの行数
+            seconds (float): バッチの処理時間
+
+        Returns:
+            dict: 外れ値の場合は判定内容（batch, seconds, rows, expected_seconds, score）、それ以外はNone
+        """
+        self.batch_count += 1
+        if row_count <= 0:
+            return None
+
+        row_seconds = seconds / row_count
+        anomaly = None
+        if len(self.history) >= self.min_samples and seconds >= self.min_seconds:
+            median = statistics.median(self.history)
+            mad = statistics.median(abs(value - median) for value in self.history)
+            # ほぼ一定の処理時間でMADが0になる場合は中央値の5%をばらつきの下限とする
+            scale = _MAD_SCALE * max(mad, median * 0.05)
+            score = (row_seconds - median) / scale if scale > 0 else float('inf')
+            if score > self.threshold and row_seconds > median * self.min_ratio:
+                anomaly = {
+                    'phase': self.name,
+                    'batch': self.batch_count,
+                    'seconds': round(seconds, 3),
+                    'rows': row_count,
+                    'expected_seconds': round(median * row_count, 3),
+                    'score': round(score, 1)
+                }
+        # 外れ値も履歴に含める（中央値・MADは少数の外れ値の影響を受けない）
+        self.history.append(row_seconds)
+        return anomaly
+
+
+def _fetch_dicts(cursor):
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def capture_postgresql_diagnostics(pg_conn, pg_table):
+    """
+    PostgreSQLの実行中セッション・ロック・待機イベントを取得
+
+    ロード中のトランザクション内で実行するため、セーブポイントで囲み失敗してもロードに影響させない
+
+    Args:
+        pg_conn: ロード中のPostgreSQL接続
+        pg_table (str): ロード先テーブル（このテーブルのロックを取得）
+
+    Returns:
+        dict: activity, locks, wait_events（取得失敗時は error）
+    """
+    try:
+        with pg_conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT slow_batch_diagnostics")
+            try:
+                # トランザクション内の統計スナップショットを破棄して現在の状態を取得
+                cursor.execute("SELECT pg_stat_clear_snapshot()")
+                cursor.execute(_PG_ACTIVITY_QUERY)
+                activity = _fetch_dicts(cursor)
+                cursor.execute(_PG_LOCKS_QUERY, (pg_table,))
+                locks = _fetch_dicts(cursor)
+                cursor.execute(_PG_WAIT_EVENTS_QUERY)
+                wait_events = _fetch_dicts(cursor)
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_batch_diagnostics")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_batch_diagnostics")
+        return {'activity': activity, 'locks': locks, 'wait_events': wait_events}
+    except Exception as e:
+        logger.warning(f"PostgreSQL診断情報の取得エラー: {str(e)}")
+        return {'error': str(e)}
+
+
+def capture_sql_server_diagnostics(sql_config, session_id):
+    """
+    SQL Serverの実行中リクエストと抽出セッションの待機統計を取得
+
+    抽出中の接続は結果セットの読み出し途中のため、診断用に別の接続を開く（VIEW SERVER STATE 権限が必要）
+
+    Args:
+        sql_config (dict): SQL Server接続設定
+        session_id (int): 抽出セッションの @@SPID
+
+    Returns:
+        dict: requests, session_waits（取得失敗時は error）
+    """
+    conn = None
+    try:
+        conn = create_sql_server_connection(sql_config)
+        cursor = conn.cursor()
+        cursor.execute(_SQL_SERVER_REQUESTS_QUERY, (session_id,))
+        requests = _fetch_dicts(cursor)
+        cursor.execute(_SQL_SERVER_SESSION_WAITS_QUERY, (session_id,))
+        session_waits = _fetch_dicts(cursor)
+        cursor.close()
+        return {'session_id': session_id, 'requests': requests, 'session_waits': session_waits}
+    except Exception as e:
+        logger.warning(f"SQL Server診断情報の取得エラー: {str(e)}")
+        return {'session_id': session_id, 'error': str(e)}
+    finally:
+        if conn is not None:
+            conn.close()
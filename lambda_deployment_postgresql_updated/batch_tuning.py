@@ -0,0 +1,171 @@
+"""
+適応的バッチサイズ制御
+バッチごとの処理時間とバイト数を計測し、目標処理時間（既定1秒）とメモリ上限（バイト数）に収まるよう
+次のバッチサイズを調整する。収束したサイズはテーブルごとに PostgreSQL に保存し、次回実行の初期値とする
+"""
+
+import logging
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_row_bytes(rows, sample_size=100):
+    """
+    行の平均バイト数を先頭の一部の行から推定（文字列表現の長さの合計）
+
+    Args:
+        rows (list): 行タプルのリスト
+        sample_size (int): 推定に使う行数
+    """
+    sample = rows[:sample_size]
+    if not sample:
+        return 0
+    total = 0
+    for row in sample:
+        for value in row:
+            if value is not None:
+                total += len(value) if isinstance(value, (str, bytes)) else len(str(value))
+        total += len(row)  # 区切り文字分
+    return total / len(sample)
+
+
+class AdaptiveBatchSizer:
+    """計測したスループットから次のバッチサイズを決めるコントローラ"""
+
+    def __init__(self, initial_size, name='batch'):
+        """
+        初期化
+
+        Args:
+            initial_size (int): 初期バッチサイズ（前回保存値またはテーブル設定の batch_size）
+            name (str): ログ用の名前
+        """
+        self.name = name
+        self.min_size = DatabaseConfig.get_optional_env('ADAPTIVE_BATCH_MIN', 1000)
+        self.max_size = DatabaseConfig.get_optional_env('ADAPTIVE_BATCH_MAX', 100000)
+        self.target_seconds = DatabaseConfig.get_optional_env('ADAPTIVE_BATCH_TARGET_MS', 1000) / 1000
+        self.max_bytes = DatabaseConfig.get_optional_env('ADAPTIVE_BATCH_MAX_BYTES', 32 * 1024 * 1024)
+        self.batch_size = self.clamp(initial_size)
+        self.initial_size = self.batch_size
+        self.row_bytes = None
+        self.observations = 0
+
+    def clamp(self, size):
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def observe(self, row_count, seconds, byte_count=None):
+        """
+        1バッチの計測結果を反映して次のバッチサイズを更新
+
+        Args:
+            row_count (int): バッチの行数
+            seconds (float): バッチの処理時間
+            byte_count (int): バッチのバイト数（不明な場合はNone）
+        """
+        if row_count <= 0:
+            return self.batch_size
+
+        if byte_count:
+            row_bytes = byte_count / row_count
+            self.row_bytes = row_bytes if self.row_bytes is None else 0.7 * self.row_bytes + 0.3 * row_bytes
+
+        rate = row_count / max(seconds, 0.001)
+        ideal = rate * self.target_seconds
+
+        # 1回の計測での急変を避けるため、変化を半分〜2倍に制限して平滑化
+        ideal = max(self.batch_size / 2, min(self.batch_size * 2, ideal))
+        smoothed = 0.5 * self.batch_size + 0.5 * ideal
+        # バイト数の上限は平滑化の後に適用（半分までの制限で上限を超えないように。ADAPTIVE_BATCH_MIN が下限）
+        if self.row_bytes:
+            smoothed = min(smoothed, self.max_bytes / self.row_bytes)
+        self.batch_size = self.clamp(smoothed)
+        self.observations += 1
+        return self.batch_size
+
+    def stats(self):
+        return {
+            'initial_size': self.initial_size,
+            'final_size': self.batch_size,
+            'observations': self.observations,
+            'row_bytes': round(self.row_bytes, 1) if self.row_bytes else None
+        }
+
+
+def iter_adaptive_batches(rows, sizer):
+    """
+    行バッファをコントローラの現在のバッチサイズで分割して返す
+
+    Args:
+        rows (list | SpillBuffer): 行バッファ
+        sizer (AdaptiveBatchSizer): バッチサイズコントローラ（各バッチの取り出し時点の値を使用）
+    """
+    if not hasattr(rows, 'iter_batches'):
+        start_idx = 0
+        while start_idx < len(rows):
+            end_idx = start_idx + sizer.batch_size
+            yield rows[start_idx:end_idx]
+            start_idx = end_idx
+        return
+
+    # スピルバッファ等は最小サイズ単位で読み出して現在のサイズまでまとめる
+    pending = []
+    for block in rows.iter_batches(sizer.min_size):
+        pending.extend(block)
+        if len(pending) >= sizer.batch_size:
+            yield pending
+            pending = []
+    if pending:
+        yield pending
+
+
+class BatchSizeStore:
+    """テーブルごとの調整済みバッチサイズを PostgreSQL に保存・参照するクラス"""
+
+    def __init__(self, pg_conn, table=None):
+        self.pg_conn = pg_conn
+        self.table = table or DatabaseConfig.get_optional_env('BATCH_TUNING_TABLE', 'sync_batch_tuning')
+
+    def ensure_table(self):
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    table_name TEXT PRIMARY KEY,
+                    load_batch_size INTEGER,
+                    fetch_size INTEGER,
+                    row_bytes DOUBLE PRECISION,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+        self.pg_conn.commit()
+
+    def load(self, table_name):
+        """
+        保存済みのバッチサイズを取得
+
+        Returns:
+            dict: load_batch_size, fetch_size（未保存の場合は空の辞書）
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT load_batch_size, fetch_size FROM {self.table} WHERE table_name = %s",
+                (table_name,)
+            )
+            row = cursor.fetchone()
+        self.pg_conn.commit()
+        if row is None:
+            return {}
+        return {key: value for key, value in zip(('load_batch_size', 'fetch_size'), row) if value}
+
+    def save(self, table_name, load_batch_size=None, fetch_size=None, row_bytes=None):
+        """調整後のバッチサイズを保存（未計測の値は前回値を維持）"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} (table_name, load_batch_size, fetch_size, row_bytes) "
+                f"VALUES (%s, %s, %s, %s) ON CONFLICT (table_name) DO UPDATE SET "
+                f"load_batch_size = COALESCE(EXCLUDED.load_batch_size, {self.table}.load_batch_size), "
+                f"fetch_size = COALESCE(EXCLUDED.fetch_size, {self.table}.fetch_size), "
+                f"row_bytes = COALESCE(EXCLUDED.row_bytes, {self.table}.row_bytes), updated_at = now()",
+                (table_name, load_batch_size, fetch_size, row_bytes)
+            )
+        self.pg_conn.commit()
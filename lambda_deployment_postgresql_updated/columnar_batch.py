@@ -0,0 +1,506 @@
+"""
+カラムナ形式のバッチ表現
+行タプル（1行あたり数十個のPythonオブジェクト）の代わりに、列ごとの配列でバッチを保持する
+整数・真偽値・タイムスタンプ列は array（NumPyがあればゼロコピーで参照可能）、文字列列はリストで保持する
+低カーディナリティ列は辞書エンコード（コード配列 + 辞書）で保持する
+"""
+
+import hashlib
+import logging
+from array import array
+from datetime import datetime, timedelta, timezone
+from copy_format import COPY_NULL, escape_copy_text, format_copy_value
+
+logger = logging.getLogger(__name__)
+
+# 列の格納種別
+KIND_INT = 'int'
+KIND_BOOL = 'bool'
+KIND_FLOAT = 'float'
+KIND_TIMESTAMP = 'timestamp'
+KIND_STR = 'str'
+KIND_OBJECT = 'object'
+KIND_DICT = 'dict'
+
+# 格納種別 → array の型コード
+_ARRAY_TYPECODES = {
+    KIND_INT: 'q',
+    KIND_BOOL: 'b',
+    KIND_FLOAT: 'd',
+    KIND_TIMESTAMP: 'q',  # 1970-01-01 からのマイクロ秒
+}
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_EPOCH = datetime(1970, 1, 1)
+
+# ハッシュ計算用の区切り文字とNULL表現
+_DIGEST_SEPARATOR = '\x1f'
+_DIGEST_NULL = '\x00'
+
+
+def _detect_kind(values):
+    """列の値から格納種別を判定（型が混在する場合は object）"""
+    kind = None
+    for value in values:
+        if value is None:
+            continue
+        value_type = type(value)
+        if value_type is bool:
+            value_kind = KIND_BOOL
+        elif value_type is int:
+            if not _INT64_MIN <= value <= _INT64_MAX:
+                return KIND_OBJECT
+            value_kind = KIND_INT
+        elif value_type is float:
+            value_kind = KIND_FLOAT
+        elif value_type is datetime and value.tzinfo is None:
+            value_kind = KIND_TIMESTAMP
+        elif value_type is str:
+            value_kind = KIND_STR
+        else:
+            return KIND_OBJECT
+        if kind is None:
+            kind = value_kind
+        elif kind != value_kind:
+            return KIND_OBJECT
+    return kind or KIND_OBJECT
+
+
+def _format_digest_value(value):
+    """
+    ダイジェスト用の単一値のテキスト表現
+
+    object・辞書エンコード列の値を型付きの列（真偽値は t/f）と同じ表現にし、
+    タイムゾーン付きの日時はUTCに揃える（行のダイジェストが同じバッチの他の行の値に依存しないように）
+    """
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).isoformat(sep=' ')
+    return str(value)
+
+
+def _to_micros(value):
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _from_micros(micros):
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _build_null_bitmap(null_flags, row_count):
+    """NULLフラグのイテラブルからNULLビットマップを作成（NULLがない場合は None）"""
+    null_bitmap = None
+    for row_idx, is_null in enumerate(null_flags):
+        if is_null:
+            if null_bitmap is None:
+                null_bitmap = bytearray((row_count + 7) // 8)
+            null_bitmap[row_idx >> 3] |= 1 << (row_idx & 7)
+    return null_bitmap
+
+
+class ColumnarBatch:
+    """
+    カラムナ形式のバッチ
+
+    Attributes:
+        column_names (list): 列名
+        kinds (list): 列ごとの格納種別
+        columns (list): 列ごとの値（array または list、NULL位置は0/None。辞書エンコード列はコード配列）
+        nulls (list): 列ごとのNULLビットマップ（bytearray、NULLなしの列は None）
+        dictionaries (list): 辞書エンコード列の辞書（コード → 値、対象外の列は None）
+        row_count (int): 行数
+    """
+
+    __slots__ = ('column_names', 'kinds', 'columns', 'nulls', 'dictionaries', 'row_count')
+
+    def __init__(self, column_names, kinds, columns, nulls, row_count, dictionaries=None):
+        self.column_names = column_names
+        self.kinds = kinds
+        self.columns = columns
+        self.nulls = nulls
+        self.dictionaries = dictionaries or [None] * len(columns)
+        self.row_count = row_count
+
+    def __len__(self):
+        return self.row_count
+
+    @classmethod
+    def from_rows(cls, rows, column_names, dictionary_columns=None):
+        """
+        行タプルのリストからカラムナバッチを作成
+
+        Args:
+            rows (list): 行タプルのリスト
+            column_names (list): 列名
+            dictionary_columns (iterable): 辞書エンコードする列名（低カーディナリティの文字列列）
+
+        Returns:
+            ColumnarBatch: カラムナバッチ
+        """
+        row_count = len(rows)
+        dictionary_columns = set(dictionary_columns or ())
+        kinds = []
+        columns = []
+        nulls = []
+        dictionaries = []
+
+        for column_name, values in zip(column_names, zip(*rows) if rows else [() for _ in column_names]):
+            kind = _detect_kind(values)
+            if column_name in dictionary_columns and kind in (KIND_STR, KIND_OBJECT):
+                kind = KIND_DICT
+            kinds.append(kind)
+
+            null_bitmap = None
+            if None in values:
+                null_bitmap = bytearray((row_count + 7) // 8)
+                for row_idx, value in enumerate(values):
+                    if value is None:
+                        null_bitmap[row_idx >> 3] |= 1 << (row_idx & 7)
+            nulls.append(null_bitmap)
+
+            if kind == KIND_DICT:
+                # 値 → コードの辞書を作成（NULLはビットマップで管理し、コード0を割り当て）
+                codes = {}
+                dictionary = []
+                code_array = array('i', [0]) * row_count
+                for row_idx, value in enumerate(values):
+                    if value is None:
+                        continue
+                    code = codes.get(value)
+                    if code is None:
+                        code = codes[value] = len(dictionary)
+                        dictionary.append(value)
+                    code_array[row_idx] = code
+                columns.append(code_array)
+                dictionaries.append(dictionary)
+                continue
+
+            dictionaries.append(None)
+            if kind in _ARRAY_TYPECODES:
+                if kind == KIND_TIMESTAMP:
+                    values = [0 if value is None else _to_micros(value) for value in values]
+                elif null_bitmap is not None:
+                    values = [0 if value is None else value for value in values]
+                columns.append(array(_ARRAY_TYPECODES[kind], values))
+            else:
+                columns.append(list(values))
+
+        return cls(list(column_names), kinds, columns, nulls, row_count, dictionaries)
+
+    def slice(self, start, end):
+        """
+        行範囲 [start, end) のカラムナバッチを作成（行タプルに戻さず列ごとに切り出す）
+
+        辞書エンコード列は辞書を共有する
+        """
+        row_count = end - start
+        columns = [column[start:end] for column in self.columns]
+        nulls = [
+            None if null_bitmap is None else _build_null_bitmap(self.null_mask(column_idx)[start:end], row_count)
+            for column_idx, null_bitmap in enumerate(self.nulls)
+        ]
+        return ColumnarBatch(list(self.column_names), list(self.kinds), columns, nulls, row_count, list(self.dictionaries))
+
+    @classmethod
+    def concat(cls, batches):
+        """
+        同じ列構成のカラムナバッチを連結
+
+        格納種別が一致する列は配列のまま連結し、種別が異なる列（バッチごとに判定が異なる場合）と
+        辞書エンコード列は値から作り直す
+        """
+        if len(batches) == 1:
+            return batches[0]
+
+        first = batches[0]
+        row_count = sum(batch.row_count for batch in batches)
+        kinds = []
+        columns = []
+        nulls = []
+        dictionaries = []
+
+        for column_idx, column_name in enumerate(first.column_names):
+            column_kinds = {batch.kinds[column_idx] for batch in batches}
+            kind = first.kinds[column_idx]
+            if len(column_kinds) == 1 and kind != KIND_DICT:
+                column = array(_ARRAY_TYPECODES[kind]) if kind in _ARRAY_TYPECODES else []
+                for batch in batches:
+                    column.extend(batch.columns[column_idx])
+                null_bitmap = None
+                if any(batch.nulls[column_idx] is not None for batch in batches):
+                    null_bitmap = _build_null_bitmap(
+                        (is_null for batch in batches for is_null in batch.null_mask(column_idx)), row_count
+                    )
+                kinds.append(kind)
+                columns.append(column)
+                nulls.append(null_bitmap)
+                dictionaries.append(None)
+                continue
+
+            values = []
+            for batch in batches:
+                values.extend(batch.column_values(column_idx))
+            dictionary_columns = [column_name] if KIND_DICT in column_kinds else None
+            replaced = cls.from_rows([(value,) for value in values], [column_name], dictionary_columns)
+            kinds.append(replaced.kinds[0])
+            columns.append(replaced.columns[0])
+            nulls.append(replaced.nulls[0])
+            dictionaries.append(replaced.dictionaries[0])
+
+        return cls(list(first.column_names), kinds, columns, nulls, row_count, dictionaries)
+
+    def column_index(self, column_name):
+        """列名から列番号を取得"""
+        return self.column_names.index(column_name)
+
+    def is_null(self, column_idx, row_idx):
+        """指定セルがNULLか"""
+        null_bitmap = self.nulls[column_idx]
+        return null_bitmap is not None and bool(null_bitmap[row_idx >> 3] & (1 << (row_idx & 7)))
+
+    def null_mask(self, column_idx):
+        """列のNULLフラグをリストで取得"""
+        null_bitmap = self.nulls[column_idx]
+        if null_bitmap is None:
+            return [False] * self.row_count
+        return [bool(null_bitmap[row_idx >> 3] & (1 << (row_idx & 7))) for row_idx in range(self.row_count)]
+
+    def column_values(self, column_idx):
+        """列の値をPython値のリストで取得（NULLは None）"""
+        kind = self.kinds[column_idx]
+        column = self.columns[column_idx]
+
+        if kind == KIND_TIMESTAMP:
+            values = [_from_micros(micros) for micros in column]
+        elif kind == KIND_DICT:
+            dictionary = self.dictionaries[column_idx]
+            values = [dictionary[code] for code in column] if dictionary else [None] * self.row_count
+        elif kind == KIND_BOOL:
+            values = [bool(value) for value in column]
+        elif kind in _ARRAY_TYPECODES:
+            values = column.tolist()
+        else:
+            return list(column)
+
+        if self.nulls[column_idx] is not None:
+            for row_idx, is_null in enumerate(self.null_mask(column_idx)):
+                if is_null:
+                    values[row_idx] = None
+        return values
+
+    def numpy_column(self, column_idx):
+        """
+        数値列をNumPy配列として参照（ゼロコピー）
+
+        Returns:
+            tuple: (ndarray, NULLマスクのndarray または None)
+        """
+        # NumPyは任意（インストールされている場合のみ列をndarrayとして参照可能、使用時にインポート）
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("numpy_column には NumPy が必要です")
+        kind = self.kinds[column_idx]
+        if kind not in _ARRAY_TYPECODES:
+            raise ValueError(f"数値列ではありません: {self.column_names[column_idx]} ({kind})")
+
+        dtype = {KIND_INT: np.int64, KIND_BOOL: np.int8, KIND_FLOAT: np.float64, KIND_TIMESTAMP: np.int64}[kind]
+        values = np.frombuffer(self.columns[column_idx], dtype=dtype)
+        mask = None
+        if self.nulls[column_idx] is not None:
+            bits = np.unpackbits(np.frombuffer(self.nulls[column_idx], dtype=np.uint8), bitorder='little')
+            mask = bits[:self.row_count].astype(bool)
+        return values, mask
+
+    def map_column(self, column_name, func):
+        """
+        列単位の変換を適用（NULL以外の値に func を適用）
+
+        Args:
+            column_name (str): 列名
+            func (callable): 値変換関数
+        """
+        column_idx = self.column_index(column_name)
+
+        if self.kinds[column_idx] == KIND_DICT:
+            # 辞書エンコード列は辞書の値のみ変換（行数に依存しない）
+            self.dictionaries[column_idx] = [func(value) for value in self.dictionaries[column_idx]]
+            return
+
+        values = [None if value is None else func(value) for value in self.column_values(column_idx)]
+        replaced = ColumnarBatch.from_rows([(value,) for value in values], [column_name])
+        self.kinds[column_idx] = replaced.kinds[0]
+        self.columns[column_idx] = replaced.columns[0]
+        self.nulls[column_idx] = replaced.nulls[0]
+        self.dictionaries[column_idx] = replaced.dictionaries[0]
+
+    def to_rows(self):
+        """行タプルのリストに戻す"""
+        if self.row_count == 0:
+            return []
+        return list(zip(*[self.column_values(column_idx) for column_idx in range(len(self.columns))]))
+
+    def _format_column(self, column_idx, null_text, format_value):
+        """列をテキスト表現のリストに変換（列種別ごとに一括処理）"""
+        kind = self.kinds[column_idx]
+        column = self.columns[column_idx]
+
+        if kind == KIND_INT or kind == KIND_FLOAT:
+            texts = list(map(str, column))
+        elif kind == KIND_BOOL:
+            texts = ['t' if value else 'f' for value in column]
+        elif kind == KIND_TIMESTAMP:
+            texts = [_from_micros(micros).isoformat(sep=' ') for micros in column]
+        elif kind == KIND_DICT:
+            # 辞書の値を1回だけ整形し、コードで参照
+            dictionary_texts = [format_value(value) for value in self.dictionaries[column_idx]]
+            texts = [dictionary_texts[code] for code in column] if dictionary_texts else [null_text] * self.row_count
+        else:
+            texts = [null_text if value is None else format_value(value) for value in column]
+            return texts
+
+        if self.nulls[column_idx] is not None:
+            for row_idx, is_null in enumerate(self.null_mask(column_idx)):
+                if is_null:
+                    texts[row_idx] = null_text
+        return texts
+
+    def to_copy_text(self):
+        """
+        COPY FROM STDIN (FORMAT text) 用の文字列にエンコード
+
+        Returns:
+            str: COPYテキスト形式の文字列
+        """
+        if self.row_count == 0:
+            return ''
+
+        formatted_columns = []
+        for column_idx, kind in enumerate(self.kinds):
+            if kind == KIND_STR or (kind == KIND_DICT and all(type(value) is str for value in self.dictionaries[column_idx])):
+                formatted_columns.append(self._format_column(column_idx, COPY_NULL, escape_copy_text))
+            else:
+                formatted_columns.append(self._format_column(column_idx, COPY_NULL, format_copy_value))
+
+        return '\n'.join(map('\t'.join, zip(*formatted_columns))) + '\n'
+
+    def row_digests(self):
+        """
+        行ごとのMD5ダイジェストを計算（差分検出用）
+
+        Returns:
+            list: 16進ダイジェスト文字列のリスト
+        """
+        if self.row_count == 0:
+            return []
+
+        formatted_columns = [
+            self._format_column(column_idx, _DIGEST_NULL, _format_digest_value)
+            for column_idx in range(len(self.columns))
+        ]
+        md5 = hashlib.md5
+        return [
+            md5(_DIGEST_SEPARATOR.join(texts).encode('utf-8')).hexdigest()
+            for texts in zip(*formatted_columns)
+        ]
+
+    def digest(self):
+        """バッチ全体のダイジェストを計算"""
+        batch_hash = hashlib.md5()
+        for row_digest in self.row_digests():
+            batch_hash.update(row_digest.encode('ascii'))
+        return batch_hash.hexdigest()
+
+
+class ColumnarBuffer:
+    """
+    カラムナバッチのコンテナ（抽出データ全体の保持用）
+
+    行リストと同様に len() と iter_batches() で扱えるため、既存のロード・シンク処理にそのまま渡せる
+    COPY等のカラムナバッチを直接扱える処理には iter_columnar() で行タプルに戻さずに渡す
+    """
+
+    def __init__(self, column_names, dictionary_columns=None):
+        self.column_names = list(column_names)
+        self.dictionary_columns = dictionary_columns
+        self.batches = []
+        self.row_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    def append_batch(self, rows):
+        """行タプルのバッチをカラムナ形式に変換して追加"""
+        if not rows:
+            return
+        self.batches.append(ColumnarBatch.from_rows(rows, self.column_names, self.dictionary_columns))
+        self.row_count += len(rows)
+
+    def iter_columnar(self, batch_size=None):
+        """
+        カラムナバッチを順に返す
+
+        Args:
+            batch_size (int): 返すバッチサイズ（Noneの場合は格納時のバッチ単位）。格納時のバッチを列ごとに分割・連結する
+        """
+        if batch_size is None:
+            yield from self.batches
+            return
+
+        pending = []
+        pending_count = 0
+        for batch in self.batches:
+            start_idx = 0
+            while start_idx < batch.row_count:
+                take = min(batch_size - pending_count, batch.row_count - start_idx)
+                if start_idx == 0 and take == batch.row_count:
+                    pending.append(batch)
+                else:
+                    pending.append(batch.slice(start_idx, start_idx + take))
+                pending_count += take
+                start_idx += take
+                if pending_count == batch_size:
+                    yield ColumnarBatch.concat(pending)
+                    pending = []
+                    pending_count = 0
+        if pending:
+            yield ColumnarBatch.concat(pending)
+
+    def iter_batches(self, batch_size=None):
+        """
+        行タプルのバッチとして順に返す
+
+        Args:
+            batch_size (int): 返すバッチサイズ（Noneの場合は格納時のバッチ単位）
+        """
+        for batch in self.iter_columnar(batch_size):
+            yield batch.to_rows()
+
+    def __iter__(self):
+        for rows in self.iter_batches():
+            yield from rows
+
+    def close(self):
+        self.batches = []
+
+
+def iter_columnar_batches(rows, batch_size, column_names, dictionary_columns=None):
+    """
+    行バッファをカラムナバッチのストリームとして返す
+
+    Args:
+        rows (list | SpillBuffer | ColumnarBuffer): 行バッファ
+        batch_size (int): バッチサイズ
+        column_names (list): 列名
+        dictionary_columns (iterable): 辞書エンコードする列名
+    """
+    if hasattr(rows, 'iter_columnar'):
+        yield from rows.iter_columnar(batch_size)
+        return
+
+    from sinks import iter_batches
+    for batch in iter_batches(rows, batch_size):
+        yield ColumnarBatch.from_rows(batch, column_names, dictionary_columns)
@@ -6,19 +6,20 @@
 import os
 from typing import Dict, Any
 
-# .envファイルの読み込み（存在する場合）
-try:
-    from dotenv import load_dotenv
-    # プロジェクトルートの.envファイルを探して読み込み
-    env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
-    if os.path.exists(env_path):
-        load_dotenv(env_path)
-        print(f"OK .envファイルを読み込みました: {env_path}")
-    else:
-        print(f"INFO .envファイルが見つかりません: {env_path}")
-except ImportError:
-    print("INFO python-dotenvがインストールされていません。環境変数のみ使用します。")
-    print("  ローカル開発では 'pip install python-dotenv' の実行を推奨します。")
+# .envファイルの読み込み（ローカル実行時のみ。Lambdaでは環境変数のみ使用するため探索しない）
+if 'AWS_LAMBDA_FUNCTION_NAME' not in os.environ:
+    try:
+        from dotenv import load_dotenv
+        # プロジェクトルートの.envファイルを探して読み込み
+        env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+        if os.path.exists(env_path):
+            load_dotenv(env_path)
+            print(f"OK .envファイルを読み込みました: {env_path}")
+        else:
+            print(f"INFO .envファイルが見つかりません: {env_path}")
+    except ImportError:
+        print("INFO python-dotenvがインストールされていません。環境変数のみ使用します。")
+        print("  ローカル開発では 'pip install python-dotenv' の実行を推奨します。")
 
 class ConfigurationError(Exception):
     """設定エラー"""
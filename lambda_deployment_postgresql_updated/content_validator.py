@@ -0,0 +1,339 @@
+"""
+内容検証（チャンク分割ハッシュ比較）
+主キー範囲ごとの集約ハッシュをSQL Server・PostgreSQLの両側で計算して比較し、
+不一致の範囲のみ再帰的に細分化して、差分のある主キーを特定する
+（コストはテーブルサイズではなく差分量に比例する）
+
+整数以外の主キー（文字列・uniqueidentifier 等）は照合順序で並び順が異なるため範囲では分割せず、
+両側で同じ正規化テキストのMD5の先頭4バイト（0〜2^32-1）を範囲分割の値として使用する
+"""
+
+import logging
+from datetime import datetime
+from table_configs import get_table_config
+
+logger = logging.getLogger(__name__)
+
+# 行ハッシュの列区切り（CHAR(31)）とNULL表現
+_SEPARATOR_SQL = "CHAR(31)"
+_SEPARATOR_PG = "chr(31)"
+_NULL_TEXT = "'\\N'"
+
+# SQL Server 側で文字列をUTF-8バイト列としてハッシュするための照合順序（SQL Server 2019以降）
+UTF8_COLLATION = 'Latin1_General_100_BIN2_UTF8'
+
+_SQL_INT_TYPES = ('bigint', 'int', 'smallint', 'tinyint')
+_SQL_DECIMAL_TYPES = ('decimal', 'numeric', 'money', 'smallmoney')
+_SQL_DATETIME_TYPES = ('datetime', 'datetime2', 'smalldatetime')
+_SQL_STRING_TYPES = ('char', 'varchar', 'nchar', 'nvarchar', 'text', 'ntext', 'xml')
+_SQL_BINARY_TYPES = ('binary', 'varbinary', 'image')
+
+# 整数以外の主キーのハッシュ値の範囲（MD5の先頭4バイトを符号なし整数として使用）
+_KEY_HASH_OFFSET = 1 << 31
+_KEY_HASH_BOUNDS = (0, 1 << 32)
+
+
+def sql_server_canonical_expr(column, data_type):
+    """
+    SQL Server側の正規化テキスト式（VARCHAR、UTF-8）を生成
+
+    Args:
+        column (str): SQL Serverカラム名
+        data_type (str): INFORMATION_SCHEMA.COLUMNS.DATA_TYPE
+    """
+    col = f"[{column}]"
+    data_type = data_type.lower()
+
+    if data_type == 'bit':
+        expr = f"CASE WHEN {col} = 1 THEN '1' ELSE '0' END"
+    elif data_type in _SQL_INT_TYPES or data_type in _SQL_DECIMAL_TYPES:
+        expr = f"CONVERT(VARCHAR(60), {col})"
+    elif data_type in _SQL_DATETIME_TYPES:
+        # datetime は1/300秒精度のため、ミリ秒に丸めてからマイクロ秒6桁で出力
+        source = f"CAST({col} AS DATETIME2(3))" if data_type == 'datetime' else f"CAST({col} AS DATETIME2(6))"
+        expr = (f"CONVERT(VARCHAR(19), {source}, 120) + '.' + "
+                f"RIGHT('000000' + CONVERT(VARCHAR(6), DATEPART(MICROSECOND, {source})), 6)")
+    elif data_type == 'date':
+        expr = f"CONVERT(VARCHAR(10), {col}, 23)"
+    elif data_type == 'uniqueidentifier':
+        expr = f"LOWER(CONVERT(VARCHAR(36), {col}))"
+    elif data_type in _SQL_BINARY_TYPES:
+        expr = f"CONVERT(VARCHAR(MAX), CAST({col} AS VARBINARY(MAX)), 2)"
+    elif data_type in _SQL_STRING_TYPES:
+        expr = f"CAST(CAST({col} AS NVARCHAR(MAX)) COLLATE {UTF8_COLLATION} AS VARCHAR(MAX))"
+    else:
+        # float 等は表現が一致しない場合があり、その場合は末端の行比較で判定される
+        expr = f"CONVERT(VARCHAR(MAX), {col})"
+
+    return f"ISNULL({expr}, {_NULL_TEXT})"
+
+
+def postgresql_canonical_expr(column, data_type):
+    """
+    PostgreSQL側の正規化テキスト式を生成（sql_server_canonical_expr と同じテキストになるように揃える）
+
+    Args:
+        column (str): PostgreSQLカラム名
+        data_type (str): information_schema.columns.data_type
+    """
+    col = f'"{column}"'
+    data_type = data_type.lower()
+
+    if data_type == 'boolean':
+        expr = f"CASE WHEN {col} THEN '1' ELSE '0' END"
+    elif data_type.startswith('timestamp'):
+        expr = f"to_char({col}, 'YYYY-MM-DD HH24:MI:SS.US')"
+    elif data_type == 'date':
+        expr = f"to_char({col}, 'YYYY-MM-DD')"
+    elif data_type == 'uuid':
+        expr = f"lower({col}::text)"
+    elif data_type == 'bytea':
+        expr = f"upper(encode({col}, 'hex'))"
+    else:
+        expr = f"{col}::text"
+
+    return f"coalesce({expr}, {_NULL_TEXT})"
+
+
+class ContentValidator:
+    """主キー範囲の集約ハッシュ比較による内容検証クラス"""
+
+    def __init__(self, table_name, sql_cursor, pg_cursor, leaf_size=1000, fanout=16, max_diff_keys=1000):
+        """
+        初期化
+
+        Args:
+            table_name (str): 検証対象テーブル名
+            sql_cursor: SQL Serverカーソル
+            pg_cursor: PostgreSQLカーソル
+            leaf_size (int): この件数以下の範囲は行ハッシュを直接比較
+            fanout (int): 不一致範囲の分割数
+            max_diff_keys (int): 報告する差分キーの上限
+        """
+        self.table_name = table_name
+        self.config = get_table_config(table_name)
+        self.sql_cursor = sql_cursor
+        self.pg_cursor = pg_cursor
+        self.leaf_size = leaf_size
+        self.fanout = fanout
+        self.max_diff_keys = max_diff_keys
+
+        key_index = self.config['columns'].index(self.config['primary_key'])
+        self.sql_key = f"[{self.config['primary_key']}]"
+        self.pg_key = f'"{self.config["pg_columns"][key_index]}"'
+
+        self.sql_row_expr = None
+        self.pg_row_expr = None
+        self.key_type = None
+        # 範囲分割に使う主キーの値の式（整数の主キーはそのまま、それ以外はハッシュ値）と範囲条件の対象の式
+        self.hash_keys = False
+        self.sql_bucket_expr = None
+        self.pg_bucket_expr = None
+        self.sql_range_expr = None
+        self.pg_range_expr = None
+        self.excluded_columns = []
+        self.stats = {'range_queries': 0, 'leaf_ranges': 0, 'leaf_rows': 0}
+        self.mismatched_keys = []
+        self.missing_in_target = []
+        self.extra_in_target = []
+
+    def load_column_types(self):
+        """
+        両側のカラム型を取得して行ハッシュ用の正規化式を構築
+
+        PostgreSQL側が jsonb の列は再シリアライズされたテキストになり SQL Server の元のテキストと
+        一致しないため、行ハッシュから除外する（excluded_columns に報告）
+        """
+        # [McTM].[dbo].[Customer] → McTM, dbo, Customer
+        database, schema, table = [part.strip('[]') for part in self.config['sql_table'].split('.')]
+        self.sql_cursor.execute(
+            f"SELECT COLUMN_NAME, DATA_TYPE FROM [{database}].INFORMATION_SCHEMA.COLUMNS "
+            f"WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s",
+            (schema, table)
+        )
+        sql_types = {name: data_type for name, data_type in self.sql_cursor.fetchall()}
+
+        self.pg_cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s",
+            (self.config['pg_table'],)
+        )
+        pg_types = {name: data_type for name, data_type in self.pg_cursor.fetchall()}
+
+        self.key_type = sql_types.get(self.config['primary_key'], '').lower()
+        self.hash_keys = self.key_type not in _SQL_INT_TYPES
+        if self.hash_keys:
+            pg_key_column = self.pg_key.strip('"')
+            # 列がない場合は以下の列ごとの確認でエラーにする
+            key_text_sql = sql_server_canonical_expr(self.config['primary_key'], self.key_type)
+            key_text_pg = postgresql_canonical_expr(pg_key_column, pg_types.get(pg_key_column, ''))
+            self.sql_bucket_expr = (f"(CAST(CAST(SUBSTRING(HASHBYTES('MD5', {key_text_sql}), 1, 4) AS INT) AS BIGINT) "
+                                    f"+ {_KEY_HASH_OFFSET})")
+            self.pg_bucket_expr = f"(('x' || substr(md5({key_text_pg}), 1, 8))::bit(32)::int::bigint + {_KEY_HASH_OFFSET})"
+            self.sql_range_expr = self.sql_bucket_expr
+            self.pg_range_expr = self.pg_bucket_expr
+        else:
+            # 範囲条件は主キー列に直接指定（インデックスを使用）
+            self.sql_bucket_expr = f"CAST({self.sql_key} AS BIGINT)"
+            self.pg_bucket_expr = f"{self.pg_key}::bigint"
+            self.sql_range_expr = self.sql_key
+            self.pg_range_expr = self.pg_key
+        sql_exprs = []
+        pg_exprs = []
+        for col, pg_col in zip(self.config['columns'], self.config['pg_columns']):
+            if col not in sql_types or pg_col not in pg_types:
+                raise RuntimeError(f"カラム型を取得できません: {col} / {pg_col}")
+            if pg_types[pg_col].lower() == 'jsonb':
+                self.excluded_columns.append(col)
+                continue
+            sql_exprs.append(sql_server_canonical_expr(col, sql_types[col]))
+            pg_exprs.append(postgresql_canonical_expr(pg_col, pg_types[pg_col]))
+
+        if len(sql_exprs) == 1:
+            self.sql_row_expr = sql_exprs[0]
+        else:
+            self.sql_row_expr = f"CONCAT({f', {_SEPARATOR_SQL}, '.join(sql_exprs)})"
+        self.pg_row_expr = f" || {_SEPARATOR_PG} || ".join(pg_exprs)
+
+    def get_key_bounds(self):
+        """両側の主キーの最小値・最大値を取得"""
+        self.sql_cursor.execute(f"SELECT MIN({self.sql_key}), MAX({self.sql_key}) FROM {self.config['sql_table']} WITH (NOLOCK)")
+        sql_min, sql_max = self.sql_cursor.fetchone()
+        self.pg_cursor.execute(f"SELECT MIN({self.pg_key}), MAX({self.pg_key}) FROM {self.config['pg_table']}")
+        pg_min, pg_max = self.pg_cursor.fetchone()
+
+        bounds = [value for value in (sql_min, sql_max, pg_min, pg_max) if value is not None]
+        if not bounds:
+            return None
+        for value in bounds:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"内容検証は整数の主キーのみ対応しています: {self.config['primary_key']} ({type(value).__name__})")
+        return min(bounds), max(bounds) + 1
+
+    def summarize_buckets(self, lo, hi, width):
+        """
+        範囲 [lo, hi) を幅 width のバケットに分割し、両側のバケットごとの件数・集約ハッシュを取得
+
+        Returns:
+            tuple: (SQL Server側 {bucket: (count, hash_sum)}, PostgreSQL側 {bucket: (count, hash_sum)})
+        """
+        self.stats['range_queries'] += 1
+
+        self.sql_cursor.execute(
+            f"SELECT ({self.sql_bucket_expr} - {lo}) / {width} AS bucket, COUNT_BIG(*), "
+            f"SUM(CAST(CAST(SUBSTRING(HASHBYTES('MD5', {self.sql_row_expr}), 1, 4) AS INT) AS BIGINT)) "
+            f"FROM {self.config['sql_table']} WITH (NOLOCK) "
+            f"WHERE {self.sql_range_expr} >= {lo} AND {self.sql_range_expr} < {hi} "
+            f"GROUP BY ({self.sql_bucket_expr} - {lo}) / {width}"
+        )
+        source = {bucket: (count, int(hash_sum)) for bucket, count, hash_sum in self.sql_cursor.fetchall()}
+
+        self.pg_cursor.execute(
+            f"SELECT ({self.pg_bucket_expr} - {lo}) / {width} AS bucket, count(*), "
+            f"sum(('x' || substr(md5({self.pg_row_expr}), 1, 8))::bit(32)::int) "
+            f"FROM {self.config['pg_table']} "
+            f"WHERE {self.pg_range_expr} >= {lo} AND {self.pg_range_expr} < {hi} "
+            f"GROUP BY 1"
+        )
+        target = {bucket: (count, int(hash_sum)) for bucket, count, hash_sum in self.pg_cursor.fetchall()}
+
+        return source, target
+
+    def compare_leaf(self, lo, hi):
+        """範囲 [lo, hi) の行ハッシュを直接比較して差分キーを特定"""
+        self.stats['leaf_ranges'] += 1
+
+        self.sql_cursor.execute(
+            f"SELECT {self.sql_key}, CONVERT(VARCHAR(32), HASHBYTES('MD5', {self.sql_row_expr}), 2) "
+            f"FROM {self.config['sql_table']} WITH (NOLOCK) "
+            f"WHERE {self.sql_range_expr} >= {lo} AND {self.sql_range_expr} < {hi}"
+        )
+        source = dict(self.sql_cursor.fetchall())
+
+        self.pg_cursor.execute(
+            f"SELECT {self.pg_key}, upper(md5({self.pg_row_expr})) "
+            f"FROM {self.config['pg_table']} "
+            f"WHERE {self.pg_range_expr} >= {lo} AND {self.pg_range_expr} < {hi}"
+        )
+        target = dict(self.pg_cursor.fetchall())
+
+        self.stats['leaf_rows'] += len(source) + len(target)
+
+        for key in sorted(source.keys() | target.keys()):
+            if key not in target:
+                self.missing_in_target.append(key)
+            elif key not in source:
+                self.extra_in_target.append(key)
+            elif source[key] != target[key]:
+                self.mismatched_keys.append(key)
+
+    def compare_range(self, lo, hi):
+        """範囲 [lo, hi) を分割して比較し、不一致のバケットのみ再帰"""
+        width = max(1, -(-(hi - lo) // self.fanout))
+        source, target = self.summarize_buckets(lo, hi, width)
+
+        for bucket in sorted(source.keys() | target.keys()):
+            if source.get(bucket) == target.get(bucket):
+                continue
+            if self.diff_count() >= self.max_diff_keys:
+                return
+
+            bucket_lo = lo + bucket * width
+            bucket_hi = min(bucket_lo + width, hi)
+            row_count = max(source.get(bucket, (0, 0))[0], target.get(bucket, (0, 0))[0])
+
+            if row_count <= self.leaf_size or width == 1:
+                self.compare_leaf(bucket_lo, bucket_hi)
+            else:
+                self.compare_range(bucket_lo, bucket_hi)
+
+    def diff_count(self):
+        return len(self.mismatched_keys) + len(self.missing_in_target) + len(self.extra_in_target)
+
+    def validate(self):
+        """
+        内容検証を実行
+
+        Note:
+            SQL Server側は抽出後も更新され得るため、抽出以降に更新された行も差分として報告される
+
+        Returns:
+            dict: 検証結果
+        """
+        start_time = datetime.now()
+        logger.info(f"内容検証開始: {self.table_name} (分割数: {self.fanout}, 末端件数: {self.leaf_size})")
+
+        self.load_column_types()
+        if self.excluded_columns:
+            logger.info(f"内容検証の対象外列（jsonb）: {self.excluded_columns}")
+        if self.hash_keys:
+            # 整数以外の主キーはハッシュ値の全範囲を分割（最小値・最大値の取得は不要）
+            logger.info(f"主キーのハッシュ値で範囲分割: {self.config['primary_key']} ({self.key_type})")
+            bounds = _KEY_HASH_BOUNDS
+        else:
+            bounds = self.get_key_bounds()
+        if bounds is not None:
+            self.compare_range(*bounds)
+
+        execution_time = (datetime.now() - start_time).total_seconds()
+        matched = self.diff_count() == 0
+
+        result = {
+            'matched': matched,
+            'mismatched_keys': self.mismatched_keys[:self.max_diff_keys],
+            'missing_in_target': self.missing_in_target[:self.max_diff_keys],
+            'extra_in_target': self.extra_in_target[:self.max_diff_keys],
+            'diff_count': self.diff_count(),
+            'truncated': self.diff_count() >= self.max_diff_keys,
+            'excluded_columns': self.excluded_columns,
+            'hash_keys': self.hash_keys,
+            'execution_time': execution_time,
+            **self.stats
+        }
+
+        if matched:
+            logger.info(f"内容検証成功: 差分なし ({execution_time:.2f}秒, 範囲クエリ {self.stats['range_queries']}回)")
+        else:
+            logger.error(f"内容検証失敗: 差分 {self.diff_count()}件 "
+                         f"(不一致 {len(self.mismatched_keys)}, 欠落 {len(self.missing_in_target)}, "
+                         f"余剰 {len(self.extra_in_target)}) ({execution_time:.2f}秒)")
+        return result
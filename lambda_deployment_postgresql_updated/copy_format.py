@@ -0,0 +1,144 @@
+"""
+PostgreSQL COPY テキスト形式エンコーダー
+行データを COPY ... FROM STDIN (FORMAT text) 用の文字列に変換する
+"""
+
+import json
+from datetime import datetime, date, time
+from decimal import Decimal
+
+# COPY テキスト形式のNULL表現
+COPY_NULL = '\\N'
+
+# COPY テキスト形式でエスケープが必要な文字
+_COPY_ESCAPE_TABLE = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def escape_copy_text(value):
+    """文字列値をCOPYテキスト形式用にエスケープ"""
+    return value.translate(_COPY_ESCAPE_TABLE)
+
+
+def format_copy_value(value):
+    """
+    単一値をCOPYテキスト形式の文字列に変換
+
+    Args:
+        value: pymssqlから取得した値
+
+    Returns:
+        str: COPYテキスト形式の文字列（NULLは \\N）
+    """
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, str):
+        return escape_copy_text(value)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea の16進表現（バックスラッシュ自体もエスケープが必要）
+        return '\\\\x' + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        return escape_copy_text(json.dumps(value, ensure_ascii=False))
+    return escape_copy_text(str(value))
+
+
+def encode_copy_row(row):
+    """1行分のデータをCOPYテキスト形式の1行（改行付き）に変換"""
+    return '\t'.join([format_copy_value(value) for value in row]) + '\n'
+
+
+def encode_copy_rows(rows):
+    """
+    複数行のデータをCOPYテキスト形式の文字列に変換
+
+    Args:
+        rows (iterable): 行タプルのイテラブル
+
+    Returns:
+        str: COPYテキスト形式の文字列
+    """
+    return ''.join([encode_copy_row(row) for row in rows])
+
+
+class CopyStream:
+    """
+    行バッチのストリームを copy_expert 用のファイルオブジェクトとして読み出すアダプタ
+
+    read() の要求に応じて次のバッチをCOPYテキスト形式にエンコードし、再利用する1つの bytearray に追記する。
+    読み出し済みの領域は次のエンコード前に詰めるため、保持するのは未送信の1バッチ分のみ
+    """
+
+    def __init__(self, batches, encode_batch=encode_copy_rows):
+        """
+        初期化
+
+        Args:
+            batches (iterable): 行タプルのリストのストリーム（例: fetchmany のジェネレータ）
+            encode_batch (callable): 行タプルのリスト → COPYテキスト形式の文字列
+        """
+        self.batches = iter(batches)
+        self.encode_batch = encode_batch
+        self.buffer = bytearray()
+        self.position = 0
+        self.exhausted = False
+        self.row_count = 0
+        self.byte_count = 0
+
+    def _fill(self, size=-1, until_newline=False):
+        """未読データが size バイト（または改行）に達するまで次のバッチをエンコード"""
+        while not self.exhausted:
+            available = len(self.buffer) - self.position
+            if until_newline:
+                if self.buffer.find(b'\n', self.position) >= 0:
+                    return
+            elif size >= 0 and available >= size:
+                return
+
+            rows = next(self.batches, None)
+            if rows is None:
+                self.exhausted = True
+                return
+
+            if self.position:
+                del self.buffer[:self.position]
+                self.position = 0
+            data = self.encode_batch(rows).encode('utf-8')
+            self.buffer += data
+            self.row_count += len(rows)
+            self.byte_count += len(data)
+
+    def _take(self, end):
+        data = bytes(self.buffer[self.position:end])
+        self.position = end
+        return data
+
+    def read(self, size=-1):
+        """最大 size バイトを読み出す（データの終わりでは空のbytes）"""
+        if size is None:
+            size = -1
+        self._fill(size)
+        end = len(self.buffer) if size < 0 else min(len(self.buffer), self.position + size)
+        return self._take(end)
+
+    def readline(self, size=-1):
+        """1行（改行付き）を読み出す"""
+        if size is None:
+            size = -1
+        self._fill(until_newline=True)
+        newline_idx = self.buffer.find(b'\n', self.position)
+        end = len(self.buffer) if newline_idx < 0 else newline_idx + 1
+        if size >= 0:
+            end = min(end, self.position + size)
+        return self._take(end)
@@ -0,0 +1,290 @@
+"""
+データベース接続の生成と並行オープン
+SQL Server（McTM / VoipDB）と PostgreSQL への接続をソース単位で1本ずつ並行して開き、
+遅いホストがあっても他の接続を待たせない
+"""
+
+import logging
+import pymssql
+import psycopg2
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import DatabaseConfig, ConfigurationError
+from table_configs import get_table_config
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL接続のソース名（SQL Serverは db_type: 'mctm' / 'voipdb'）
+POSTGRESQL_SOURCE = 'postgresql'
+
+# テーブルロック用アドバイザリロックの名前空間（2引数形式の第1引数、他用途のロックと区別）
+ADVISORY_LOCK_NAMESPACE = 20250101
+
+# Lambda初期化フェーズで事前に開いた接続（ソース名 → (接続, 接続先DB, 接続時刻)）。最初に使う処理が1度だけ引き取る
+_preopened_connections = {}
+
+
+def create_sql_server_connection(sql_config):
+    """接続設定からSQL Server接続を生成"""
+    return pymssql.connect(
+        server=sql_config['host'],
+        user=sql_config['user'],
+        password=sql_config['password'],
+        database=sql_config['database'],
+        port=sql_config['port'],
+        timeout=sql_config['timeout'],
+        login_timeout=sql_config['login_timeout'],
+        charset=sql_config['charset']
+    )
+
+
+def create_postgresql_connection(pg_config):
+    """接続設定からPostgreSQL接続を生成"""
+    return psycopg2.connect(
+        host=pg_config['host'],
+        dbname=pg_config['database'],
+        user=pg_config['user'],
+        password=pg_config['password'],
+        port=pg_config['port'],
+        connect_timeout=pg_config['connect_timeout']
+    )
+
+
+def get_sources(table_names):
+    """
+    テーブル群が必要とする接続ソースを取得
+
+    Returns:
+        dict: ソース名 → 接続先データベース名（PostgreSQLはNone）
+    """
+    sources = {}
+    for table_name in table_names:
+        config = get_table_config(table_name)
+        sources.setdefault(config['db_type'], config['sql_server_db'])
+    sources[POSTGRESQL_SOURCE] = None
+    return sources
+
+
+def open_source_connection(source, database=None):
+    """
+    ソース名に対応する接続を開く（事前に開いた接続があれば使用）
+
+    Args:
+        source (str): 'mctm' / 'voipdb' / 'postgresql'
+        database (str): SQL Serverの接続先データベース名（テーブル設定の sql_server_db）
+    """
+    conn = take_preopened_connection(source, database)
+    if conn is not None:
+        return conn
+
+    try:
+        if source == POSTGRESQL_SOURCE:
+            return create_postgresql_connection(DatabaseConfig.get_postgresql_config())
+
+        sql_config = DatabaseConfig.get_sql_server_config(source)
+        if database:
+            sql_config['database'] = database
+        return create_sql_server_connection(sql_config)
+
+    except ConfigurationError as e:
+        raise RuntimeError(f"{source} 設定エラー: {str(e)}")
+
+
+def open_connections(sources):
+    """
+    複数ソースへの接続を並行して開く
+
+    Args:
+        sources (dict): ソース名 → 接続先データベース名（get_sources の戻り値）
+
+    Returns:
+        tuple: (接続辞書, エラー辞書, 接続時間辞書) いずれもソース名がキー
+    """
+    connections = {}
+    errors = {}
+    connect_times = {}
+    if not sources:
+        return connections, errors, connect_times
+
+    def connect(source):
+        start_time = datetime.now()
+        try:
+            return source, open_source_connection(source, sources[source]), None, start_time
+        except Exception as e:
+            return source, None, e, start_time
+
+    logger.info(f"接続並行オープン開始: {list(sources)}")
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='connect') as executor:
+        for source, conn, error, start_time in executor.map(connect, list(sources)):
+            connect_times[source] = (datetime.now() - start_time).total_seconds()
+            if error is None:
+                connections[source] = conn
+                logger.info(f"{source} 接続成功 ({connect_times[source]:.2f}秒)")
+            else:
+                errors[source] = str(error)
+                logger.error(f"{source} 接続失敗 ({connect_times[source]:.2f}秒): {str(error)}")
+
+    return connections, errors, connect_times
+
+
+def preopen_connections(sources):
+    """
+    接続を並行して開き、最初に使う処理のために保持（Lambda初期化フェーズ用）
+
+    Args:
+        sources (dict): ソース名 → 接続先データベース名（get_sources の戻り値）
+
+    Returns:
+        tuple: (接続辞書, エラー辞書, 接続時間辞書)
+    """
+    connections, errors, connect_times = open_connections(sources)
+    opened_at = datetime.now()
+    for source, conn in connections.items():
+        _preopened_connections[source] = (conn, sources[source], opened_at)
+    return connections, errors, connect_times
+
+
+def is_connection_alive(source, conn):
+    """接続が使用可能か（SELECT 1 で確認）"""
+    try:
+        if source == POSTGRESQL_SOURCE:
+            if conn.closed:
+                return False
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        else:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def take_preopened_connection(source, database=None):
+    """
+    事前に開いた接続を引き取る
+
+    接続先DBが異なる場合、保持期間（環境変数 PREOPEN_MAX_IDLE_SECONDS、既定300秒）を超えた場合、
+    または SELECT 1 に失敗した場合はクローズしてNoneを返す（呼び出し元で新たに接続する）
+
+    Returns:
+        接続（使用可能な事前接続がない場合はNone）
+    """
+    entry = _preopened_connections.pop(source, None)
+    if entry is None:
+        return None
+
+    conn, preopened_database, opened_at = entry
+    idle_seconds = (datetime.now() - opened_at).total_seconds()
+    max_idle_seconds = DatabaseConfig.get_optional_env('PREOPEN_MAX_IDLE_SECONDS', 300)
+    if (database is None or database == preopened_database) and idle_seconds <= max_idle_seconds \
+            and is_connection_alive(source, conn):
+        logger.info(f"{source} 事前接続を使用 (接続から{idle_seconds:.1f}秒)")
+        return conn
+
+    logger.warning(f"{source} 事前接続を破棄して再接続 (接続から{idle_seconds:.1f}秒)")
+    try:
+        conn.close()
+    except Exception:
+        pass
+    return None
+
+
+def estimate_sql_server_row_counts(conn, sql_tables):
+    """
+    SQL Serverのメタデータから件数を取得（テーブルスキャンなし）
+
+    Args:
+        conn: SQL Server接続
+        sql_tables (list): '[McTM].[dbo].[Customer]' 形式のテーブル名
+
+    Returns:
+        dict: テーブル名 → 件数（テーブルが存在しない場合はNone）
+    """
+    values = ", ".join(["(%s)"] * len(sql_tables))
+    query = (
+        "SELECT v.name, OBJECT_ID(v.name), "
+        "(SELECT SUM(p.{rows}) FROM {view} p WHERE p.object_id = OBJECT_ID(v.name) AND p.index_id IN (0, 1)) "
+        f"FROM (VALUES {values}) AS v(name)"
+    )
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute(query.format(rows='row_count', view='sys.dm_db_partition_stats'), tuple(sql_tables))
+        except pymssql.Error as e:
+            # sys.dm_db_partition_stats は VIEW DATABASE STATE 権限が必要なため、参照できない場合は sys.partitions を使用
+            logger.warning(f"sys.dm_db_partition_stats 参照失敗のため sys.partitions を使用: {str(e)}")
+            cursor.execute(query.format(rows='rows', view='sys.partitions'), tuple(sql_tables))
+        
+        return {
+            name: (int(row_count or 0) if object_id is not None else None)
+            for name, object_id, row_count in cursor.fetchall()
+        }
+    finally:
+        cursor.close()
+
+
+def estimate_postgresql_row_counts(conn, pg_tables):
+    """
+    PostgreSQLの pg_class.reltuples から件数を取得（テーブルスキャンなし）
+
+    Returns:
+        dict: テーブル名 → 推定件数（テーブルが存在しない場合はNone、未ANALYZEの場合は-1）
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT v.name, c.oid IS NOT NULL, c.reltuples::bigint "
+            "FROM unnest(%s::text[]) AS v(name) LEFT JOIN pg_class c ON c.oid = to_regclass(v.name)",
+            (list(pg_tables),)
+        )
+        result = {name: (int(reltuples) if exists else None) for name, exists, reltuples in cursor.fetchall()}
+        conn.rollback()
+        return result
+    finally:
+        cursor.close()
+
+
+def acquire_table_lock(cursor, pg_table, wait_seconds=0):
+    """
+    pg_table 単位のトランザクションレベルのアドバイザリロックを取得
+    （コミット/ロールバックで自動解放されるため、共有接続でもロックが残らない）
+
+    Args:
+        cursor: PostgreSQLカーソル（ロックはこのカーソルの接続の現在のトランザクションに属する）
+        pg_table (str): PostgreSQLテーブル名
+        wait_seconds (float): 待機秒数（0の場合は待機せず即座に判定）
+
+    Returns:
+        bool: 取得できた場合True（False の場合、待機モードではトランザクションが中断されているため呼び出し元でロールバックすること）
+    """
+    if not wait_seconds:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))", (ADVISORY_LOCK_NAMESPACE, pg_table))
+        return cursor.fetchone()[0]
+
+    # 待機上限は lock_timeout で指定し、取得後はセッションの既定値に戻す
+    cursor.execute("SELECT set_config('lock_timeout', %s, true)", (f"{int(wait_seconds * 1000)}ms",))
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", (ADVISORY_LOCK_NAMESPACE, pg_table))
+    except psycopg2.Error as e:
+        # 55P03: lock_not_available
+        if e.pgcode == '55P03':
+            return False
+        raise
+    cursor.execute("SET LOCAL lock_timeout TO DEFAULT")
+    return True
+
+
+def close_connections(connections):
+    """接続辞書の接続をすべてクローズ"""
+    for source, conn in connections.items():
+        try:
+            conn.close()
+            logger.info(f"{source} 接続クローズ")
+        except Exception:
+            pass
@@ -0,0 +1,120 @@
+"""
+インポート時間の計測（コールドスタートの監視用）
+モジュール群のインポート時間を区間ごとに記録し、info モードのレスポンスで報告する
+環境変数 IMPORT_PROFILE=true の場合は python -X importtime と同様にモジュール単位の時間も計測する
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# このモジュールの読み込み時刻（lambda_function の先頭でインポートし、初期化開始時刻とする）
+INIT_START = time.perf_counter()
+
+# 区間ごとのインポート時間: [(区間名, 秒, 追加されたモジュール数)]
+_import_timings = []
+# モジュール単位の計測結果: {モジュール名: [累積秒, 自身のみの秒]}
+_module_timings = {}
+_init_seconds = None
+
+
+@contextmanager
+def timed_import(label):
+    """with ブロック内のインポート時間を区間として記録（新たにモジュールを読み込んだ場合のみ）"""
+    start_time = time.perf_counter()
+    module_count = len(sys.modules)
+    try:
+        yield
+    finally:
+        new_modules = len(sys.modules) - module_count
+        if new_modules > 0:
+            _import_timings.append((label, time.perf_counter() - start_time, new_modules))
+
+
+def mark_init_complete():
+    """モジュール初期化（インポート）の完了時刻を記録"""
+    global _init_seconds
+    if _init_seconds is None:
+        _init_seconds = time.perf_counter() - INIT_START
+
+
+class _TimedLoader:
+    """ローダーの exec_module の時間を計測するラッパー"""
+
+    _stack = []
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        start_time = time.perf_counter()
+        _TimedLoader._stack.append(0.0)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            children = _TimedLoader._stack.pop()
+            if _TimedLoader._stack:
+                _TimedLoader._stack[-1] += elapsed
+            _module_timings[module.__name__] = [elapsed, elapsed - children]
+
+
+class _TimedFinder:
+    """他のファインダーで見つけたモジュールのローダーを計測用ラッパーに差し替えるファインダー"""
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def enable_module_profiling():
+    """モジュール単位の計測を有効化（IMPORT_PROFILE=true の場合）"""
+    if os.environ.get('IMPORT_PROFILE', '').lower() not in ('true', '1', 'yes', 'on'):
+        return False
+    if not any(isinstance(finder, _TimedFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _TimedFinder())
+    return True
+
+
+def get_import_report(top=15):
+    """
+    インポート時間のレポート
+
+    Returns:
+        dict: init_seconds（モジュール初期化時間）, imports（区間ごとの時間）, module_count,
+              heavy_modules（読み込み済みの重いモジュール）, top_modules（モジュール単位の計測時のみ）
+    """
+    report = {
+        'init_seconds': round(_init_seconds, 4) if _init_seconds is not None else None,
+        'imports': [
+            {'name': label, 'seconds': round(seconds, 4), 'new_modules': new_modules}
+            for label, seconds, new_modules in _import_timings
+        ],
+        'module_count': len(sys.modules),
+        'heavy_modules': [
+            name for name in ('pymssql', 'psycopg2', 'psycopg2.extras', 'numpy', 'pyarrow', 'dotenv')
+            if name in sys.modules
+        ]
+    }
+    if _module_timings:
+        # -X importtime と同様に自身のみの時間（self）と累積時間（cumulative）を報告
+        ranked = sorted(_module_timings.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        report['top_modules'] = [
+            {'name': name, 'self_seconds': round(self_time, 4), 'cumulative_seconds': round(cumulative, 4)}
+            for name, (cumulative, self_time) in ranked
+        ]
+    return report
@@ -7,16 +7,58 @@ import os
 import json
 import logging
 from datetime import datetime
-from multi_table_manager import MultiTableSyncManager
-from table_configs import get_available_tables, DEFAULT_SYNC_ORDER
+from import_profile import enable_module_profiling, timed_import, mark_init_complete, get_import_report
+
+# IMPORT_PROFILE=true の場合はモジュール単位のインポート時間を計測（以降のインポートが対象）
+enable_module_profiling()
+
+# 重いモジュール（pymssql / psycopg2 / 同期処理）はモードごとに必要になった時点でインポート
+with timed_import('table_configs'):
+    from table_configs import get_available_tables, DEFAULT_SYNC_ORDER
+from config import DatabaseConfig
+from tracing import Tracer, set_tracer, export_trace
 
 # AWS Lambda用ログ設定
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# イベントから各テーブル同期処理へ引き渡すオプションキー
+SYNC_OPTION_KEYS = (
+    'sinks',            # 追加シンク指定 例: ["parquet", {"type": "sqlite", "path": "/tmp/replica/{table}.sqlite3"}]
+    'spool',            # 抽出データを /tmp にスプールしリトライ時に再利用 (true/false)
+    'run_id',           # 実行ID（未指定時はLambdaのリクエストID）
+    'spill',            # 抽出データを /tmp のスピルファイルへ退避 (true / 件数閾値)
+    'columnar',         # 抽出データをカラムナ形式で保持 (true/false)
+    'load_method',      # PostgreSQLロード方式 ('insert' / 'copy' / 'stream')
+    'validation',       # 転送検証方式 ('count' / 'content' / 'sample')
+    'sample_modulus',   # サンプリング検証の間隔N（約 1/N の行を比較、既定1000）
+    'deep_validate',    # 件数検証を SELECT COUNT(*) の全件スキャンで行う (true/false)
+    'analyze',          # コミット後にANALYZEし pg_class.reltuples で件数を簡易チェック (true/false)
+    'deep_test',        # multi_test をテーブルごとの SELECT COUNT(*) で順次実行 (true/false)
+    'max_workers',      # multi_sync の並行ワーカー数（実行履歴の所要時間でLPT割り当て、既定1）
+    'force',            # multi_sync で min_interval に関わらず全対象テーブルを同期 (true/false)
+    'chunk_rows',       # queue_plan のチャンク行数（既定100000）
+    'lock_wait',        # 同じテーブルを同期中の実行がある場合の待機秒数（既定0: 待機せずスキップ）
+    'adaptive_batch',   # 取得・ロードのバッチサイズを計測した処理時間と行サイズから調整 (true/false)
+    'transform_workers',  # COPYロードのエンコードを子プロセスで並列実行 (true: vCPU数 / ワーカー数)
+    'schema_check',     # 列定義のハッシュを前回実行時と比較し、同期対象列がなければ転送前に中止 (true/false)
+    'schema_migrate',   # schema_check に加え、PostgreSQLにない同期対象列を追加 (true/false)
+    'trace',            # 実行→テーブル→フェーズ→バッチのスパンを記録し /tmp にトレースを出力 (true/false)
+    'slow_batch',       # 遅いバッチを検出し、DBの実行中セッション・ロック・待機の状態を結果に記録 (true/false)
+)
+
+def get_sync_options(event, context=None):
+    """イベントから同期オプションを抽出"""
+    options = {key: event[key] for key in SYNC_OPTION_KEYS if key in event}
+    
+    # 非同期呼び出しのリトライは同じリクエストIDで再実行されるため、スプールのキーに利用
+    if 'run_id' not in options and context is not None:
+        options['run_id'] = getattr(context, 'aws_request_id', None)
+    
+    return options
 
-def execute_multi_table_sync(target_tables=None):
-    """複数テーブルの同期処理実行（順次実行）"""
+def execute_multi_table_sync(target_tables=None, options=None):
+    """複数テーブルの同期処理実行（max_workers 指定時は並行実行）"""
     logger.info("=== マルチテーブル同期処理開始 ===")
     
     try:
@@ -25,11 +67,13 @@ def execute_multi_table_sync(target_tables=None):
             target_tables = DEFAULT_SYNC_ORDER
         
         logger.info(f"対象テーブル: {target_tables}")
-        logger.info(f"実行モード: 順次実行")
         
         # マネージャー作成
+        with timed_import('multi_table_manager'):
+            from multi_table_manager import MultiTableSyncManager
         manager = MultiTableSyncManager(
-            target_tables=target_tables
+            target_tables=target_tables,
+            options=options
         )
         
         # 同期実行
@@ -47,8 +91,8 @@ def execute_multi_table_sync(target_tables=None):
             'total_transferred': 0
         }
 
-def execute_multi_table_test(target_tables=None):
-    """複数テーブルの接続テスト実行（順次実行）"""
+def execute_multi_table_test(target_tables=None, options=None):
+    """複数テーブルの接続テスト実行（メタデータ件数による並行テスト）"""
     logger.info("=== マルチテーブル接続テスト開始 ===")
     
     try:
@@ -57,11 +101,14 @@ def execute_multi_table_test(target_tables=None):
             target_tables = DEFAULT_SYNC_ORDER
         
         logger.info(f"対象テーブル: {target_tables}")
-        logger.info(f"実行モード: 順次実行")
+        logger.info(f"実行モード: {'順次実行' if (options or {}).get('deep_test') else 'メタデータ並行テスト'}")
         
         # マネージャー作成
+        with timed_import('multi_table_manager'):
+            from multi_table_manager import MultiTableSyncManager
         manager = MultiTableSyncManager(
-            target_tables=target_tables
+            target_tables=target_tables,
+            options=options
         )
         
         # テスト実行
@@ -78,17 +125,18 @@ def execute_multi_table_test(target_tables=None):
             'mode': 'multi_test'
         }
 
-def execute_single_table_sync(table_name):
+def execute_single_table_sync(table_name, options=None):
     """単一テーブルの同期処理実行"""
     logger.info(f"=== 単一テーブル同期処理開始: {table_name} ===")
     
     try:
-        from table_sync_processor import TableSyncProcessor
+        with timed_import('table_sync_processor'):
+            from table_sync_processor import TableSyncProcessor
         
-        processor = TableSyncProcessor(table_name)
+        processor = TableSyncProcessor(table_name, options=options)
         result = processor.sync_table()
         
-        return {
+        response = {
             'success': result['success'],
             'table_name': table_name,
             'transferred_count': result['transferred_count'],
@@ -97,6 +145,12 @@ def execute_single_table_sync(table_name):
             'error': result.get('error'),
             'mode': 'single_sync'
         }
+        if 'sink_results' in result:
+            response['sink_results'] = result['sink_results']
+        if result.get('skipped_locked'):
+            response['skipped_locked'] = True
+        
+        return response
         
     except Exception as e:
         logger.error(f"単一テーブル同期エラー ({table_name}): {str(e)}")
@@ -108,6 +162,43 @@ def execute_single_table_sync(table_name):
             'mode': 'single_sync'
         }
 
+def execute_queue_mode(mode, target_tables=None, options=None, context=None):
+    """
+    分散ワークキューモードの実行
+    
+    queue_plan     : 対象テーブルをチャンク分割してキューに登録
+    queue_work     : キューのチャンクを残り時間の範囲で処理（キューが空になれば完了分をファイナライズ）
+    queue_finalize : 全チャンク完了したテーブルを検証して本テーブルへ反映
+    """
+    with timed_import('work_queue'):
+        from work_queue import plan_run, finalize_runs, QueueWorker, DEFAULT_CHUNK_ROWS
+    options = options or {}
+    
+    try:
+        if mode == 'queue_plan':
+            run_id = options.get('run_id') or datetime.now().strftime('%Y%m%d%H%M%S')
+            result = plan_run(
+                run_id,
+                target_tables or DEFAULT_SYNC_ORDER,
+                int(options.get('chunk_rows') or DEFAULT_CHUNK_ROWS)
+            )
+        elif mode == 'queue_work':
+            remaining_time_fn = context.get_remaining_time_in_millis if context is not None else None
+            result = QueueWorker(options=options, remaining_time_fn=remaining_time_fn).run()
+        else:
+            result = finalize_runs()
+        
+        result['mode'] = mode
+        return result
+        
+    except Exception as e:
+        logger.error(f"ワークキューエラー ({mode}): {str(e)}")
+        return {
+            'success': False,
+            'error': str(e),
+            'mode': mode
+        }
+
 def get_table_info():
     """利用可能なテーブル情報を取得"""
     try:
@@ -133,6 +224,9 @@ def get_table_info():
             'available_tables': available_tables,
             'default_sync_order': DEFAULT_SYNC_ORDER,
             'table_details': table_info,
+            # コールドスタート監視用のインポート時間
+            'import_profile': get_import_report(),
+            'preinit': PREINIT_RESULT,
             'mode': 'info'
         }
         
@@ -160,15 +254,19 @@ def lambda_handler(event, context):
         target_tables = event.get('tables')  # 対象テーブル指定
 
         table_name = event.get('table_name')  # 単一テーブル名
+        options = get_sync_options(event, context)  # 同期オプション
+        
+        # trace オプション有効時のみスパンを記録（前回の呼び出しのトレーサーは破棄）
+        set_tracer(Tracer(f"run:{mode}", run_id=options.get('run_id')) if options.get('trace') else None)
         
         # モード別処理
         if mode == 'multi_sync':
             # 複数テーブル同期
-            result = execute_multi_table_sync(target_tables)
+            result = execute_multi_table_sync(target_tables, options)
             
         elif mode == 'multi_test':
             # 複数テーブル接続テスト
-            result = execute_multi_table_test(target_tables)
+            result = execute_multi_table_test(target_tables, options)
             
         elif mode == 'single_sync':
             # 単一テーブル同期
@@ -182,7 +280,11 @@ def lambda_handler(event, context):
                         'timestamp': datetime.now().isoformat()
                     }, ensure_ascii=False)
                 }
-            result = execute_single_table_sync(table_name)
+            result = execute_single_table_sync(table_name, options)
+            
+        elif mode in ['queue_plan', 'queue_work', 'queue_finalize']:
+            # 分散ワークキュー
+            result = execute_queue_mode(mode, target_tables, options, context)
             
         elif mode == 'info':
             # テーブル情報取得
@@ -196,7 +298,8 @@ def lambda_handler(event, context):
                     'success': False,
                     'error': f'不正なモード: {mode}',
                     'valid_modes': [
-                        'multi_sync', 'multi_test', 'single_sync', 'info'
+                        'multi_sync', 'multi_test', 'single_sync', 'info',
+                        'queue_plan', 'queue_work', 'queue_finalize'
                     ],
                     'timestamp': datetime.now().isoformat()
                 }, ensure_ascii=False)
@@ -208,6 +311,9 @@ def lambda_handler(event, context):
         
         # レスポンス作成
         result['execution_time'] = execution_time
+        trace_summary = export_trace()
+        if trace_summary:
+            result['trace'] = trace_summary
         result['timestamp'] = end_time.isoformat()
         result['library'] = 'pymssql + psycopg2'
         result['version'] = 'multi-table-v1.0'
@@ -243,6 +349,51 @@ def lambda_handler(event, context):
             }, ensure_ascii=False)
         }
 
+def preinitialize():
+    """
+    Lambda初期化フェーズでの事前初期化（環境変数 LAMBDA_PREINIT=true の場合のみモジュール読み込み時に実行）
+    
+    初期化フェーズはCPUの割り当てが多く、ハンドラのタイムアウトにも含まれないため、
+    設定の検証・テーブル定義の生成・同期処理モジュールのインポート・DB接続を済ませておく。
+    事前に開いた接続は最初に同期する処理が引き取り、切断されていた場合はその時点で接続し直す
+    """
+    start_time = datetime.now()
+    result = {'success': False}
+    
+    try:
+        DatabaseConfig.validate_all_configs()
+        
+        with timed_import('preinit'):
+            from table_configs import get_table_spec
+            from db_connections import get_sources, preopen_connections
+            import multi_table_manager
+            import table_sync_processor
+        
+        # 全テーブルの設定を検証して定義を生成
+        get_table_spec(DEFAULT_SYNC_ORDER[0])
+        
+        connections, errors, connect_times = preopen_connections(get_sources(DEFAULT_SYNC_ORDER))
+        result.update({
+            'success': not errors,
+            'preopened': list(connections),
+            'connect_times': connect_times
+        })
+        if errors:
+            result['errors'] = errors
+        
+    except Exception as e:
+        # 失敗してもハンドラで通常どおり初期化・接続する
+        logger.warning(f"事前初期化エラー: {str(e)}")
+        result['error'] = str(e)
+    
+    result['execution_time'] = (datetime.now() - start_time).total_seconds()
+    logger.info(f"事前初期化完了 ({result['execution_time']:.2f}秒): {result}")
+    return result
+
+PREINIT_RESULT = preinitialize() if os.environ.get('LAMBDA_PREINIT', '').lower() in ('true', '1', 'yes', 'on') else None
+
+mark_init_complete()
+
 if __name__ == '__main__':
     import sys
     
@@ -279,15 +430,18 @@ if __name__ == '__main__':
     mode = 'multi_sync'  # デフォルト
     target_tables = None
     table_name = None
+    sinks = None
     
     args = sys.argv[1:]
     for i, arg in enumerate(args):
-        if arg in ['multi_sync', 'multi_test', 'single_sync', 'info']:
+        if arg in ['multi_sync', 'multi_test', 'single_sync', 'info', 'queue_plan', 'queue_work', 'queue_finalize']:
             mode = arg
         elif arg.startswith('--tables='):
             target_tables = arg.split('=')[1].split(',')
         elif arg.startswith('--table='):
             table_name = arg.split('=')[1]
+        elif arg.startswith('--sinks='):
+            sinks = arg.split('=')[1].split(',')
         elif '=' not in arg and i == 0:  # 最初の引数はモード
             mode = arg
     
@@ -299,9 +453,11 @@ if __name__ == '__main__':
     print("    multi_test  : 複数テーブル接続テスト")
     print("    single_sync : 単一テーブル同期 (--table必須)")
     print("    info        : テーブル情報表示")
+    print("    queue_plan / queue_work / queue_finalize : 分散ワークキュー（登録 / チャンク処理 / 反映）")
     print("  オプション:")
     print("    --tables=t1,t2    : 対象テーブル指定")
     print("    --table=table_name: 単一テーブル名")
+    print("    --sinks=parquet,sqlite: 追加シンク指定（/tmp/replica に出力）")
     print(f"  利用可能テーブル: {', '.join(get_available_tables())}")
     print("=" * 70)
     
@@ -317,6 +473,8 @@ if __name__ == '__main__':
             event['tables'] = target_tables
         if table_name:
             event['table_name'] = table_name
+        if sinks:
+            event['sinks'] = sinks
         
         # Lambda関数実行
         response = lambda_handler(event, None)
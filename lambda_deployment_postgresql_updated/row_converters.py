@@ -0,0 +1,130 @@
+"""
+テーブル単位の行変換（型変換）処理
+テーブル設定の column_types（SQL Server側の型）から、変換が必要な列だけを処理する関数を
+テーブルごとに1度だけ生成し、抽出バッチに列単位で適用する（値ごとの型判定を行わない）
+"""
+
+import re
+import json
+import logging
+from datetime import timezone, timedelta
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# 型ごとの変換式（v: 列の値）。None はそのまま
+_CONVERT_EXPRESSIONS = {
+    # pymssqlが整数で返す場合もあるため真偽値に統一
+    'bit': "v if v is None else bool(v)",
+    # PostgreSQLの timestamp 列: タイムゾーンなしの日時に統一
+    # （INSERTでは timestamptz としてセッションのTimeZoneへ変換され、COPYではオフセットが無視されるため）
+    'datetime': "v if v is None or v.tzinfo is None else v.replace(tzinfo=None)",
+    # PostgreSQLの timestamptz 列: タイムゾーンなしの日時に SOURCE_TIMEZONE を付与（未設定時は変換しない）
+    'timestamptz': "v if v is None or v.tzinfo is not None else v.replace(tzinfo=_tz)",
+    # uuid.UUID を PostgreSQL の uuid 型が受け付ける小文字のテキストに変換
+    'uniqueidentifier': "v if v is None else str(v).lower()",
+    # jsonb へのロード前に検証（列名付きのエラーにする）
+    'json': "v if v is None else _check_json(v, {column!r})",
+}
+
+_TIMEZONE_PATTERN = re.compile(r'^(?:UTC)?([+-])(\d{1,2})(?::?(\d{2}))?$')
+
+
+def get_source_timezone():
+    """
+    SQL Serverの日時のタイムゾーン（環境変数 SOURCE_TIMEZONE、例: '+09:00'）
+
+    Returns:
+        timezone: 固定オフセットのタイムゾーン（未設定の場合はNone）
+    """
+    value = DatabaseConfig.get_optional_env('SOURCE_TIMEZONE', '').strip()
+    if not value:
+        return None
+    if value.upper() in ('UTC', 'Z'):
+        return timezone.utc
+
+    match = _TIMEZONE_PATTERN.match(value)
+    if not match:
+        raise ValueError(f"SOURCE_TIMEZONE の形式が不正です: {value}（例: '+09:00'）")
+    sign, hours, minutes = match.groups()
+    offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+    return timezone(-offset if sign == '-' else offset)
+
+
+def _check_json(value, column):
+    """jsonb にロードできる値か検証（空文字は jsonb で受け付けないためNULLとする）"""
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    if not value.strip():
+        return None
+    try:
+        json.loads(value)
+    except ValueError as e:
+        raise ValueError(f"{column} にJSONとして不正な値があります: {value[:100]!r} ({str(e)})")
+    return value
+
+
+class RowConverter:
+    """テーブルの列型から生成した変換関数で行バッチを変換するクラス"""
+
+    def __init__(self, column_names, column_types, source_timezone=None):
+        """
+        初期化
+
+        Args:
+            column_names (list): 行タプルの列名（並び順）
+            column_types (dict): 列名 → 型（COLUMN_TYPES のいずれか）
+            source_timezone (tzinfo): timestamptz 列のタイムゾーンなしの日時に付与するタイムゾーン
+                （Noneの場合は timestamptz 列を変換しない）
+        """
+        column_types = column_types or {}
+        self.column_names = list(column_names)
+        self.source_timezone = source_timezone
+        self.conversions = {
+            idx: column_types[name] for idx, name in enumerate(self.column_names)
+            if name in column_types and (column_types[name] != 'timestamptz' or source_timezone is not None)
+        }
+        self.convert_rows = self.compile(source_timezone)
+
+    @property
+    def enabled(self):
+        return bool(self.conversions)
+
+    def compile(self, source_timezone):
+        """
+        変換対象列だけを列単位で変換する関数を生成
+
+        Returns:
+            callable: 行タプルのリスト → 変換後の行タプルのリスト
+        """
+        if not self.conversions:
+            return lambda rows: rows
+
+        lines = [
+            "def convert_rows(rows):",
+            "    if not rows:",
+            "        return rows",
+            "    columns = list(zip(*rows))",
+        ]
+        for idx, column_type in self.conversions.items():
+            expression = _CONVERT_EXPRESSIONS[column_type].format(column=self.column_names[idx])
+            lines.append(f"    columns[{idx}] = [{expression} for v in columns[{idx}]]")
+        lines.append("    return list(zip(*columns))")
+
+        namespace = {'_tz': source_timezone, '_check_json': _check_json}
+        exec("\n".join(lines), namespace)
+        return namespace['convert_rows']
+
+    def describe(self):
+        """変換対象列と型"""
+        return {self.column_names[idx]: column_type for idx, column_type in self.conversions.items()}
+
+
+def build_row_converter(config):
+    """
+    テーブル設定から行変換を生成
+
+    Args:
+        config (dict): テーブル設定（columns, column_types）
+    """
+    return RowConverter(config['columns'], config.get('column_types'), get_source_timezone())
@@ -0,0 +1,130 @@
+"""
+同期実行履歴
+テーブルごとの処理時間・転送件数を PostgreSQL の履歴テーブルに記録し、
+次回実行時の所要時間予測（スケジューリング）に利用する
+"""
+
+import logging
+from statistics import median
+from datetime import timedelta, timezone
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# 所要時間予測に使う直近の成功実行数
+DEFAULT_HISTORY_WINDOW = 5
+
+
+def get_history_table():
+    """履歴テーブル名（環境変数 RUN_HISTORY_TABLE で変更可能）"""
+    return DatabaseConfig.get_optional_env('RUN_HISTORY_TABLE', 'sync_run_history')
+
+
+class RunHistory:
+    """PostgreSQLの同期実行履歴テーブルへの記録・参照を行うクラス"""
+
+    def __init__(self, pg_conn, table=None):
+        """
+        初期化
+
+        Args:
+            pg_conn: PostgreSQL接続（履歴の記録ごとにコミットする）
+            table (str): 履歴テーブル名
+        """
+        self.pg_conn = pg_conn
+        self.table = table or get_history_table()
+
+    def ensure_table(self):
+        """履歴テーブルが存在しない場合は作成"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id BIGSERIAL PRIMARY KEY,
+                    run_id TEXT,
+                    table_name TEXT NOT NULL,
+                    started_at TIMESTAMPTZ NOT NULL,
+                    finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    duration_seconds DOUBLE PRECISION NOT NULL,
+                    row_count BIGINT NOT NULL DEFAULT 0,
+                    success BOOLEAN NOT NULL,
+                    error TEXT
+                )
+            """)
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_table_finished_idx "
+                f"ON {self.table} (table_name, finished_at DESC)"
+            )
+        self.pg_conn.commit()
+
+    def predict_durations(self, table_names, window=DEFAULT_HISTORY_WINDOW):
+        """
+        直近の成功実行の処理時間（中央値）からテーブルごとの所要時間を予測
+
+        Returns:
+            dict: テーブル名 → 予測所要時間（秒）。履歴のないテーブルは含まない
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT table_name, duration_seconds FROM ("
+                f"  SELECT table_name, duration_seconds, "
+                f"         ROW_NUMBER() OVER (PARTITION BY table_name ORDER BY finished_at DESC) AS rn "
+                f"  FROM {self.table} WHERE success AND table_name = ANY(%s)"
+                f") recent WHERE rn <= %s",
+                (list(table_names), window)
+            )
+            rows = cursor.fetchall()
+        self.pg_conn.rollback()
+
+        durations = {}
+        for table_name, duration in rows:
+            durations.setdefault(table_name, []).append(duration)
+        return {table_name: median(values) for table_name, values in durations.items()}
+
+    def last_successes(self, table_names):
+        """
+        テーブルごとの最終成功時刻と経過秒数（経過時間はDBの時刻で算出）
+
+        Returns:
+            dict: テーブル名 → (最終成功時刻, 経過秒数)。成功履歴のないテーブルは含まない
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT table_name, MAX(finished_at), EXTRACT(EPOCH FROM now() - MAX(finished_at)) "
+                f"FROM {self.table} WHERE success AND table_name = ANY(%s) GROUP BY table_name",
+                (list(table_names),)
+            )
+            rows = cursor.fetchall()
+        self.pg_conn.rollback()
+        return {table_name: (finished_at, float(elapsed)) for table_name, finished_at, elapsed in rows}
+
+    def record_results(self, run_id, table_results, started_at):
+        """
+        テーブル別の同期結果を履歴に記録
+
+        Args:
+            run_id (str): 実行ID
+            table_results (dict): テーブル名 → 同期結果（sync_table の戻り値）
+            started_at (dict): テーブル名 → 処理開始時刻（タイムゾーン付き）
+        """
+        # タイムゾーンなしの時刻はローカル時刻としてUTCに変換（セッションのTimeZoneで解釈させない）
+        started_at = {table_name: started.astimezone(timezone.utc) for table_name, started in started_at.items()}
+        rows = [
+            (run_id, table_name, started_at[table_name],
+             started_at[table_name] + timedelta(seconds=result.get('execution_time', 0)),
+             result.get('execution_time', 0), result.get('transferred_count', 0),
+             bool(result.get('success')), result.get('error'))
+            for table_name, result in table_results.items()
+            if table_name in started_at and not result.get('connection_failed') and not result.get('skipped_locked')
+        ]
+        if not rows:
+            return
+
+        with self.pg_conn.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} "
+                f"(run_id, table_name, started_at, finished_at, duration_seconds, row_count, success, error) "
+                f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                rows
+            )
+        self.pg_conn.commit()
+        logger.info(f"実行履歴記録: {len(rows)}テーブル ({self.table})")
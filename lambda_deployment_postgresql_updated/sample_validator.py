@@ -0,0 +1,208 @@
+"""
+サンプリング検証
+主キーのハッシュ値による決定的な疑似乱数サンプル（hash(pk) mod N）を両DBから取得して列単位で比較し、
+不一致率とその信頼区間上限を報告する（大規模テーブルでも毎回の定期実行で低コストにドリフトを検出）
+"""
+
+import json
+import math
+import uuid
+import zlib
+import logging
+from decimal import Decimal
+from datetime import datetime, timezone
+from table_configs import get_table_spec
+from row_converters import build_row_converter
+
+logger = logging.getLogger(__name__)
+
+# 信頼水準 → 正規分布のz値
+_Z_VALUES = {0.90: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+
+def normalize_value(value):
+    """
+    比較用に値を正規化（pymssql と psycopg2 で型表現が異なる値を揃える）
+
+    SQL Server側の値はロード時と同じ型変換（column_types）を適用してから渡すこと
+
+    Args:
+        value: 各ドライバから取得した値
+
+    Returns:
+        正規化した値
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, Decimal)):
+        return Decimal(value).normalize()
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, datetime):
+        # タイムゾーン付き（timestamptz）の場合はUTCに揃えて比較（セッションの TimeZone に依存しない）
+        if value.tzinfo is not None:
+            return value.astimezone(timezone.utc)
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, ensure_ascii=False)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, str):
+        # JSON列（jsonb）はPostgreSQL側がdict/listで返るため、JSON文字列は正規化して比較
+        if value[:1] in ('{', '['):
+            try:
+                return json.dumps(json.loads(value), sort_keys=True, ensure_ascii=False)
+            except ValueError:
+                pass
+        return value.lower() if len(value) == 36 and value.count('-') == 4 else value
+    return str(value)
+
+
+def wilson_upper_bound(failures, trials, confidence=0.95):
+    """
+    不一致率のWilsonスコア信頼区間の上限
+
+    Args:
+        failures (int): 不一致件数
+        trials (int): サンプル件数
+        confidence (float): 信頼水準（0.90 / 0.95 / 0.99）
+    """
+    if trials == 0:
+        return 1.0
+    z = _Z_VALUES.get(confidence, 1.96)
+    p = failures / trials
+    denominator = 1 + z * z / trials
+    center = p + z * z / (2 * trials)
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    return min(1.0, (center + margin) / denominator)
+
+
+class SampleValidator:
+    """決定的サンプリングによる列単位の比較検証クラス"""
+
+    def __init__(self, table_name, sql_cursor, pg_cursor, modulus=1000, salt='', batch_size=500,
+                 confidence=0.95, max_report_keys=100):
+        """
+        初期化
+
+        Args:
+            table_name (str): 検証対象テーブル名
+            sql_cursor: SQL Serverカーソル
+            pg_cursor: PostgreSQLカーソル
+            modulus (int): サンプリング間隔N（約 1/N の行を抽出）
+            salt (str): 実行ごとのサンプル選択用ソルト（同じソルトなら同じサンプル）
+            batch_size (int): PostgreSQL側の取得バッチサイズ
+            confidence (float): 信頼水準
+            max_report_keys (int): 報告する不一致キーの上限
+        """
+        self.table_name = table_name
+        self.spec = get_table_spec(table_name)
+        self.config = self.spec.config
+        self.sql_cursor = sql_cursor
+        self.pg_cursor = pg_cursor
+        self.modulus = max(1, int(modulus))
+        self.salt = str(salt)
+        self.batch_size = batch_size
+        self.confidence = confidence
+        self.max_report_keys = max_report_keys
+        self.key_index = self.spec.key_index
+        # ロード時と同じ型変換（bit → boolean、timestamptz 列へのタイムゾーン付与など）
+        self.row_converter = build_row_converter(self.config)
+
+    @property
+    def residue(self):
+        """ソルトから決まるサンプル選択の剰余"""
+        return zlib.crc32(self.salt.encode('utf-8')) % self.modulus
+
+    def fetch_source_sample(self):
+        """SQL Serverから hash(pk) mod N = r の行を取得し、ロード時と同じ型変換を適用"""
+        key = f"[{self.spec.primary_key}]"
+        self.sql_cursor.execute(
+            f"SELECT {self.spec.sql_columns_sql} FROM {self.spec.sql_table} WITH (NOLOCK) "
+            f"WHERE ABS(CAST(CHECKSUM(CONVERT(NVARCHAR(100), {key}), %s) AS BIGINT)) %% %d = %d",
+            (self.salt, self.modulus, self.residue)
+        )
+        return self.row_converter.convert_rows([tuple(row) for row in self.sql_cursor.fetchall()])
+
+    def fetch_target_rows(self, keys):
+        """PostgreSQLから指定キーの行をバッチ単位で取得"""
+        target = {}
+        for start_idx in range(0, len(keys), self.batch_size):
+            self.pg_cursor.execute(
+                self.spec.select_by_keys_query,
+                (list(keys[start_idx:start_idx + self.batch_size]),)
+            )
+            for row in self.pg_cursor.fetchall():
+                target[row[self.key_index]] = row
+        return target
+
+    def validate(self, total_rows=None):
+        """
+        サンプリング検証を実行
+
+        Args:
+            total_rows (int): テーブル全体の件数（推定不一致件数の算出用）
+
+        Returns:
+            dict: 検証結果
+        """
+        start_time = datetime.now()
+        logger.info(f"サンプリング検証開始: {self.table_name} (1/{self.modulus}, ソルト: '{self.salt}')")
+
+        source_rows = self.fetch_source_sample()
+        keys = [row[self.key_index] for row in source_rows]
+        target = self.fetch_target_rows(keys)
+
+        mismatched_keys = []
+        missing_keys = []
+        column_mismatches = {}
+
+        for row in source_rows:
+            key = row[self.key_index]
+            target_row = target.get(key)
+            if target_row is None:
+                missing_keys.append(key)
+                continue
+
+            differing_columns = [
+                col for col, source_value, target_value in zip(self.config['columns'], row, target_row)
+                if normalize_value(source_value) != normalize_value(target_value)
+            ]
+            if differing_columns:
+                mismatched_keys.append(key)
+                for col in differing_columns:
+                    column_mismatches[col] = column_mismatches.get(col, 0) + 1
+
+        sampled = len(source_rows)
+        failures = len(mismatched_keys) + len(missing_keys)
+        mismatch_rate = failures / sampled if sampled else 0.0
+        upper_bound = wilson_upper_bound(failures, sampled, self.confidence)
+        execution_time = (datetime.now() - start_time).total_seconds()
+
+        result = {
+            'matched': failures == 0,
+            'sampled_rows': sampled,
+            'mismatched_rows': len(mismatched_keys),
+            'missing_in_target': len(missing_keys),
+            'mismatch_rate': mismatch_rate,
+            'mismatch_rate_upper': upper_bound,
+            'confidence': self.confidence,
+            'column_mismatches': column_mismatches,
+            'mismatched_keys': (mismatched_keys + missing_keys)[:self.max_report_keys],
+            'modulus': self.modulus,
+            'execution_time': execution_time
+        }
+        if total_rows is not None:
+            result['estimated_mismatched_rows_upper'] = int(math.ceil(upper_bound * total_rows))
+
+        if failures == 0:
+            logger.info(f"サンプリング検証成功: {sampled:,}件一致 "
+                        f"(不一致率上限 {upper_bound:.4%} @ {self.confidence:.0%}, {execution_time:.2f}秒)")
+        else:
+            logger.error(f"サンプリング検証失敗: {failures}/{sampled:,}件不一致 "
+                         f"(不一致率 {mismatch_rate:.4%}, 上限 {upper_bound:.4%}), 列別: {column_mismatches}")
+        return result
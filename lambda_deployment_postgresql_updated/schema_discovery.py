@@ -0,0 +1,328 @@
+"""
+SQL Serverのスキーマ取得とテーブル設定・PostgreSQL DDLの生成
+sys.columns / sys.types / 主キーのメタデータから列名・型・NULL可否・主キーを取得し、
+TABLE_CONFIGS のエントリと対応する CREATE TABLE 文を生成する（取得結果は /tmp にキャッシュ）
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from config import DatabaseConfig
+from row_converters import get_source_timezone
+
+logger = logging.getLogger(__name__)
+
+# スキーマキャッシュの保存先と有効期間
+DEFAULT_SCHEMA_CACHE_DIR = '/tmp/schema_cache'
+DEFAULT_SCHEMA_CACHE_TTL_SECONDS = 3600
+
+# 生成するテーブル設定の既定バッチサイズ
+DEFAULT_BATCH_SIZE = 10000
+
+# SQL Server型 → PostgreSQL型（長さ・精度付きの型は map_pg_type で処理）
+_PG_TYPES = {
+    'bigint': 'bigint',
+    'int': 'integer',
+    'smallint': 'smallint',
+    'tinyint': 'smallint',
+    'bit': 'boolean',
+    'float': 'double precision',
+    'real': 'real',
+    'money': 'numeric(19,4)',
+    'smallmoney': 'numeric(10,4)',
+    'date': 'date',
+    'time': 'time',
+    'datetime': 'timestamp',
+    'datetime2': 'timestamp',
+    'smalldatetime': 'timestamp',
+    'datetimeoffset': 'timestamptz',
+    'uniqueidentifier': 'uuid',
+    'text': 'text',
+    'ntext': 'text',
+    'xml': 'xml',
+    'binary': 'bytea',
+    'varbinary': 'bytea',
+    'image': 'bytea',
+    'timestamp': 'bytea',
+    'rowversion': 'bytea',
+}
+
+# タイムゾーンなしのSQL Server日時型（SOURCE_TIMEZONE 設定時は timestamptz 列にする）
+_DATETIME_TYPES = ('datetime', 'datetime2', 'smalldatetime')
+
+# テーブル設定の column_types に対応するSQL Server型
+_COLUMN_TYPES = {
+    'bit': 'bit',
+    'datetime': 'datetime',
+    'datetime2': 'datetime',
+    'smalldatetime': 'datetime',
+    'uniqueidentifier': 'uniqueidentifier',
+}
+
+_DISCOVERY_QUERY = """
+SELECT c.column_id, c.name, TYPE_NAME(c.system_type_id), c.max_length, c.precision, c.scale, c.is_nullable,
+       CASE WHEN ic.key_ordinal IS NULL THEN 0 ELSE ic.key_ordinal END
+FROM sys.columns c
+LEFT JOIN sys.indexes i ON i.object_id = c.object_id AND i.is_primary_key = 1
+LEFT JOIN sys.index_columns ic
+       ON ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.column_id = c.column_id
+WHERE c.object_id = OBJECT_ID(%s)
+ORDER BY c.column_id
+"""
+
+
+def map_pg_type(column):
+    """
+    SQL Serverの列情報からPostgreSQLの型を決定
+
+    Args:
+        column (dict): discover_table_schema の列情報（type, max_length, precision, scale, json）
+    """
+    sql_type = column['type']
+    if column.get('json'):
+        return 'jsonb'
+    if sql_type in _DATETIME_TYPES and get_source_timezone() is not None:
+        return 'timestamptz'
+    if sql_type in ('decimal', 'numeric'):
+        return f"numeric({column['precision']},{column['scale']})"
+    if sql_type in ('char', 'varchar', 'nchar', 'nvarchar'):
+        if column['max_length'] == -1:
+            return 'text'
+        # nchar / nvarchar の max_length はバイト数（1文字2バイト）
+        length = column['max_length'] // 2 if sql_type.startswith('n') else column['max_length']
+        return f"varchar({length})"
+    return _PG_TYPES.get(sql_type, 'text')
+
+
+def discover_table_schema(conn, sql_table):
+    """
+    SQL Serverのテーブル定義を取得
+
+    Args:
+        conn: SQL Server接続（テーブルのデータベースに接続していること）
+        sql_table (str): '[McTM].[dbo].[Customer]' 形式のテーブル名
+
+    Returns:
+        dict: sql_table, columns（列情報のリスト、列順）, primary_key（主キー列名のリスト、キー順）
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_DISCOVERY_QUERY, (sql_table,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    if not rows:
+        raise ValueError(f"テーブルが見つかりません: {sql_table}")
+
+    columns = []
+    key_columns = []
+    for column_id, name, sql_type, max_length, precision, scale, is_nullable, key_ordinal in rows:
+        columns.append({
+            'name': name,
+            'type': sql_type,
+            'max_length': max_length,
+            'precision': precision,
+            'scale': scale,
+            'nullable': bool(is_nullable),
+            # JSONを格納する文字列列（列名が ...Json）は jsonb として扱う
+            'json': sql_type in ('varchar', 'nvarchar') and name.lower().endswith('json'),
+        })
+        if key_ordinal:
+            key_columns.append((key_ordinal, name))
+
+    return {
+        'sql_table': sql_table,
+        'columns': columns,
+        'primary_key': [name for _, name in sorted(key_columns)]
+    }
+
+
+class SchemaCache:
+    """取得したスキーマをJSONファイルとしてキャッシュするクラス"""
+
+    def __init__(self, cache_dir=None, ttl_seconds=None):
+        self.cache_dir = cache_dir or DatabaseConfig.get_optional_env('SCHEMA_CACHE_DIR', DEFAULT_SCHEMA_CACHE_DIR)
+        self.ttl_seconds = ttl_seconds or DatabaseConfig.get_optional_env(
+            'SCHEMA_CACHE_TTL_SECONDS', DEFAULT_SCHEMA_CACHE_TTL_SECONDS
+        )
+
+    def path(self, sql_table):
+        file_name = re.sub(r'[^0-9A-Za-z_.-]', '', sql_table.replace('].[', '.'))
+        return os.path.join(self.cache_dir, f"{file_name}.json")
+
+    def load(self, sql_table):
+        """有効期間内のキャッシュを取得（ない場合はNone）"""
+        path = self.path(sql_table)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, sql_table, schema):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path(sql_table)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(schema, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path(sql_table))
+
+    def get(self, conn, sql_table, refresh=False):
+        """
+        キャッシュまたはSQL Serverからスキーマを取得
+
+        Args:
+            conn: SQL Server接続
+            sql_table (str): テーブル名
+            refresh (bool): キャッシュを使わずに再取得
+        """
+        schema = None if refresh else self.load(sql_table)
+        if schema is not None:
+            logger.info(f"スキーマキャッシュ使用: {sql_table}")
+            return schema
+
+        start_time = time.time()
+        schema = discover_table_schema(conn, sql_table)
+        logger.info(f"スキーマ取得: {sql_table} ({len(schema['columns'])}列, {time.time() - start_time:.2f}秒)")
+        try:
+            self.save(sql_table, schema)
+        except OSError as e:
+            logger.warning(f"スキーマキャッシュ保存エラー: {str(e)}")
+        return schema
+
+
+def generate_table_config(schema, db_type, sql_server_db, pg_table, description=''):
+    """
+    スキーマからテーブル設定（TABLE_CONFIGS のエントリ）を生成
+
+    Args:
+        schema (dict): discover_table_schema の戻り値
+        db_type (str): 'mctm' / 'voipdb'
+        sql_server_db (str): SQL Serverのデータベース名
+        pg_table (str): PostgreSQLテーブル名
+        description (str): 説明
+    """
+    if not schema['primary_key']:
+        raise ValueError(f"主キーがないテーブルは設定を生成できません: {schema['sql_table']}")
+    # テーブル設定の primary_key / order_by は単一列のみ対応（先頭列だけでは行を一意に特定できない）
+    if len(schema['primary_key']) > 1:
+        raise ValueError(
+            f"複合主キーのテーブルは設定を生成できません: {schema['sql_table']} ({', '.join(schema['primary_key'])})"
+        )
+
+    columns = [column['name'] for column in schema['columns']]
+    source_timezone = get_source_timezone()
+    column_types = {}
+    for column in schema['columns']:
+        if column['json']:
+            column_types[column['name']] = 'json'
+        elif column['type'] in _DATETIME_TYPES and source_timezone is not None:
+            column_types[column['name']] = 'timestamptz'
+        elif column['type'] in _COLUMN_TYPES:
+            column_types[column['name']] = _COLUMN_TYPES[column['type']]
+
+    config = {
+        'db_type': db_type,
+        'sql_server_db': sql_server_db,
+        'sql_table': schema['sql_table'],
+        'pg_table': pg_table,
+        'columns': columns,
+        'pg_columns': [name.lower() for name in columns],
+        'primary_key': schema['primary_key'][0],
+        'order_by': schema['primary_key'][0],
+        'batch_size': DEFAULT_BATCH_SIZE,
+    }
+    if column_types:
+        config['column_types'] = column_types
+    config['description'] = description
+    return config
+
+
+def format_table_config(table_name, config):
+    """テーブル設定を table_configs.py に貼り付けられる形式の文字列にする"""
+    lines = [f"    '{table_name}': {{"]
+    for key, value in config.items():
+        if isinstance(value, list):
+            lines.append(f"        '{key}': [")
+            for idx in range(0, len(value), 6):
+                lines.append("            " + ", ".join(repr(v) for v in value[idx:idx + 6]) + ",")
+            lines[-1] = lines[-1].rstrip(',')
+            lines.append("        ],")
+        else:
+            lines.append(f"        '{key}': {value!r},")
+    lines[-1] = lines[-1].rstrip(',')
+    lines.append("    },")
+    return "\n".join(lines)
+
+
+def generate_pg_ddl(schema, pg_table):
+    """スキーマからPostgreSQLの CREATE TABLE 文を生成"""
+    column_lines = [
+        f'    "{column["name"].lower()}" {map_pg_type(column)}{"" if column["nullable"] else " NOT NULL"}'
+        for column in schema['columns']
+    ]
+    if schema['primary_key']:
+        key_columns = ", ".join(f'"{name.lower()}"' for name in schema['primary_key'])
+        column_lines.append(f"    PRIMARY KEY ({key_columns})")
+    return f"CREATE TABLE IF NOT EXISTS {pg_table} (\n" + ",\n".join(column_lines) + "\n);"
+
+
+# ローカル実行（テーブル設定とDDLの生成）
+if __name__ == '__main__':
+    import sys
+    from db_connections import open_source_connection
+    from table_configs import TABLE_CONFIGS
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    # 使用例:
+    #   python schema_discovery.py                                  # 設定済みテーブルのDDLを生成
+    #   python schema_discovery.py --db=voipdb --tables=Extension   # 新規テーブルの設定とDDLを生成
+    db_type = None
+    sql_tables = []
+    refresh = False
+    for arg in sys.argv[1:]:
+        if arg.startswith('--db='):
+            db_type = arg.split('=')[1]
+        elif arg.startswith('--tables='):
+            sql_tables = arg.split('=')[1].split(',')
+        elif arg == '--refresh':
+            refresh = True
+
+    if sql_tables and db_type not in ('mctm', 'voipdb'):
+        print("使用方法: python schema_discovery.py [--db=mctm|voipdb --tables=Table1,Table2] [--refresh]")
+        sys.exit(1)
+
+    if sql_tables:
+        sql_server_db = DatabaseConfig.get_sql_server_config(db_type)['database']
+        targets = [
+            (f"{db_type}_{name.lower()}", db_type, sql_server_db, f"[{sql_server_db}].[dbo].[{name}]",
+             f"{db_type}_{name.lower()}")
+            for name in sql_tables
+        ]
+    else:
+        targets = [
+            (table_name, config['db_type'], config['sql_server_db'], config['sql_table'], config['pg_table'])
+            for table_name, config in TABLE_CONFIGS.items()
+        ]
+
+    cache = SchemaCache()
+    connections = {}
+    try:
+        for table_name, table_db_type, sql_server_db, sql_table, pg_table in targets:
+            if sql_server_db not in connections:
+                connections[sql_server_db] = open_source_connection(table_db_type, sql_server_db)
+            schema = cache.get(connections[sql_server_db], sql_table, refresh=refresh)
+
+            print(f"-- {table_name}: {sql_table}")
+            if sql_tables:
+                print(format_table_config(table_name, generate_table_config(schema, table_db_type, sql_server_db, pg_table)))
+            print(generate_pg_ddl(schema, pg_table))
+            print()
+    finally:
+        for conn in connections.values():
+            conn.close()
@@ -0,0 +1,258 @@
+"""
+スキーマ変更（ドリフト）の検出
+SQL Server（sys.columns）と PostgreSQL（information_schema.columns）の列名・型・並び順のハッシュを
+前回実行時に保存したハッシュと比較し、変更があれば同期対象列の有無を確認してデータ転送前に中止する
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime
+from config import DatabaseConfig
+from schema_discovery import discover_table_schema, generate_pg_ddl, map_pg_type
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+_SOURCE_COLUMNS_QUERY = (
+    "SELECT c.name, TYPE_NAME(c.system_type_id), c.max_length, c.precision, c.scale "
+    "FROM sys.columns c WHERE c.object_id = OBJECT_ID(%s) ORDER BY c.column_id"
+)
+
+_TARGET_COLUMNS_QUERY = (
+    "SELECT column_name, data_type, character_maximum_length, numeric_precision, numeric_scale "
+    "FROM information_schema.columns "
+    "WHERE table_schema = COALESCE(%s, current_schema()) AND table_name = %s ORDER BY ordinal_position"
+)
+
+
+class SchemaDriftError(RuntimeError):
+    """同期対象列がSQL ServerまたはPostgreSQLに存在しない場合のエラー"""
+
+
+def fetch_source_columns(sql_conn, sql_table):
+    """SQL Serverの列定義（列名, 型, 長さ, 精度, 桁数）のリスト"""
+    cursor = sql_conn.cursor()
+    try:
+        cursor.execute(_SOURCE_COLUMNS_QUERY, (sql_table,))
+        return [list(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def fetch_target_columns(pg_conn, pg_table):
+    """PostgreSQLの列定義（列名, 型, 長さ, 精度, 桁数）のリスト"""
+    schema, _, table = pg_table.rpartition('.')
+    with pg_conn.cursor() as cursor:
+        cursor.execute(_TARGET_COLUMNS_QUERY, (schema or None, table))
+        return [list(row) for row in cursor.fetchall()]
+
+
+def schema_fingerprint(columns):
+    """列定義のリストのハッシュ"""
+    return hashlib.sha256(json.dumps(columns, default=str).encode('utf-8')).hexdigest()
+
+
+class SchemaFingerprintStore:
+    """テーブルごとのスキーマのハッシュを PostgreSQL に保存・参照するクラス"""
+
+    def __init__(self, pg_conn, table=None):
+        self.pg_conn = pg_conn
+        self.table = table or DatabaseConfig.get_optional_env('SCHEMA_FINGERPRINT_TABLE', 'sync_schema_fingerprints')
+
+    def ensure_table(self):
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    table_name TEXT PRIMARY KEY,
+                    source_fingerprint TEXT,
+                    target_fingerprint TEXT NOT NULL,
+                    source_columns JSONB,
+                    target_columns JSONB NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+        self.pg_conn.commit()
+
+    def load(self, table_name):
+        """
+        保存済みのハッシュと列定義を取得
+
+        Returns:
+            tuple: (SQL Serverのハッシュ, PostgreSQLのハッシュ, SQL Serverの列定義, PostgreSQLの列定義)。
+                未保存の場合はNone
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT source_fingerprint, target_fingerprint, source_columns, target_columns "
+                f"FROM {self.table} WHERE table_name = %s",
+                (table_name,)
+            )
+            row = cursor.fetchone()
+        self.pg_conn.rollback()
+        return tuple(row) if row else None
+
+    def save(self, table_name, source_fingerprint, target_fingerprint, source_columns, target_columns):
+        """ハッシュと列定義を保存（SQL Serverを参照しなかった場合は前回値を維持）"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                f"(table_name, source_fingerprint, target_fingerprint, source_columns, target_columns) "
+                f"VALUES (%s, %s, %s, %s, %s) ON CONFLICT (table_name) DO UPDATE SET "
+                f"source_fingerprint = COALESCE(EXCLUDED.source_fingerprint, {self.table}.source_fingerprint), "
+                f"target_fingerprint = EXCLUDED.target_fingerprint, "
+                f"source_columns = COALESCE(EXCLUDED.source_columns, {self.table}.source_columns), "
+                f"target_columns = EXCLUDED.target_columns, updated_at = now()",
+                (table_name, source_fingerprint, target_fingerprint,
+                 json.dumps(source_columns, default=str) if source_columns is not None else None,
+                 json.dumps(target_columns, default=str))
+            )
+        self.pg_conn.commit()
+
+
+def find_missing_columns(config, source_columns, target_columns):
+    """
+    同期対象列のうちSQL Server / PostgreSQLに存在しない列
+
+    Returns:
+        tuple: (SQL Serverにない列, PostgreSQLにない列)
+    """
+    missing_source = []
+    if source_columns is not None:
+        # SQL Serverの列名は大文字小文字を区別しない照合順序を前提とする
+        source_names = {row[0].lower() for row in source_columns}
+        missing_source = [col for col in config['columns'] if col.lower() not in source_names]
+    target_names = {row[0] for row in target_columns}
+    missing_target = [col for col in config['pg_columns'] if col not in target_names]
+    return missing_source, missing_target
+
+
+def find_changed_columns(synced_names, cached_columns, current_columns, case_insensitive=False):
+    """
+    同期対象列のうち、前回保存時から型・長さ・精度・桁数が変わった列
+
+    Args:
+        synced_names (list): 同期対象列名
+        cached_columns (list): 保存済みの列定義（列名, 型, 長さ, 精度, 桁数）のリスト（未保存の場合はNone）
+        current_columns (list): 現在の列定義（同上、未取得の場合はNone）
+        case_insensitive (bool): 列名の大文字小文字を区別しない（SQL Server）
+
+    Returns:
+        list: '列名: 前回の定義 → 現在の定義' の文字列のリスト
+    """
+    if cached_columns is None or current_columns is None:
+        return []
+
+    def definitions(columns):
+        # 保存時と同じJSON表現に揃えて比較（Decimal等は文字列）
+        columns = json.loads(json.dumps(columns, default=str))
+        return {(row[0].lower() if case_insensitive else row[0]): row[1:] for row in columns}
+
+    cached = definitions(cached_columns)
+    current = definitions(current_columns)
+    changed = []
+    for name in synced_names:
+        key = name.lower() if case_insensitive else name
+        if key in cached and key in current and cached[key] != current[key]:
+            changed.append(f"{name}: {cached[key]} → {current[key]}")
+    return changed
+
+
+def migrate_target_table(config, sql_conn, pg_conn, source_columns, missing_target):
+    """
+    PostgreSQLにない同期対象列を追加（テーブルがない場合はSQL Serverの定義から作成）
+
+    Returns:
+        list: 追加した列名
+    """
+    json_columns = {col for col, column_type in config.get('column_types', {}).items() if column_type == 'json'}
+    with pg_conn.cursor() as cursor:
+        if len(missing_target) == len(config['pg_columns']):
+            schema = discover_table_schema(sql_conn, config['sql_table'])
+            for column in schema['columns']:
+                column['json'] = column['json'] or column['name'] in json_columns
+            cursor.execute(generate_pg_ddl(schema, config['pg_table']))
+            logger.warning(f"PostgreSQLテーブルを作成: {config['pg_table']}")
+        else:
+            source_definitions = {row[0].lower(): row for row in source_columns}
+            for col, pg_col in zip(config['columns'], config['pg_columns']):
+                if pg_col not in missing_target:
+                    continue
+                name, sql_type, max_length, precision, scale = source_definitions[col.lower()]
+                pg_type = map_pg_type({
+                    'type': sql_type, 'max_length': max_length, 'precision': precision, 'scale': scale,
+                    'json': col in json_columns
+                })
+                cursor.execute(f'ALTER TABLE {config["pg_table"]} ADD COLUMN IF NOT EXISTS "{pg_col}" {pg_type}')
+                logger.warning(f"PostgreSQL列を追加: {config['pg_table']}.{pg_col} {pg_type}")
+    pg_conn.commit()
+    return list(missing_target)
+
+
+@traced('schema_check')
+def check_schema(table_name, config, sql_conn, pg_conn, migrate=False):
+    """
+    スキーマのハッシュを前回実行時と比較し、変更があれば同期対象列の有無を確認
+
+    ハッシュが一致する場合はメタデータの参照のみで終了する。一致しない場合、同期対象列に存在しない列、
+    または型・長さ・精度・桁数が前回から変わった列があれば SchemaDriftError で中止し、なければハッシュを更新して続行する
+    （意図した型変更の場合は保存済みのハッシュの行を削除して再実行する）
+
+    Args:
+        table_name (str): 同期対象テーブル名
+        config (dict): テーブル設定
+        sql_conn: SQL Server接続（Noneの場合はPostgreSQLのみ確認）
+        pg_conn: PostgreSQL接続（ハッシュの保存でコミットする）
+        migrate (bool): PostgreSQLにない同期対象列を追加する
+
+    Returns:
+        dict: changed（前回から変更あり）, migrated_columns, check_time
+    """
+    start_time = datetime.now()
+    source_columns = fetch_source_columns(sql_conn, config['sql_table']) if sql_conn else None
+    target_columns = fetch_target_columns(pg_conn, config['pg_table'])
+    source_fingerprint = schema_fingerprint(source_columns) if source_columns is not None else None
+    target_fingerprint = schema_fingerprint(target_columns)
+
+    store = SchemaFingerprintStore(pg_conn)
+    store.ensure_table()
+    cached = store.load(table_name)
+    result = {'changed': False, 'migrated_columns': []}
+
+    if cached and cached[1] == target_fingerprint and source_fingerprint in (None, cached[0]):
+        result['check_time'] = (datetime.now() - start_time).total_seconds()
+        return result
+
+    result['changed'] = cached is not None
+    missing_source, missing_target = find_missing_columns(config, source_columns, target_columns)
+
+    if migrate and missing_target and not missing_source and source_columns is not None:
+        result['migrated_columns'] = migrate_target_table(config, sql_conn, pg_conn, source_columns, missing_target)
+        target_columns = fetch_target_columns(pg_conn, config['pg_table'])
+        target_fingerprint = schema_fingerprint(target_columns)
+        missing_source, missing_target = find_missing_columns(config, source_columns, target_columns)
+
+    if missing_source or missing_target:
+        raise SchemaDriftError(
+            f"スキーマ不一致のため同期を中止: {table_name} "
+            f"(SQL Serverにない列: {missing_source or 'なし'}, PostgreSQLにない列: {missing_target or 'なし'})"
+        )
+
+    if cached:
+        changed_source = find_changed_columns(config['columns'], cached[2], source_columns, case_insensitive=True)
+        changed_target = find_changed_columns(config['pg_columns'], cached[3], target_columns)
+        if changed_source or changed_target:
+            raise SchemaDriftError(
+                f"同期対象列の型変更のため同期を中止: {table_name} "
+                f"(SQL Server: {changed_source or 'なし'}, PostgreSQL: {changed_target or 'なし'})。"
+                f"意図した変更の場合は {store.table} の該当行を削除して再実行"
+            )
+
+    store.save(table_name, source_fingerprint, target_fingerprint, source_columns, target_columns)
+    if cached:
+        logger.warning(f"スキーマ変更を検出（同期対象列はすべて存在し型も変わらないため続行）: {table_name}")
+    else:
+        logger.info(f"スキーマのハッシュを保存: {table_name}")
+
+    result['check_time'] = (datetime.now() - start_time).total_seconds()
+    return result
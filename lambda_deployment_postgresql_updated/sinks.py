@@ -0,0 +1,617 @@
+"""
+同期先（シンク）アダプター
+1回の抽出データを PostgreSQL / SQLite / カラムナファイル（Parquet）へ書き込む共通インターフェース
+"""
+
+import io
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import psycopg2
+from table_configs import get_table_config, get_table_spec
+from columnar_batch import ColumnarBatch
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# ファイル系シンクのデフォルト出力先
+DEFAULT_SINK_OUTPUT_DIR = '/tmp/replica'
+
+
+def iter_batches(rows, batch_size):
+    """行リスト（またはスピルバッファ）をバッチサイズごとに分割して返す"""
+    if hasattr(rows, 'iter_batches'):
+        yield from rows.iter_batches(batch_size)
+        return
+    for start_idx in range(0, len(rows), batch_size):
+        yield rows[start_idx:start_idx + batch_size]
+
+
+class BaseSink:
+    """
+    シンク共通インターフェース
+
+    呼び出し順序: begin → prepare_target → write_batches → finalize（失敗時は abort）→ close
+    """
+
+    sink_type = 'base'
+    # カラムナバッチ（ColumnarBatch）をそのまま書き込めるか（False の場合は行タプルに戻して渡す）
+    accepts_columnar = False
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.spec = get_table_spec(table_name)
+        self.config = self.spec.config
+        self.written_count = 0
+        # 同期先PostgreSQLテーブルの列定義（schema_drift.fetch_target_columns の形式、create_sink で設定）
+        self.target_columns = None
+
+    @property
+    def name(self):
+        return f"{self.sink_type}:{self.config['pg_table']}"
+
+    def begin(self):
+        """書き込みセッション開始（接続・一時ファイル作成など）"""
+        raise NotImplementedError
+
+    def prepare_target(self):
+        """書き込み先の準備（クリア・テーブル作成など）"""
+        raise NotImplementedError
+
+    def write_batches(self, batches):
+        """
+        バッチのストリームを書き込む
+
+        Args:
+            batches (iterable): 行タプルのリスト（または ColumnarBatch）のイテラブル
+
+        Returns:
+            int: 書き込んだ件数
+        """
+        for batch in batches:
+            if isinstance(batch, ColumnarBatch) and not self.accepts_columnar:
+                batch = batch.to_rows()
+            self.write_batch(batch)
+            self.written_count += len(batch)
+        return self.written_count
+
+    def write_batch(self, batch):
+        """単一バッチの書き込み"""
+        raise NotImplementedError
+
+    def finalize(self):
+        """書き込み確定（コミット・ファイル差し替えなど）"""
+        raise NotImplementedError
+
+    def abort(self):
+        """書き込み中断（ロールバック・一時ファイル削除など）"""
+        pass
+
+    def count(self):
+        """書き込み先の件数を取得"""
+        return self.written_count
+
+    def close(self):
+        """リソース解放"""
+        pass
+
+
+class PostgreSQLSink(BaseSink):
+    """
+    PostgreSQLシンク（INSERT または COPY）
+
+    同期先テーブルへのロード（TableSyncProcessor / QueueWorker）と追加シンクで共通のINSERT・COPY処理
+    """
+
+    sink_type = 'postgresql'
+
+    def __init__(self, table_name, pg_table=None, method='insert', conn=None, pg_config=None, cursor=None,
+                 dictionary_columns=None, lock_timeout_ms=None):
+        """
+        初期化
+
+        Args:
+            table_name (str): 同期対象テーブル名
+            pg_table (str): 書き込み先テーブル名（未指定時は同期先の pg_table）
+            method (str): 'insert'（execute_values）または 'copy'（COPY FROM STDIN）
+            conn: 既存のpsycopg2接続（指定時はクローズしない）
+            pg_config (dict): 接続設定（未指定時は環境変数から取得）
+            cursor: 既存のカーソル（指定時は呼び出し元のトランザクション内で書き込み、クローズしない）
+            dictionary_columns (list): COPY時に辞書エンコードする列名（PostgreSQLカラム名）
+            lock_timeout_ms (int): トランザクション内のロック待機時間の上限（Noneの場合は設定しない）
+        """
+        super().__init__(table_name)
+        if method not in ('insert', 'copy'):
+            raise ValueError(f"不正なPostgreSQLロード方式: {method}")
+        self.pg_table = pg_table or self.config['pg_table']
+        self.method = method
+        self.conn = conn
+        self.owns_conn = conn is None
+        self.pg_config = pg_config
+        self.cursor = cursor
+        self.owns_cursor = cursor is None
+        self.dictionary_columns = dictionary_columns
+        self.lock_timeout_ms = lock_timeout_ms
+        # 直前のCOPYで送信したバイト数
+        self.batch_bytes = 0
+        pg_columns_sql = self.spec.pg_columns_sql
+        self.insert_query = f"INSERT INTO {self.pg_table} ({pg_columns_sql}) VALUES %s"
+        self.copy_statement = f"COPY {self.pg_table} ({pg_columns_sql}) FROM STDIN WITH (FORMAT text)"
+        self.count_query = f"SELECT COUNT(*) FROM {self.pg_table}"
+
+    @property
+    def name(self):
+        return f"{self.sink_type}:{self.pg_table}"
+
+    @property
+    def accepts_columnar(self):
+        # COPYはカラムナバッチから列単位でエンコード
+        return self.method == 'copy'
+
+    def begin(self):
+        if self.cursor is None:
+            if self.conn is None:
+                pg_config = self.pg_config or DatabaseConfig.get_postgresql_config()
+                self.conn = psycopg2.connect(
+                    host=pg_config['host'],
+                    dbname=pg_config['database'],
+                    user=pg_config['user'],
+                    password=pg_config['password'],
+                    port=pg_config['port'],
+                    connect_timeout=pg_config['connect_timeout']
+                )
+            self.cursor = self.conn.cursor()
+        if self.lock_timeout_ms is not None:
+            # ロック待ちで同期処理全体を止めないよう、シンクのトランザクション内のロック待機時間を制限
+            self.cursor.execute("SET LOCAL lock_timeout = %s", (f"{self.lock_timeout_ms}ms",))
+
+    def prepare_target(self):
+        self.cursor.execute(f"TRUNCATE TABLE {self.pg_table}")
+
+    def write_batch(self, batch):
+        """
+        単一バッチの書き込み
+
+        Returns:
+            int: PostgreSQLの報告した件数（INSERTの rowcount / COPYの処理件数）
+        """
+        if self.method == 'copy':
+            return self.write_batch_copy(batch)
+        # psycopg2.extras は INSERT方式でのみ必要なため使用時にインポート
+        from psycopg2.extras import execute_values
+        execute_values(
+            self.cursor,
+            self.insert_query,
+            batch,
+            page_size=len(batch)
+        )
+        return self.cursor.rowcount
+
+    def write_batch_copy(self, batch):
+        """
+        COPY FROM STDIN でバッチを書き込む
+
+        行タプルのリストはカラムナバッチに変換してエンコードする（変換ワーカーの結果はエンコード済みのバイト列）
+        """
+        if not hasattr(batch, 'to_copy_text'):
+            batch = ColumnarBatch.from_rows(batch, self.config['pg_columns'], self.dictionary_columns)
+        copy_text = batch.to_copy_text()
+        self.batch_bytes = len(copy_text)
+        copy_file = io.BytesIO(copy_text) if isinstance(copy_text, bytes) else io.StringIO(copy_text)
+        return self.copy_from(copy_file)
+
+    def copy_from(self, copy_file):
+        """
+        ファイルライクオブジェクト（COPY text形式）を COPY FROM STDIN で書き込む
+
+        Returns:
+            int: COPYの処理件数
+        """
+        self.cursor.copy_expert(self.copy_statement, copy_file)
+        return self.cursor.rowcount
+
+    def finalize(self):
+        self.conn.commit()
+
+    def abort(self):
+        if self.conn:
+            try:
+                self.conn.rollback()
+            except psycopg2.Error:
+                pass
+
+    def count(self):
+        self.cursor.execute(self.count_query)
+        return self.cursor.fetchone()[0]
+
+    def close(self):
+        if self.cursor and self.owns_cursor:
+            self.cursor.close()
+        if self.conn and self.owns_conn:
+            self.conn.close()
+
+
+class SQLiteSink(BaseSink):
+    """SQLiteシンク（一時ファイルに書き込み、確定時に差し替え）"""
+
+    sink_type = 'sqlite'
+
+    def __init__(self, table_name, path=None):
+        super().__init__(table_name)
+        self.path = path or os.path.join(DEFAULT_SINK_OUTPUT_DIR, f"{self.config['pg_table']}.sqlite3")
+        self.tmp_path = f"{self.path}.tmp"
+        self.conn = None
+
+    def begin(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+
+    def prepare_target(self):
+        self.conn.execute(f'CREATE TABLE "{self.config["pg_table"]}" ({self.spec.pg_columns_sql})')
+
+    def write_batch(self, batch):
+        placeholders = ", ".join(["?"] * len(self.config['pg_columns']))
+        self.conn.executemany(
+            f'INSERT INTO "{self.config["pg_table"]}" VALUES ({placeholders})',
+            [tuple(_to_sqlite_value(value) for value in row) for row in batch]
+        )
+
+    def finalize(self):
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def count(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(f'SELECT COUNT(*) FROM "{self.config["pg_table"]}"').fetchone()[0]
+        finally:
+            conn.close()
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+
+def _to_sqlite_value(value):
+    """SQLiteが直接扱えない型を変換"""
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+
+# PostgreSQLの型 → Arrowの型
+_ARROW_TYPES = {
+    'smallint': lambda pa: pa.int16(),
+    'integer': lambda pa: pa.int32(),
+    'bigint': lambda pa: pa.int64(),
+    'real': lambda pa: pa.float32(),
+    'double precision': lambda pa: pa.float64(),
+    'boolean': lambda pa: pa.bool_(),
+    'date': lambda pa: pa.date32(),
+    'timestamp without time zone': lambda pa: pa.timestamp('us'),
+    'bytea': lambda pa: pa.binary(),
+}
+
+
+def arrow_type(pa, data_type, precision=None, scale=None):
+    """
+    PostgreSQLの型（information_schema.columns.data_type）に対応するArrowの型
+
+    対応表にない型（uuid / json / xml 等）と、精度未指定・decimal128 の上限（38桁）を超える numeric は文字列として扱う
+    """
+    if data_type == 'numeric':
+        if precision is None or precision > 38:
+            return pa.string()
+        return pa.decimal128(precision, scale or 0)
+    if data_type == 'timestamp with time zone':
+        return pa.timestamp('us', tz='UTC')
+    return _ARROW_TYPES.get(data_type, lambda pa: pa.string())(pa)
+
+
+class ParquetSink(BaseSink):
+    """
+    カラムナファイル（Parquet）シンク
+
+    スキーマは同期先PostgreSQLテーブルの列定義から決定する（バッチの値から推定しない）
+    pyarrow が必要（Lambdaレイヤー等で追加すること）
+    """
+
+    sink_type = 'parquet'
+    accepts_columnar = True
+
+    def __init__(self, table_name, path=None):
+        super().__init__(table_name)
+        self.path = path or os.path.join(DEFAULT_SINK_OUTPUT_DIR, f"{self.config['pg_table']}.parquet")
+        self.tmp_path = f"{self.path}.tmp"
+        self.writer = None
+        self.schema = None
+        self.pa = None
+
+    def begin(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquetシンクには pyarrow が必要です (pip install pyarrow -t .)")
+        self.pa = pyarrow
+        self.schema = self.build_schema()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def build_schema(self):
+        """同期先PostgreSQLテーブルの列定義からArrowスキーマを生成"""
+        if self.target_columns is None:
+            raise RuntimeError("Parquetシンクには同期先テーブルの列定義が必要です")
+        target_types = {name: (data_type, precision, scale)
+                        for name, data_type, _, precision, scale in self.target_columns}
+        fields = []
+        for col_name in self.config['pg_columns']:
+            if col_name not in target_types:
+                raise RuntimeError(f"同期先テーブル {self.config['pg_table']} に列 {col_name} がありません")
+            fields.append(self.pa.field(col_name, arrow_type(self.pa, *target_types[col_name])))
+        return self.pa.schema(fields)
+
+    def prepare_target(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def write_batch(self, batch):
+        pa = self.pa
+        if isinstance(batch, ColumnarBatch):
+            columns = [batch.column_values(column_idx) for column_idx in range(len(batch.columns))]
+        else:
+            columns = list(zip(*batch))
+
+        if self.writer is None:
+            self.writer = pa.parquet.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+
+        arrays = []
+        for field, values in zip(self.schema, columns):
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def finalize(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def count(self):
+        return self.pa.parquet.ParquetFile(self.path).metadata.num_rows
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+
+# シンク種別 → クラス
+SINK_TYPES = {
+    'postgresql': PostgreSQLSink,
+    'sqlite': SQLiteSink,
+    'parquet': ParquetSink,
+}
+
+
+def create_sink(spec, table_name, target_columns=None):
+    """
+    シンク指定からシンクを生成
+
+    Args:
+        spec (str | dict): 'parquet' のような種別名、または {'type': 'sqlite', 'path': ...}
+        table_name (str): 同期対象テーブル名
+        target_columns (list): 同期先PostgreSQLテーブルの列定義（Parquetシンクのスキーマに使用）
+
+    Returns:
+        BaseSink: シンクインスタンス
+    """
+    if isinstance(spec, str):
+        spec = {'type': spec}
+
+    spec = dict(spec)
+    sink_type = spec.pop('type', None)
+    if sink_type not in SINK_TYPES:
+        raise ValueError(f"未知のシンク種別: {sink_type}. 利用可能: {list(SINK_TYPES.keys())}")
+
+    pg_table = get_table_config(table_name)['pg_table']
+    for key in ('path', 'pg_table'):
+        if spec.get(key):
+            # {table} を pg_table 名に置換可能
+            spec[key] = spec[key].format(table=pg_table)
+
+    if sink_type == 'postgresql':
+        # 同期処理は pg_table を TRUNCATE したトランザクションを保持したまま追加シンクへ書き込むため、
+        # 同じテーブルへの TRUNCATE はロック待ちで終わらない
+        if not spec.get('pg_table') or spec['pg_table'] == pg_table:
+            raise ValueError(f"PostgreSQLシンクには同期先（{pg_table}）とは別の書き込み先 pg_table の指定が必要です")
+        spec.setdefault('lock_timeout_ms', DatabaseConfig.get_optional_env('SINK_LOCK_TIMEOUT_MS', 30000))
+
+    sink = SINK_TYPES[sink_type](table_name, **spec)
+    sink.target_columns = target_columns
+    return sink
+
+
+class SinkFanout:
+    """
+    1回の抽出データを複数シンクへ並行書き込みするクラス
+
+    各シンクは専用スレッドと上限付きキューを持ち、供給側は1回の走査で全シンクへ配布する
+    """
+
+    _END = object()
+    # キュー操作の待機間隔（中断要求の確認間隔）
+    _POLL_SECONDS = 0.1
+    # 中断時にスレッドの終了を待つ秒数
+    _ABORT_JOIN_SECONDS = 30
+
+    def __init__(self, sinks, queue_size=4):
+        self.sinks = sinks
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in sinks]
+        self.threads = []
+        self.feeder = None
+        self.errors = {}
+        self.durations = {}
+        # 中断要求（供給スレッドと書き込みスレッドがキューの待機中にも確認する）
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """全シンクの begin / prepare_target を実行し、書き込みスレッドを起動"""
+        for sink in self.sinks:
+            sink.begin()
+            sink.prepare_target()
+
+        for sink, sink_queue in zip(self.sinks, self.queues):
+            thread = threading.Thread(
+                target=self._run_sink,
+                args=(sink, sink_queue),
+                name=f"sink-{sink.name}",
+                daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def _run_sink(self, sink, sink_queue):
+        start_time = datetime.now()
+        try:
+            sink.write_batches(self._iter_queue(sink_queue))
+        except Exception as e:
+            logger.error(f"シンク書き込み失敗 ({sink.name}): {str(e)}")
+            self.errors[sink.name] = str(e)
+            # 供給側がブロックしないよう残りを読み捨てる
+            for _ in self._iter_queue(sink_queue):
+                pass
+        finally:
+            self.durations[sink.name] = (datetime.now() - start_time).total_seconds()
+
+    def _iter_queue(self, sink_queue):
+        while not self.stop_event.is_set():
+            try:
+                batch = sink_queue.get(timeout=self._POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if batch is self._END:
+                return
+            yield batch
+
+    def _put(self, sink_queue, item):
+        """キューへ追加（満杯時は待機、中断要求があればFalse）"""
+        while not self.stop_event.is_set():
+            try:
+                sink_queue.put(item, timeout=self._POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def put(self, batch):
+        """バッチを全シンクへ配布（キュー満杯時は待機、中断要求があればFalse）"""
+        for sink_queue in self.queues:
+            if not self._put(sink_queue, batch):
+                return False
+        return True
+
+    def feed(self, batches):
+        """バッチのストリームを全シンクへ配布して入力を閉じる"""
+        try:
+            for batch in batches:
+                if not self.put(batch):
+                    return
+        finally:
+            for sink_queue in self.queues:
+                self._put(sink_queue, self._END)
+
+    def feed_async(self, batches):
+        """別スレッドでバッチを配布"""
+        self.feeder = threading.Thread(target=self.feed, args=(batches,), name="sink-feeder", daemon=True)
+        self.feeder.start()
+
+    def finish(self):
+        """
+        書き込み完了を待って各シンクを確定
+
+        Returns:
+            dict: シンク名 → 結果
+        """
+        if self.feeder:
+            self.feeder.join()
+        for thread in self.threads:
+            thread.join()
+
+        results = {}
+        for sink in self.sinks:
+            result = {
+                'sink_type': sink.sink_type,
+                'written_count': sink.written_count,
+                'execution_time': self.durations.get(sink.name, 0),
+                'success': False,
+                'error': self.errors.get(sink.name)
+            }
+            try:
+                if result['error']:
+                    sink.abort()
+                else:
+                    sink.finalize()
+                    result['success'] = True
+                    logger.info(f"シンク書き込み完了: {sink.name} {sink.written_count:,}件 "
+                              f"({result['execution_time']:.2f}秒)")
+            except Exception as e:
+                logger.error(f"シンク確定失敗 ({sink.name}): {str(e)}")
+                result['error'] = str(e)
+            finally:
+                sink.close()
+            results[sink.name] = result
+
+        return results
+
+    def abort(self):
+        """
+        全シンクの書き込みを中断
+
+        供給スレッドと書き込みスレッドの終了を待ってからシンクをロールバック・クローズする
+        （書き込み中の接続を閉じない。呼び出し元はこの後で抽出データのバッファを解放できる）
+        """
+        self.stop_event.set()
+        for sink_queue in self.queues:
+            while True:
+                try:
+                    sink_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+        threads = ([self.feeder] if self.feeder else []) + self.threads
+        for thread in threads:
+            thread.join(timeout=self._ABORT_JOIN_SECONDS)
+
+        for idx, sink in enumerate(self.sinks):
+            if idx < len(self.threads) and self.threads[idx].is_alive():
+                # 書き込み中のバッチが終わらない場合はクローズせずに残す（デーモンスレッドのため実行終了時に破棄）
+                logger.warning(f"シンク書き込みスレッドが終了しないためクローズを省略: {sink.name}")
+                continue
+            try:
+                sink.abort()
+                sink.close()
+            except Exception:
+                pass
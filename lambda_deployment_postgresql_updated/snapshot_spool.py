@@ -0,0 +1,246 @@
+"""
+抽出データのスプール（/tmp スナップショットキャッシュ）
+PostgreSQL側の失敗でリトライする際に、SQL Serverへ再クエリせずスプールから再ロードする
+"""
+
+import os
+import json
+import gzip
+import time
+import pickle
+import shutil
+import logging
+import threading
+from table_configs import get_table_spec
+from row_converters import build_row_converter
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# スプール保存先（Lambdaでは /tmp のみ書き込み可能）
+DEFAULT_SPOOL_DIR = '/tmp/spool'
+
+
+class SnapshotSpool:
+    """
+    テーブル単位・実行ID単位の抽出データスプール
+
+    {spool_dir}/{run_id}/{pg_table}.spool.gz にバッチ単位でpickleしたデータをgzip圧縮して保存し、
+    書き込み完了時に .meta.json を作成する（.meta.json が存在し、抽出クエリ・列・変換が一致するスプールのみ再利用可能）
+    書き込み中にスプール全体が上限サイズを超えた場合は書き込みを中止して破棄する（/tmp をスピルファイルと共有するため）
+    """
+
+    def __init__(self, table_name, run_id, spool_dir=None, max_bytes=None, max_age_seconds=None):
+        """
+        初期化
+
+        Args:
+            table_name (str): 同期対象テーブル名
+            run_id (str): 実行ID（同一IDのリトライでスプールを再利用）
+            spool_dir (str): スプール保存先
+            max_bytes (int): スプール全体の上限サイズ
+            max_age_seconds (int): 古い実行のスプールを削除するまでの秒数
+        """
+        self.table_name = table_name
+        spec = get_table_spec(table_name)
+        self.config = spec.config
+        self.run_id = str(run_id)
+        self.spool_dir = spool_dir or DatabaseConfig.get_optional_env('SPOOL_DIR', DEFAULT_SPOOL_DIR)
+        self.max_bytes = max_bytes or DatabaseConfig.get_optional_env('SPOOL_MAX_BYTES', 256 * 1024 * 1024)
+        self.max_age_seconds = max_age_seconds or DatabaseConfig.get_optional_env('SPOOL_MAX_AGE_SECONDS', 6 * 3600)
+
+        self.run_dir = os.path.join(self.spool_dir, self.run_id)
+        self.data_path = os.path.join(self.run_dir, f"{self.config['pg_table']}.spool.gz")
+        self.meta_path = os.path.join(self.run_dir, f"{self.config['pg_table']}.meta.json")
+        self.tmp_path = f"{self.data_path}.tmp"
+
+        # スプールの内容を決める抽出クエリ・列・行変換（異なる場合は再利用しない）
+        self.signature = {
+            'select_query': spec.select_query,
+            'columns': list(self.config['columns']),
+            'conversions': build_row_converter(self.config).describe(),
+            'source_timezone': DatabaseConfig.get_optional_env('SOURCE_TIMEZONE', '').strip()
+        }
+
+        self.writer_thread = None
+        self.write_error = None
+        self.written_count = 0
+        self.exceeded = False
+
+    def exists(self):
+        """書き込み完了済みのスプールが存在するか"""
+        return os.path.exists(self.meta_path) and os.path.exists(self.data_path)
+
+    def is_reusable(self):
+        """
+        再利用可能なスプールが存在するか（抽出クエリ・列・行変換がメタ情報と一致する場合のみ）
+
+        一致しないスプールは破棄する
+        """
+        if not self.exists():
+            return False
+        try:
+            signature = self.read_meta().get('signature')
+        except (OSError, ValueError) as e:
+            logger.warning(f"スプールのメタ情報を読み込めません: {self.meta_path} ({str(e)})")
+            signature = None
+        if signature != self.signature:
+            logger.warning(f"テーブル定義が異なるためスプールを再利用しません: {self.data_path}")
+            self.discard()
+            return False
+        return True
+
+    def read_meta(self):
+        """スプールのメタ情報を取得"""
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def iter_batches(self):
+        """スプールからバッチを順に読み出す"""
+        with gzip.open(self.data_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def read_all(self):
+        """スプールから全データを読み出す"""
+        rows = []
+        for batch in self.iter_batches():
+            rows.extend(batch)
+        return rows
+
+    def available_bytes(self):
+        """上限サイズのうち、このテーブル以外のスプールが使用していない残り"""
+        used = 0
+        own_files = {self.data_path, self.meta_path, self.tmp_path}
+        for root, _, file_names in os.walk(self.spool_dir):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                if path not in own_files:
+                    used += os.path.getsize(path)
+        return self.max_bytes - used
+
+    def write_batches(self, batches):
+        """
+        バッチのストリームをスプールへ書き込み、完了後にメタ情報を作成
+
+        上限サイズを超えた時点で書き込みを中止し、書きかけのファイルを削除する
+
+        Args:
+            batches (iterable): 行タプルのリストのイテラブル
+
+        Returns:
+            int: 書き込んだ件数（上限超過で中止した場合は0）
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.written_count = 0
+        self.exceeded = False
+        limit_bytes = self.available_bytes()
+        start_time = time.monotonic()
+
+        try:
+            with open(self.tmp_path, 'wb') as raw:
+                # 圧縮率より速度を優先（compresslevel=1）
+                with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+                    for batch in batches:
+                        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        self.written_count += len(batch)
+                        if raw.tell() > limit_bytes:
+                            self.exceeded = True
+                            break
+            if self.exceeded:
+                os.remove(self.tmp_path)
+                logger.warning(f"スプールの上限サイズを超えたため書き込みを中止: {self.data_path} "
+                               f"({self.written_count:,}件時点, 上限残り {limit_bytes / 1024 / 1024:.1f}MB)")
+                self.written_count = 0
+                return 0
+            os.replace(self.tmp_path, self.data_path)
+        except Exception:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            raise
+
+        meta = {
+            'table_name': self.table_name,
+            'run_id': self.run_id,
+            'signature': self.signature,
+            'row_count': self.written_count,
+            'bytes': os.path.getsize(self.data_path),
+            'created_at': time.time()
+        }
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        duration = time.monotonic() - start_time
+        logger.info(f"スプール書き込み完了: {self.data_path} {self.written_count:,}件 "
+                    f"({meta['bytes'] / 1024 / 1024:.1f}MB, {duration:.2f}秒)")
+        return self.written_count
+
+    def write_async(self, batches):
+        """別スレッドでスプールへ書き込む"""
+        def run():
+            try:
+                self.write_batches(batches)
+            except Exception as e:
+                logger.error(f"スプール書き込み失敗 ({self.table_name}): {str(e)}")
+                self.write_error = str(e)
+
+        self.writer_thread = threading.Thread(target=run, name=f"spool-{self.table_name}", daemon=True)
+        self.writer_thread.start()
+
+    def wait(self):
+        """非同期書き込みの完了を待つ"""
+        if self.writer_thread:
+            self.writer_thread.join()
+            self.writer_thread = None
+        return self.write_error is None
+
+    def discard(self):
+        """このテーブルのスプールを削除"""
+        for path in (self.meta_path, self.data_path, self.tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+        try:
+            os.rmdir(self.run_dir)
+        except OSError:
+            pass
+
+    def evict_old_runs(self):
+        """
+        期限切れ・上限超過のスプールを古い実行から削除（現在の実行IDは残す）
+
+        Returns:
+            list: 削除した実行ID
+        """
+        if not os.path.isdir(self.spool_dir):
+            return []
+
+        runs = []
+        for run_id in os.listdir(self.spool_dir):
+            run_dir = os.path.join(self.spool_dir, run_id)
+            if not os.path.isdir(run_dir):
+                continue
+            size = 0
+            for file_name in os.listdir(run_dir):
+                size += os.path.getsize(os.path.join(run_dir, file_name))
+            runs.append((os.path.getmtime(run_dir), run_id, run_dir, size))
+
+        runs.sort()
+        total_bytes = sum(run[3] for run in runs)
+        now = time.time()
+        evicted = []
+
+        for mtime, run_id, run_dir, size in runs:
+            if run_id == self.run_id:
+                continue
+            if total_bytes <= self.max_bytes and now - mtime <= self.max_age_seconds:
+                continue
+            shutil.rmtree(run_dir, ignore_errors=True)
+            total_bytes -= size
+            evicted.append(run_id)
+
+        if evicted:
+            logger.info(f"古いスプールを削除: {evicted} (残り {total_bytes / 1024 / 1024:.1f}MB)")
+        return evicted
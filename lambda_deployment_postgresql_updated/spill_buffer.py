@@ -0,0 +1,289 @@
+"""
+ディスク退避（スピル）行バッファ
+抽出データをコンパクトなバイナリ形式で /tmp のファイルに書き込み、mmap 経由でバッチ単位に読み出す
+メモリに収まらないテーブルでもLambdaをOOMで落とさず、ディスク速度まで劣化させて処理を継続する
+"""
+
+import os
+import mmap
+import uuid
+import struct
+import logging
+import tempfile
+import threading
+from decimal import Decimal
+from datetime import datetime, date, time, timedelta
+
+logger = logging.getLogger(__name__)
+
+# スピルファイル保存先（Lambdaでは /tmp のみ書き込み可能）
+DEFAULT_SPILL_DIR = '/tmp'
+
+# 値の型タグ
+TAG_NULL = 0
+TAG_INT = 1
+TAG_FLOAT = 2
+TAG_STR = 3
+TAG_BYTES = 4
+TAG_TRUE = 5
+TAG_FALSE = 6
+TAG_DECIMAL = 7
+TAG_DATETIME = 8
+TAG_DATE = 9
+TAG_TIME = 10
+TAG_UUID = 11
+TAG_DATETIME_TZ = 12
+TAG_BIGINT = 13
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_EPOCH = datetime(1970, 1, 1)
+
+_TAG = struct.Struct('<B')
+_TAG_INT64 = struct.Struct('<Bq')
+_TAG_FLOAT64 = struct.Struct('<Bd')
+_TAG_UINT32 = struct.Struct('<BI')
+_TAG_INT32 = struct.Struct('<Bi')
+_BATCH_HEADER = struct.Struct('<II')  # 行数, ペイロードバイト数
+_COLUMN_COUNT = struct.Struct('<H')
+
+
+def _encode_text(tag, text, out):
+    data = text.encode('utf-8')
+    out += _TAG_UINT32.pack(tag, len(data))
+    out += data
+
+
+def _encode_value(value, out):
+    """1値をタグ付きバイナリとして out (bytearray) に追記"""
+    if value is None:
+        out += _TAG.pack(TAG_NULL)
+        return
+
+    value_type = type(value)
+
+    if value_type is str:
+        _encode_text(TAG_STR, value, out)
+    elif value_type is bool:
+        out += _TAG.pack(TAG_TRUE if value else TAG_FALSE)
+    elif value_type is int:
+        if _INT64_MIN <= value <= _INT64_MAX:
+            out += _TAG_INT64.pack(TAG_INT, value)
+        else:
+            _encode_text(TAG_BIGINT, str(value), out)
+    elif value_type is float:
+        out += _TAG_FLOAT64.pack(TAG_FLOAT, value)
+    elif value_type is Decimal:
+        _encode_text(TAG_DECIMAL, str(value), out)
+    elif value_type is datetime:
+        if value.tzinfo is None:
+            delta = value - _EPOCH
+            micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+            out += _TAG_INT64.pack(TAG_DATETIME, micros)
+        else:
+            _encode_text(TAG_DATETIME_TZ, value.isoformat(), out)
+    elif value_type is date:
+        out += _TAG_INT32.pack(TAG_DATE, value.toordinal())
+    elif value_type is time:
+        _encode_text(TAG_TIME, value.isoformat(), out)
+    elif value_type in (bytes, bytearray, memoryview):
+        data = bytes(value)
+        out += _TAG_UINT32.pack(TAG_BYTES, len(data))
+        out += data
+    elif value_type is uuid.UUID:
+        out += _TAG.pack(TAG_UUID)
+        out += value.bytes
+    else:
+        _encode_text(TAG_STR, str(value), out)
+
+
+def encode_batch(rows):
+    """
+    行タプルのリストをバイナリ形式にエンコード
+
+    Returns:
+        bytes: [列数(uint16)] + 行ごとに列数分のタグ付き値
+    """
+    out = bytearray()
+    if not rows:
+        return bytes(out)
+
+    out += _COLUMN_COUNT.pack(len(rows[0]))
+    for row in rows:
+        for value in row:
+            _encode_value(value, out)
+    return bytes(out)
+
+
+def decode_batch(buffer, offset, row_count):
+    """
+    バイナリ形式からバッチ（行タプルのリスト）をデコード
+
+    Args:
+        buffer: mmap または bytes
+        offset (int): バッチペイロードの開始位置
+        row_count (int): 行数
+
+    Returns:
+        list: 行タプルのリスト
+    """
+    if row_count == 0:
+        return []
+
+    unpack_from = struct.unpack_from
+    (column_count,) = _COLUMN_COUNT.unpack_from(buffer, offset)
+    pos = offset + _COLUMN_COUNT.size
+    rows = []
+
+    for _ in range(row_count):
+        row = []
+        for _ in range(column_count):
+            tag = buffer[pos]
+            pos += 1
+            if tag == TAG_NULL:
+                row.append(None)
+            elif tag == TAG_INT:
+                row.append(unpack_from('<q', buffer, pos)[0])
+                pos += 8
+            elif tag == TAG_STR:
+                (length,) = unpack_from('<I', buffer, pos)
+                pos += 4
+                row.append(buffer[pos:pos + length].decode('utf-8'))
+                pos += length
+            elif tag == TAG_TRUE:
+                row.append(True)
+            elif tag == TAG_FALSE:
+                row.append(False)
+            elif tag == TAG_DATETIME:
+                row.append(_EPOCH + timedelta(microseconds=unpack_from('<q', buffer, pos)[0]))
+                pos += 8
+            elif tag == TAG_FLOAT:
+                row.append(unpack_from('<d', buffer, pos)[0])
+                pos += 8
+            elif tag == TAG_DATE:
+                row.append(date.fromordinal(unpack_from('<i', buffer, pos)[0]))
+                pos += 4
+            elif tag == TAG_UUID:
+                row.append(uuid.UUID(bytes=bytes(buffer[pos:pos + 16])))
+                pos += 16
+            else:
+                (length,) = unpack_from('<I', buffer, pos)
+                pos += 4
+                data = buffer[pos:pos + length]
+                pos += length
+                if tag == TAG_BYTES:
+                    row.append(bytes(data))
+                elif tag == TAG_DECIMAL:
+                    row.append(Decimal(data.decode('ascii')))
+                elif tag == TAG_BIGINT:
+                    row.append(int(data.decode('ascii')))
+                elif tag == TAG_DATETIME_TZ:
+                    row.append(datetime.fromisoformat(data.decode('ascii')))
+                elif tag == TAG_TIME:
+                    row.append(time.fromisoformat(data.decode('ascii')))
+                else:
+                    raise ValueError(f"不正な型タグ: {tag} (位置: {pos})")
+        rows.append(tuple(row))
+
+    return rows
+
+
+class SpillBuffer:
+    """
+    ディスク退避型の行バッファ
+
+    append_batch でバッチを追記し、seal 後は iter_batches で mmap からバッチ単位に読み出す
+    （メモリ上にはバッチ位置のインデックスのみ保持し、行オブジェクトは読み出し中のバッチ分だけ生成する）
+    複数スレッドからの同時読み出しに対応（シンク・スプールへの並行書き込み用）
+    """
+
+    def __init__(self, table_name, spill_dir=None):
+        self.table_name = table_name
+        spill_dir = spill_dir or DEFAULT_SPILL_DIR
+        os.makedirs(spill_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=f"spill_{table_name}_", suffix='.bin', dir=spill_dir)
+        self.file = os.fdopen(fd, 'wb')
+        self.index = []  # (ペイロード開始位置, 行数)
+        self.row_count = 0
+        self.byte_count = 0
+        self.mmap = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.row_count
+
+    def append_batch(self, rows):
+        """バッチをエンコードしてファイルに追記"""
+        if self.mmap is not None:
+            raise RuntimeError("seal済みのスピルバッファには追記できません")
+        if not rows:
+            return
+
+        payload = encode_batch(rows)
+        self.file.write(_BATCH_HEADER.pack(len(rows), len(payload)))
+        self.index.append((self.byte_count + _BATCH_HEADER.size, len(rows)))
+        self.file.write(payload)
+        self.byte_count += _BATCH_HEADER.size + len(payload)
+        self.row_count += len(rows)
+
+    def seal(self):
+        """書き込みを終了し、読み出し用にmmapを開く"""
+        with self.lock:
+            if self.mmap is not None:
+                return
+            self.file.close()
+            if self.byte_count == 0:
+                return
+            with open(self.path, 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            logger.info(f"スピルバッファ確定: {self.path} {self.row_count:,}件 "
+                        f"({self.byte_count / 1024 / 1024:.1f}MB, {len(self.index)}バッチ)")
+
+    def iter_batches(self, batch_size=None):
+        """
+        バッチ単位で行を読み出す
+
+        Args:
+            batch_size (int): 読み出しバッチサイズ（Noneの場合は書き込み時のバッチ単位）
+        """
+        self.seal()
+        if self.mmap is None:
+            return
+
+        pending = []
+        for offset, row_count in self.index:
+            rows = decode_batch(self.mmap, offset, row_count)
+            if batch_size is None:
+                yield rows
+                continue
+
+            pending.extend(rows)
+            if len(pending) < batch_size:
+                continue
+            full_size = len(pending) - len(pending) % batch_size
+            for start_idx in range(0, full_size, batch_size):
+                yield pending[start_idx:start_idx + batch_size]
+            pending = pending[full_size:]
+
+        if pending:
+            yield pending
+
+    def __iter__(self):
+        for rows in self.iter_batches():
+            yield from rows
+
+    def close(self):
+        """mmapとファイルを削除"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+            # mmap中でもファイル削除は可能（ディスク領域はmmap解放時に回収）
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            if self.mmap is not None:
+                try:
+                    self.mmap.close()
+                    self.mmap = None
+                except BufferError:
+                    # 他スレッドが読み出し中（中断時）の場合はGC時に解放
+                    logger.warning(f"スピルバッファ読み出し中のためmmap解放を延期: {self.path}")
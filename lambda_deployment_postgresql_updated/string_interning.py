@@ -0,0 +1,58 @@
+"""
+低カーディナリティ列の値共有（インターン）処理
+Carrier / UAType などの少数の値が繰り返される列について、行ごとに生成される文字列オブジェクトを
+テーブル単位の辞書で1つに共有し、抽出データのメモリ使用量を削減する
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnInterner:
+    """指定列の値をテーブル単位の辞書で共有オブジェクトに置き換えるクラス"""
+
+    def __init__(self, column_names, target_columns):
+        """
+        初期化
+
+        Args:
+            column_names (list): 行タプルの列名（並び順）
+            target_columns (iterable): インターン対象の列名
+        """
+        target_columns = set(target_columns or ())
+        self.column_names = list(column_names)
+        self.indexes = [idx for idx, name in enumerate(self.column_names) if name in target_columns]
+        self.dictionaries = {idx: {} for idx in self.indexes}
+
+    @property
+    def enabled(self):
+        return bool(self.indexes)
+
+    def intern_rows(self, rows):
+        """
+        行タプルのリストの対象列を共有オブジェクトに置き換える
+
+        Args:
+            rows (list): pymssqlから取得した行のリスト
+
+        Returns:
+            list: 行タプルのリスト
+        """
+        if not self.indexes:
+            return [tuple(row) for row in rows]
+
+        targets = [(idx, self.dictionaries[idx]) for idx in self.indexes]
+        interned_rows = []
+        for row in rows:
+            row = list(row)
+            for idx, dictionary in targets:
+                value = row[idx]
+                if value is not None:
+                    row[idx] = dictionary.setdefault(value, value)
+            interned_rows.append(tuple(row))
+        return interned_rows
+
+    def stats(self):
+        """列ごとの異なり数"""
+        return {self.column_names[idx]: len(self.dictionaries[idx]) for idx in self.indexes}
@@ -3,6 +3,11 @@
 SQL Server → PostgreSQL データ同期処理用のテーブル設定
 """
 
+from types import MappingProxyType
+
+# column_types に指定可能な型（変換が必要なSQL Server側の型。timestamptz はPostgreSQL側が timestamptz の日時列）
+COLUMN_TYPES = ('bit', 'datetime', 'timestamptz', 'uniqueidentifier', 'json')
+
 # テーブル設定辞書
 TABLE_CONFIGS = {
     # 既存テーブル: Customer (McTM)
@@ -22,6 +27,8 @@ TABLE_CONFIGS = {
         'primary_key': 'CD',
         'order_by': 'CD',
         'batch_size': 10000,
+        # 変換が必要な列のSQL Server側の型（bit / datetime / timestamptz / uniqueidentifier / json）
+        'column_types': {'CreationTime': 'datetime', 'ModifiedTime': 'datetime'},
         'description': 'McTM顧客マスタ'
     },
     
@@ -48,6 +55,14 @@ TABLE_CONFIGS = {
         'primary_key': 'ID',
         'order_by': 'ID',
         'batch_size': 10000,
+        # 少数の値が繰り返される列（抽出時に値を共有し、カラムナ形式では辞書エンコード）
+        'dictionary_columns': ['Carrier', 'IIJ_SvcCode1', 'IIJ_SvcCode2'],
+        'column_types': {
+            'IsDeleted': 'bit', 'CreationTime': 'datetime', 'ModifiedTime': 'datetime',
+            'DeletedTime': 'datetime', 'ReceivedTime': 'datetime'
+        },
+        # 同期間隔（秒）: 前回成功からこの時間が経過したmulti_sync実行でのみ同期（未指定は毎回）
+        'min_interval': 3600,
         'description': 'McTMモジュール管理'
     },
     
@@ -82,6 +97,12 @@ TABLE_CONFIGS = {
         'primary_key': 'Cd',
         'order_by': 'Cd',
         'batch_size': 10000,
+        'dictionary_columns': ['RouteMode'],
+        'column_types': {
+            'IsSuspended': 'bit', 'AttributeJson': 'json',
+            'SmaphoTrialFrom': 'datetime', 'SmaphoTrialTo': 'datetime'
+        },
+        'min_interval': 86400,
         'description': 'VoipDB顧客情報'
     },
     
@@ -112,6 +133,10 @@ TABLE_CONFIGS = {
         'primary_key': 'Id',
         'order_by': 'Id',
         'batch_size': 10000,
+        'dictionary_columns': ['UAType', 'Network', 'ProductType', 'ProductVersion'],
+        'column_types': {
+            'IsStateListener': 'bit', 'IsSmaphoTrialLicense': 'bit', 'AttributeJson': 'json'
+        },
         'description': 'VoipDBユーザーエージェント'
     }
 }
@@ -123,11 +148,117 @@ DEFAULT_SYNC_ORDER = ['customer', 'mctm_module', 'voipdb_customer', 'voipdb_user
 # すべての接続情報は環境変数から取得します
 # config.py モジュールを使用して設定を取得してください
 
-def get_table_config(table_name):
-    """指定されたテーブルの設定を取得"""
-    if table_name not in TABLE_CONFIGS:
+# 検証済みのテーブル定義（初回参照時に全テーブル分を作成）
+_TABLE_SPECS = {}
+
+
+def freeze_config(config):
+    """テーブル設定の読み取り専用のコピー（リストはタプル、辞書は MappingProxyType）"""
+    def freeze(value):
+        if isinstance(value, dict):
+            return MappingProxyType({key: freeze(item) for key, item in value.items()})
+        if isinstance(value, list):
+            return tuple(freeze(item) for item in value)
+        return value
+    return freeze(config)
+
+
+class TableSpec:
+    """
+    検証済みのテーブル定義（生成後は変更不可）
+    
+    テーブル設定から列のインデックスと、同期処理で使うSQL文（SELECT / 範囲SELECT / COPY / INSERT /
+    件数）を1度だけ生成し、すべての処理で共有する
+    設定・インデックスは読み取り専用のコピーを保持し、TABLE_CONFIGS の辞書とは共有しない
+    """
+    
+    __slots__ = (
+        'name', 'config', 'sql_table', 'pg_table', 'columns', 'pg_columns', 'primary_key', 'pg_primary_key',
+        'key_index', 'column_index', 'pg_column_index', 'batch_size',
+        'sql_columns_sql', 'pg_columns_sql', 'select_query', 'range_select_queries', 'copy_statement',
+        'insert_query', 'count_query', 'source_count_query', 'select_by_keys_query'
+    )
+    
+    def __init__(self, table_name, config):
+        validate_config(table_name, config)
+        config = freeze_config(config)
+        
+        columns = tuple(config['columns'])
+        pg_columns = tuple(config['pg_columns'])
+        key_index = columns.index(config['primary_key'])
+        sql_columns_sql = ", ".join([f"[{col}]" for col in columns])
+        pg_columns_sql = ", ".join([f'"{col}"' for col in pg_columns])
+        sql_key = f"[{config['primary_key']}]"
+        pg_key = f'"{pg_columns[key_index]}"'
+        sql_select = f"SELECT {sql_columns_sql} FROM {config['sql_table']} WITH (NOLOCK)"
+        
+        # 主キー範囲 [key_from, key_to) のSELECT（下限・上限の有無ごと）
+        range_select_queries = {}
+        for has_from in (False, True):
+            for has_to in (False, True):
+                conditions = ([f"{sql_key} >= %s"] if has_from else []) + ([f"{sql_key} < %s"] if has_to else [])
+                where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+                range_select_queries[(has_from, has_to)] = f"{sql_select}{where} ORDER BY {sql_key}"
+        
+        values = {
+            'name': table_name,
+            'config': config,
+            'sql_table': config['sql_table'],
+            'pg_table': config['pg_table'],
+            'columns': columns,
+            'pg_columns': pg_columns,
+            'primary_key': config['primary_key'],
+            'pg_primary_key': pg_columns[key_index],
+            'key_index': key_index,
+            'column_index': MappingProxyType({col: idx for idx, col in enumerate(columns)}),
+            'pg_column_index': MappingProxyType({col: idx for idx, col in enumerate(pg_columns)}),
+            'batch_size': config['batch_size'],
+            'sql_columns_sql': sql_columns_sql,
+            'pg_columns_sql': pg_columns_sql,
+            'select_query': f"{sql_select} ORDER BY [{config['order_by']}]",
+            'range_select_queries': MappingProxyType(range_select_queries),
+            'copy_statement': f"COPY {config['pg_table']} ({pg_columns_sql}) FROM STDIN WITH (FORMAT text)",
+            'insert_query': f"INSERT INTO {config['pg_table']} ({pg_columns_sql}) VALUES %s",
+            'count_query': f"SELECT COUNT(*) FROM {config['pg_table']}",
+            'source_count_query': f"SELECT COUNT(*) FROM {config['sql_table']} WITH (NOLOCK)",
+            'select_by_keys_query': f"SELECT {pg_columns_sql} FROM {config['pg_table']} WHERE {pg_key} = ANY(%s)",
+        }
+        for slot, value in values.items():
+            object.__setattr__(self, slot, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"TableSpec は変更できません: {self.name}.{name}")
+    
+    def __repr__(self):
+        return f"TableSpec({self.name!r}, {self.sql_table} → {self.pg_table})"
+    
+    def range_select_query(self, key_from, key_to):
+        """
+        主キー範囲 [key_from, key_to) を抽出するSELECT文とパラメータ
+        
+        Returns:
+            tuple: (SQL文, パラメータのタプルまたはNone)
+        """
+        params = tuple(key for key in (key_from, key_to) if key is not None)
+        return self.range_select_queries[(key_from is not None, key_to is not None)], params or None
+
+
+def get_table_spec(table_name):
+    """
+    検証済みのテーブル定義を取得（初回参照時に全テーブル分を検証・生成）
+    
+    Returns:
+        TableSpec: テーブル定義
+    """
+    if not _TABLE_SPECS:
+        _TABLE_SPECS.update({name: TableSpec(name, config) for name, config in TABLE_CONFIGS.items()})
+    if table_name not in _TABLE_SPECS:
         raise ValueError(f"未知のテーブル名: {table_name}")
-    return TABLE_CONFIGS[table_name]
+    return _TABLE_SPECS[table_name]
+
+def get_table_config(table_name):
+    """指定されたテーブルの設定を取得（読み取り専用）"""
+    return get_table_spec(table_name).config
 
 def get_available_tables():
     """利用可能なテーブル一覧を取得"""
@@ -135,8 +266,12 @@ def get_available_tables():
 
 def validate_table_config(table_name):
     """テーブル設定の妥当性チェック"""
-    config = get_table_config(table_name)
-    
+    if table_name not in TABLE_CONFIGS:
+        raise ValueError(f"未知のテーブル名: {table_name}")
+    return validate_config(table_name, TABLE_CONFIGS[table_name])
+
+def validate_config(table_name, config):
+    """テーブル設定（辞書）の妥当性チェック"""
     required_fields = [
         'db_type', 'sql_server_db', 'sql_table', 'pg_table',
         'columns', 'pg_columns', 'primary_key', 'order_by', 'batch_size'
@@ -149,32 +284,33 @@ def validate_table_config(table_name):
     if len(config['columns']) != len(config['pg_columns']):
         raise ValueError(f"テーブル '{table_name}' のカラム数が一致しません")
     
-    return True
-
-def get_sql_query(table_name):
-    """指定されたテーブル用のSQLクエリを生成"""
-    config = get_table_config(table_name)
+    for field in ('primary_key', 'order_by'):
+        if config[field] not in config['columns']:
+            raise ValueError(f"テーブル '{table_name}' の {field} '{config[field]}' が columns にありません")
     
-    # カラム名を配列から文字列に変換
-    columns_str = ", ".join([f"[{col}]" for col in config['columns']])
+    for col in config.get('dictionary_columns', []):
+        if col not in config['columns']:
+            raise ValueError(f"テーブル '{table_name}' の dictionary_columns に未知のカラム '{col}' があります")
     
-    query = f"""
-    SELECT {columns_str}
-    FROM {config['sql_table']} WITH (NOLOCK)
-    ORDER BY [{config['order_by']}]
-    """
+    for col, column_type in config.get('column_types', {}).items():
+        if col not in config['columns']:
+            raise ValueError(f"テーブル '{table_name}' の column_types に未知のカラム '{col}' があります")
+        if column_type not in COLUMN_TYPES:
+            raise ValueError(f"テーブル '{table_name}' の column_types に未対応の型 '{column_type}' があります")
     
-    return query.strip()
+    min_interval = config.get('min_interval', 0)
+    if not isinstance(min_interval, int) or min_interval < 0:
+        raise ValueError(f"テーブル '{table_name}' の min_interval は0以上の整数（秒）で指定してください")
+    
+    return True
+
+def get_sql_query(table_name):
+    """指定されたテーブル用のSQLクエリを取得"""
+    return get_table_spec(table_name).select_query
 
 def get_pg_insert_query(table_name):
-    """指定されたテーブル用のPostgreSQL INSERTクエリを生成"""
-    config = get_table_config(table_name)
-    
-    # PostgreSQLカラム名（引用符付き）
-    pg_columns_quoted = [f'"{col}"' for col in config['pg_columns']]
-    columns_str = ", ".join(pg_columns_quoted)
-    
-    return f"INSERT INTO {config['pg_table']} ({columns_str}) VALUES %s"
+    """指定されたテーブル用のPostgreSQL INSERTクエリを取得"""
+    return get_table_spec(table_name).insert_query
 
 # 設定の妥当性チェック実行
 if __name__ == '__main__':
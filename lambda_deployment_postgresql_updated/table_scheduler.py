@@ -0,0 +1,54 @@
+"""
+テーブル同期のスケジューリング
+実行履歴から予測したテーブルごとの所要時間をもとに、LPT（Longest Processing Time first）法で
+ワーカーへテーブルを割り当て、全体の完了時間（メイクスパン）を短縮する
+"""
+
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 履歴が1件もない場合の仮の所要時間（秒）
+DEFAULT_PREDICTED_DURATION = 60.0
+
+
+def lpt_schedule(table_names, predicted_durations, worker_count):
+    """
+    所要時間の長いテーブルから順に、その時点で負荷が最小のワーカーへ割り当てる
+
+    Args:
+        table_names (list): 対象テーブル（予測が同じ場合はこの順序を維持）
+        predicted_durations (dict): テーブル名 → 予測所要時間（秒）。履歴のないテーブルは既知の平均で補完
+        worker_count (int): ワーカー数
+
+    Returns:
+        dict: bins（ワーカーごとのテーブルリスト）, loads（ワーカーごとの予測時間）,
+              durations（補完後の予測所要時間）, predicted_makespan
+    """
+    worker_count = max(1, min(int(worker_count), len(table_names) or 1))
+    known = [predicted_durations[t] for t in table_names if t in predicted_durations]
+    fallback = sum(known) / len(known) if known else DEFAULT_PREDICTED_DURATION
+    durations = {t: float(predicted_durations.get(t, fallback)) for t in table_names}
+
+    order = sorted(range(len(table_names)), key=lambda idx: (-durations[table_names[idx]], idx))
+    bins = [[] for _ in range(worker_count)]
+    loads = [0.0] * worker_count
+    heap = [(0.0, worker_idx) for worker_idx in range(worker_count)]
+
+    for idx in order:
+        load, worker_idx = heapq.heappop(heap)
+        table_name = table_names[idx]
+        bins[worker_idx].append(table_name)
+        loads[worker_idx] = load + durations[table_name]
+        heapq.heappush(heap, (loads[worker_idx], worker_idx))
+
+    predicted_makespan = max(loads) if loads else 0.0
+    logger.info(f"LPTスケジュール: {worker_count}ワーカー, 予測メイクスパン {predicted_makespan:.1f}秒 "
+                f"({', '.join(f'{b}' for b in bins)})")
+    return {
+        'bins': bins,
+        'loads': loads,
+        'durations': durations,
+        'predicted_makespan': predicted_makespan
+    }
@@ -6,35 +6,101 @@ SQL Server → PostgreSQL の単一テーブル同期を担当
 import os
 import pymssql
 import psycopg2
-from psycopg2 import extras
 import json
 import logging
 from datetime import datetime
-from table_configs import (
-    get_table_config, 
-    get_sql_query, 
-    get_pg_insert_query
-)
+from table_configs import get_table_spec
 from config import DatabaseConfig, ConfigurationError
+from sinks import create_sink, iter_batches, SinkFanout, PostgreSQLSink
+from snapshot_spool import SnapshotSpool
+from spill_buffer import SpillBuffer
+from columnar_batch import ColumnarBatch, ColumnarBuffer, iter_columnar_batches
+from copy_format import CopyStream
+from string_interning import ColumnInterner
+from content_validator import ContentValidator
+from sample_validator import SampleValidator
+from db_connections import (
+    POSTGRESQL_SOURCE, create_sql_server_connection, create_postgresql_connection, acquire_table_lock,
+    take_preopened_connection
+)
+from row_converters import build_row_converter
+from batch_tuning import AdaptiveBatchSizer, BatchSizeStore, estimate_row_bytes, iter_adaptive_batches
+from schema_drift import SchemaDriftError, check_schema, fetch_target_columns
+from transform_pool import TransformPool, get_transform_worker_count
+from tracing import trace_span, trace_set, traced
+from batch_anomaly import SlowBatchDetector, capture_postgresql_diagnostics, capture_sql_server_diagnostics
 
 logger = logging.getLogger(__name__)
 
 class TableSyncProcessor:
     """単一テーブルの同期処理を行うクラス"""
     
-    def __init__(self, table_name):
+    def __init__(self, table_name, options=None, connections=None):
         """
         初期化
         
         Args:
             table_name (str): 同期対象テーブル名
+            options (dict): 同期オプション（Lambdaイベントから取得）
+                sinks (list): PostgreSQLと同時に書き込む追加シンク指定
+                spool (bool): 抽出データを /tmp にスプールし、同一run_idのリトライで再利用
+                run_id (str): 実行ID（スプールのキー）
+                spill (bool | int): 抽出データを /tmp のスピルバッファへ退避
+                    （true: 常に退避、整数: 件数がこれを超えたら退避）
+                columnar (bool): 抽出データをカラムナ形式（列ごとの配列）で保持
+                load_method (str): PostgreSQLへのロード方式 'insert'（既定）、'copy'、
+                    または 'stream'（抽出データを保持せずSQL ServerからCOPYへ直接流す）
+                validation (str): 'count'（既定、件数のみ）、'content'（主キー範囲ハッシュによる内容検証を追加）
+                    または 'sample'（hash(pk) mod N のサンプル行を列単位で比較）
+                sample_modulus (int): サンプリング検証の間隔N（既定1000、約 1/N の行を比較）
+                deep_validate (bool): 件数検証をロード件数ではなく SELECT COUNT(*) で行う
+                analyze (bool): コミット後にANALYZEし、pg_class.reltuples で件数を簡易チェック
+                lock_wait (float): 同じpg_tableを同期中の他の実行がある場合の待機秒数（既定0: 待機せずスキップ）
+                adaptive_batch (bool): 抽出の取得サイズとロードのバッチサイズを計測値から調整し、テーブルごとに保存
+                transform_workers (bool | int): COPYロード時のCOPY形式へのエンコードを子プロセスで並列実行
+                    （true: vCPU数、整数: ワーカー数）
+                schema_check (bool): 列定義のハッシュを前回実行時と比較し、同期対象列がなければ転送前に中止
+                schema_migrate (bool): schema_check に加え、PostgreSQLにない同期対象列を追加
+                slow_batch (bool): 取得・ロードの遅いバッチ（中央値・MADからの外れ値）を検出し、
+                    検出時に PostgreSQL / SQL Server の実行中セッション・ロック・待機の状態を結果に残す
+            connections (dict): 呼び出し元が開いた共有接続（'sql_server' / 'postgresql'）
+                共有接続はこのクラスではクローズしない
         """
         self.table_name = table_name
-        self.config = get_table_config(table_name)
-        self.sql_conn = None
-        self.pg_conn = None
+        self.spec = get_table_spec(table_name)
+        self.config = self.spec.config
+        self.options = options or {}
+        connections = connections or {}
+        self.sql_conn = connections.get('sql_server')
+        self.pg_conn = connections.get('postgresql')
         self.sql_cursor = None
         self.pg_cursor = None
+        # 自身で開いた接続のみクローズする
+        self.owns_sql_conn = self.sql_conn is None
+        self.owns_pg_conn = self.pg_conn is None
+        self.row_buffer = None
+        self.loaded_count = 0
+        # 低カーディナリティ列（dictionary_columns）の値共有
+        self.interner = ColumnInterner(self.config['columns'], self.config.get('dictionary_columns'))
+        # 列型（column_types）に応じた型変換（テーブルごとに変換関数を生成）
+        self.row_converter = build_row_converter(self.config)
+        # COPYデータ変換の並列ワーカー数（型変換は抽出時に行い、ワーカーはCOPY形式へのエンコードのみ）
+        if self.options.get('load_method', 'insert') == 'copy':
+            self.transform_workers = get_transform_worker_count(self.options.get('transform_workers'))
+        else:
+            self.transform_workers = 0
+        # 適応的バッチサイズ（adaptive_batch 有効時に load_batch_tuning で初期化）
+        self.fetch_sizer = None
+        self.load_sizer = None
+        # 遅いバッチの検出（slow_batch 有効時）
+        if self.options.get('slow_batch'):
+            self.fetch_detector = SlowBatchDetector('fetch')
+            self.load_detector = SlowBatchDetector('load')
+        else:
+            self.fetch_detector = None
+            self.load_detector = None
+        self.sql_session_id = None
+        self.slow_batches = []
         
     def get_sql_server_config(self):
         """SQL Server接続設定を取得"""
@@ -61,23 +127,31 @@ class TableSyncProcessor:
         except ConfigurationError as e:
             raise RuntimeError(f"PostgreSQL設定エラー ({self.table_name}): {str(e)}")
     
+    @traced('connect_sql_server')
     def connect_sql_server(self):
         """SQL Serverに接続"""
+        if self.sql_conn is not None and not self.owns_sql_conn:
+            # 事前に開かれた共有接続を使用
+            if self.sql_cursor is None:
+                self.sql_cursor = self.sql_conn.cursor(as_dict=False)
+            logger.info("SQL Server共有接続を使用")
+            return True
+        
+        # Lambda初期化フェーズで事前に開いた接続があれば使用
+        preopened_conn = take_preopened_connection(self.config['db_type'], self.config['sql_server_db'])
+        if preopened_conn is not None:
+            self.sql_conn = preopened_conn
+            self.owns_sql_conn = True
+            self.sql_cursor = self.sql_conn.cursor(as_dict=False)
+            return True
+        
         sql_config = self.get_sql_server_config()
         
         logger.info(f"SQL Serverへの接続開始: {sql_config['host']}:{sql_config['port']}/{sql_config['database']}")
         
         try:
-            self.sql_conn = pymssql.connect(
-                server=sql_config['host'],
-                user=sql_config['user'],
-                password=sql_config['password'],
-                database=sql_config['database'],
-                port=sql_config['port'],
-                timeout=sql_config['timeout'],
-                login_timeout=sql_config['login_timeout'],
-                charset=sql_config['charset']
-            )
+            self.sql_conn = create_sql_server_connection(sql_config)
+            self.owns_sql_conn = True
             self.sql_cursor = self.sql_conn.cursor(as_dict=False)
             logger.info("SQL Server接続成功")
             return True
@@ -86,21 +160,33 @@ class TableSyncProcessor:
             logger.error(f"SQL Server接続失敗: {str(e)}")
             raise
     
+    @traced('connect_postgresql')
     def connect_postgresql(self):
         """PostgreSQLに接続"""
+        if self.pg_conn is not None and not self.owns_pg_conn:
+            if not self.pg_conn.closed:
+                # 事前に開かれた共有接続を使用
+                if self.pg_cursor is None:
+                    self.pg_cursor = self.pg_conn.cursor()
+                logger.info("PostgreSQL共有接続を使用")
+                return True
+            # 前のテーブルの処理中に切断された場合は自身で接続し直す
+            logger.warning("PostgreSQL共有接続が切断されているため再接続します")
+        
+        preopened_conn = take_preopened_connection(POSTGRESQL_SOURCE)
+        if preopened_conn is not None:
+            self.pg_conn = preopened_conn
+            self.owns_pg_conn = True
+            self.pg_cursor = self.pg_conn.cursor()
+            return True
+        
         pg_config = self.get_postgresql_config()
         
         logger.info(f"PostgreSQLへの接続開始: {pg_config['host']}:{pg_config['port']}/{pg_config['database']}")
         
         try:
-            self.pg_conn = psycopg2.connect(
-                host=pg_config['host'],
-                dbname=pg_config['database'],
-                user=pg_config['user'],
-                password=pg_config['password'],
-                port=pg_config['port'],
-                connect_timeout=pg_config['connect_timeout']
-            )
+            self.pg_conn = create_postgresql_connection(pg_config)
+            self.owns_pg_conn = True
             self.pg_cursor = self.pg_conn.cursor()
             logger.info("PostgreSQL接続成功")
             return True
@@ -109,12 +195,13 @@ class TableSyncProcessor:
             logger.error(f"PostgreSQL接続失敗: {str(e)}")
             raise
     
+    @traced('extract')
     def extract_data_from_sql_server(self):
         """SQL Serverからデータを抽出"""
         if not self.sql_conn or not self.sql_cursor:
             raise RuntimeError("SQL Server接続が確立されていません")
         
-        query = get_sql_query(self.table_name)
+        query = self.spec.select_query
         logger.info(f"SQL Serverからデータ抽出開始: {self.config['sql_table']}")
         logger.info(f"実行クエリ: {query[:100]}...")
         
@@ -123,6 +210,20 @@ class TableSyncProcessor:
             select_start_time = datetime.now()
             
             self.sql_cursor.execute(query)
+            
+            if self.options.get('spill') or self.options.get('columnar') or self.fetch_sizer or self.fetch_detector:
+                # バッチ単位で取得してスピルバッファ／カラムナ形式で保持（全件を行タプルのリストに保持しない）
+                # 適応的バッチサイズ有効時は取得サイズを計測値から調整、遅いバッチの検出時はバッチごとに計測
+                data_to_insert = self.collect_rows(self.fetch_batches(self.config['batch_size']))
+                select_duration = (datetime.now() - select_start_time).total_seconds()
+                
+                logger.info(f"データ抽出完了: {len(data_to_insert):,}件 (SELECT実行時間: {select_duration:.2f}秒)")
+                
+                self.extracted_count = len(data_to_insert)
+                trace_set(rows=self.extracted_count)
+                self.log_interner_stats()
+                return data_to_insert
+            
             rows = self.sql_cursor.fetchall()
             
             # SELECT実行時間計測終了
@@ -136,7 +237,7 @@ class TableSyncProcessor:
             
             # タプル形式に変換
             conversion_start_time = datetime.now()
-            data_to_insert = [tuple(row) for row in rows]
+            data_to_insert = self.prepare_rows(rows)
             conversion_duration = (datetime.now() - conversion_start_time).total_seconds()
             
             if conversion_duration > 0.1:  # 0.1秒以上かかった場合のみログ出力
@@ -144,6 +245,8 @@ class TableSyncProcessor:
             
             # 抽出件数を保存（検証用）
             self.extracted_count = len(rows)
+            trace_set(rows=self.extracted_count)
+            self.log_interner_stats()
             
             return data_to_insert
             
@@ -151,6 +254,237 @@ class TableSyncProcessor:
             logger.error(f"データ抽出失敗: {str(e)}")
             raise
     
+    @traced('stream')
+    def stream_sql_server_to_postgresql(self):
+        """
+        SQL ServerからPostgreSQLへ抽出データを保持せずにCOPYで転送（load_method: 'stream'）
+        
+        fetchmany のバッチを CopyStream で順にエンコードして copy_expert に渡すため、
+        行タプルのリストやテーブル全体のCOPY文字列を作らない
+        
+        Returns:
+            int: ロード件数
+        """
+        if not self.sql_conn or not self.sql_cursor:
+            raise RuntimeError("SQL Server接続が確立されていません")
+        
+        query = self.spec.select_query
+        sink = PostgreSQLSink(self.table_name, method='copy', conn=self.pg_conn, cursor=self.pg_cursor)
+        dictionary_columns = self.get_dictionary_pg_columns()
+        logger.info(f"ストリーミング転送開始: {self.config['sql_table']} → {self.config['pg_table']}")
+        
+        stream_start_time = datetime.now()
+        self.sql_cursor.execute(query)
+        stream = CopyStream(
+            self.fetch_batches(self.config['batch_size']),
+            lambda rows: ColumnarBatch.from_rows(rows, self.config['pg_columns'], dictionary_columns).to_copy_text()
+        )
+        try:
+            self.loaded_count = sink.copy_from(stream)
+        except psycopg2.Error as e:
+            logger.error(f"ストリーミング転送失敗 ({stream.row_count:,}件目付近): {str(e)}")
+            raise
+        
+        self.extracted_count = stream.row_count
+        stream_duration = (datetime.now() - stream_start_time).total_seconds()
+        trace_set(rows=stream.row_count, bytes=stream.byte_count)
+        
+        logger.info(f"ストリーミング転送完了: {stream.row_count:,}件 "
+                    f"({stream.byte_count / 1024 / 1024:.1f}MB, {stream_duration:.2f}秒)")
+        self.log_interner_stats()
+        return self.loaded_count
+    
+    def log_interner_stats(self):
+        """辞書エンコード対象列の異なり数と型変換対象列をログ出力"""
+        if self.interner.enabled:
+            logger.info(f"辞書エンコード列の異なり数: {self.interner.stats()}")
+        if self.row_converter.enabled:
+            logger.info(f"型変換列: {self.row_converter.describe()}")
+    
+    def get_dictionary_pg_columns(self):
+        """辞書エンコード対象列（dictionary_columns）のPostgreSQLカラム名"""
+        dictionary_columns = set(self.config.get('dictionary_columns') or ())
+        return [
+            pg_col for col, pg_col in zip(self.config['columns'], self.config['pg_columns'])
+            if col in dictionary_columns
+        ]
+    
+    def fetch_batches(self, fetch_size):
+        """SQL Serverカーソルからバッチ単位で取得"""
+        while True:
+            if self.fetch_sizer:
+                fetch_size = self.fetch_sizer.batch_size
+            if self.fetch_sizer or self.fetch_detector:
+                fetch_start_time = datetime.now()
+            # yield の前に終了する（呼び出し元のスパンと入れ子にならないように）
+            span = trace_span('fetch_batch')
+            rows = self.sql_cursor.fetchmany(fetch_size)
+            if not rows:
+                span.end(rows=0)
+                return
+            if self.fetch_sizer or span:
+                byte_count = estimate_row_bytes(rows) * len(rows)
+            if self.fetch_sizer or self.fetch_detector:
+                fetch_duration = (datetime.now() - fetch_start_time).total_seconds()
+            if self.fetch_sizer:
+                self.fetch_sizer.observe(len(rows), fetch_duration, byte_count)
+            if self.fetch_detector:
+                self.check_slow_batch(self.fetch_detector, len(rows), fetch_duration)
+            rows = self.prepare_rows(rows)
+            span.end(rows=len(rows), bytes=byte_count if span else None)
+            yield rows
+    
+    def check_slow_batch(self, detector, row_count, seconds):
+        """
+        バッチの処理時間が直近のバッチから外れていれば診断情報を取得して記録
+        
+        取得はテーブルごとに SLOW_BATCH_MAX_CAPTURES 回（既定3回）まで（以降は検出のみ記録）
+        """
+        anomaly = detector.observe(row_count, seconds)
+        if anomaly is None:
+            return
+        
+        logger.warning(f"遅いバッチを検出 ({anomaly['phase']} バッチ{anomaly['batch']}): {anomaly['seconds']:.2f}秒 "
+                       f"(想定: {anomaly['expected_seconds']:.2f}秒, スコア: {anomaly['score']})")
+        captured = sum(1 for slow_batch in self.slow_batches if 'diagnostics' in slow_batch)
+        if captured < DatabaseConfig.get_optional_env('SLOW_BATCH_MAX_CAPTURES', 3):
+            if detector is self.load_detector:
+                anomaly['diagnostics'] = capture_postgresql_diagnostics(self.pg_conn, self.config['pg_table'])
+            elif self.sql_session_id is not None:
+                anomaly['diagnostics'] = capture_sql_server_diagnostics(
+                    self.get_sql_server_config(), self.sql_session_id
+                )
+        self.slow_batches.append(anomaly)
+    
+    def prepare_rows(self, rows):
+        """
+        取得した行の値共有と型変換
+        
+        スプール・追加シンク・変換ワーカーはすべて変換済みの行を受け取る（ロード方式によらず同じ値）
+        """
+        rows = self.interner.intern_rows(rows)
+        return self.row_converter.convert_rows(rows)
+    
+    def collect_rows(self, batches):
+        """
+        バッチのストリームを行バッファに格納
+        
+        spillオプションに応じて、件数が閾値を超えた時点でスピルバッファ（/tmp）へ切り替える
+        columnarオプション有効時はカラムナ形式で保持する
+        
+        Returns:
+            list | SpillBuffer | ColumnarBuffer: 行バッファ
+        """
+        spill = self.options.get('spill')
+        threshold = 0 if isinstance(spill, bool) else int(spill or 0)
+        if self.options.get('columnar'):
+            rows = ColumnarBuffer(self.config['pg_columns'], self.get_dictionary_pg_columns())
+        else:
+            rows = []
+        
+        for batch in batches:
+            if isinstance(rows, SpillBuffer):
+                rows.append_batch(batch)
+                continue
+            
+            if isinstance(rows, ColumnarBuffer):
+                rows.append_batch(batch)
+            else:
+                rows.extend(batch)
+            if spill and len(rows) > threshold:
+                logger.info(f"スピルバッファへ切り替え: {len(rows):,}件 (閾値: {threshold:,}件)")
+                buffer = SpillBuffer(self.table_name)
+                for chunk in iter_batches(rows, self.config['batch_size']):
+                    buffer.append_batch(chunk)
+                rows = buffer
+                self.row_buffer = buffer
+        
+        return rows
+    
+    def open_spool(self):
+        """抽出データスプールを準備（spoolオプション有効時のみ）"""
+        if not self.options.get('spool'):
+            return None
+        
+        run_id = self.options.get('run_id')
+        if not run_id:
+            logger.warning("run_idが未指定のためスプールを使用しません")
+            return None
+        
+        spool = SnapshotSpool(self.table_name, run_id)
+        spool.evict_old_runs()
+        return spool
+    
+    @traced('extract_spool')
+    def extract_data_from_spool(self, spool):
+        """スプールから抽出データを再読み込み（SQL Serverへの再クエリなし）"""
+        logger.info(f"スプールからデータ読み込み開始: {spool.data_path}")
+        
+        read_start_time = datetime.now()
+        data_to_insert = self.collect_rows(spool.iter_batches())
+        read_duration = (datetime.now() - read_start_time).total_seconds()
+        
+        logger.info(f"スプール読み込み完了: {len(data_to_insert):,}件 ({read_duration:.2f}秒)")
+        
+        # 抽出件数を保存（検証用）
+        self.extracted_count = len(data_to_insert)
+        trace_set(rows=self.extracted_count)
+        
+        return data_to_insert
+    
+    def load_batch_tuning(self):
+        """前回保存したバッチサイズを初期値として適応的バッチサイズを有効化"""
+        saved = {}
+        try:
+            store = BatchSizeStore(self.pg_conn)
+            store.ensure_table()
+            saved = store.load(self.table_name)
+        except Exception as e:
+            self.pg_conn.rollback()
+            logger.warning(f"保存済みバッチサイズの取得エラー（設定値から開始）: {str(e)}")
+        
+        self.fetch_sizer = AdaptiveBatchSizer(saved.get('fetch_size', self.config['batch_size']), 'fetch')
+        self.load_sizer = AdaptiveBatchSizer(saved.get('load_batch_size', self.config['batch_size']), 'load')
+        logger.info(f"適応的バッチサイズ: 取得 {self.fetch_sizer.batch_size:,}件 / "
+                    f"ロード {self.load_sizer.batch_size:,}件から開始")
+    
+    def save_batch_tuning(self):
+        """調整後のバッチサイズを次回実行用に保存"""
+        fetch_stats = self.fetch_sizer.stats()
+        load_stats = self.load_sizer.stats()
+        try:
+            BatchSizeStore(self.pg_conn).save(
+                self.table_name,
+                load_batch_size=load_stats['final_size'] if load_stats['observations'] else None,
+                fetch_size=fetch_stats['final_size'] if fetch_stats['observations'] else None,
+                row_bytes=load_stats['row_bytes'] or fetch_stats['row_bytes']
+            )
+            logger.info(f"バッチサイズ保存: 取得 {fetch_stats['final_size']:,}件 / ロード {load_stats['final_size']:,}件")
+        except Exception as e:
+            self.pg_conn.rollback()
+            logger.warning(f"バッチサイズ保存エラー: {str(e)}")
+        return {'fetch': fetch_stats, 'load': load_stats}
+    
+    @traced('lock')
+    def acquire_table_lock(self):
+        """
+        pg_table のアドバイザリロックを取得（コミットまで保持）
+        
+        Returns:
+            bool: 取得できた場合True
+        """
+        wait_seconds = float(self.options.get('lock_wait') or 0)
+        table_name = self.config['pg_table']
+        
+        if acquire_table_lock(self.pg_cursor, table_name, wait_seconds):
+            return True
+        
+        self.pg_conn.rollback()
+        logger.warning(f"{table_name} は他の実行が同期中のためスキップします"
+                       + (f" ({wait_seconds:.0f}秒待機)" if wait_seconds else ""))
+        return False
+    
+    @traced('clear')
     def clear_postgresql_table(self):
         """PostgreSQLテーブルをクリア"""
         if not self.pg_conn or not self.pg_cursor:
@@ -170,6 +504,7 @@ class TableSyncProcessor:
             logger.error(f"テーブルクリア失敗: {table_name} - {str(e)}")
             raise
     
+    @traced('load')
     def load_data_to_postgresql(self, data_to_insert):
         """PostgreSQLにデータをロード"""
         if not self.pg_conn or not self.pg_cursor:
@@ -179,36 +514,73 @@ class TableSyncProcessor:
             logger.warning("挿入するデータがありません")
             return 0
         
-        insert_query = get_pg_insert_query(self.table_name)
         batch_size = self.config['batch_size']
         total_records = len(data_to_insert)
+        load_method = self.options.get('load_method', 'insert')
+        if load_method == 'stream':
+            # スプールから再読み込みしたデータは通常のCOPYでロード
+            load_method = 'copy'
+        
+        # 適応的バッチサイズ（カラムナ形式は行タプルに戻さず固定のバッチサイズで分割するため対象外）
+        sizer = self.load_sizer if not isinstance(data_to_insert, ColumnarBuffer) else None
+        
+        transform_pool = None
+        if load_method not in ('insert', 'copy'):
+            raise ValueError(f"不正なロード方式: {load_method}")
+        # INSERT・COPYの書き込みは追加シンクと共通（同じ接続・カーソルのトランザクション内で書き込む）
+        sink = PostgreSQLSink(
+            self.table_name, method=load_method, conn=self.pg_conn, cursor=self.pg_cursor,
+            dictionary_columns=self.get_dictionary_pg_columns()
+        )
+        sink.begin()
         
-        logger.info(f"PostgreSQLデータロード開始: {total_records:,}件 (バッチサイズ: {batch_size}件)")
+        if load_method == 'copy' and self.transform_workers:
+            # エンコードは子プロセスで行い、送信可能なバイト列を受け取る
+            transform_pool = TransformPool(self.config, self.transform_workers, self.get_dictionary_pg_columns())
+            batches = transform_pool.imap(
+                iter_adaptive_batches(data_to_insert, sizer) if sizer else iter_batches(data_to_insert, batch_size)
+            )
+        elif load_method == 'copy' and not sizer:
+            # COPYはカラムナバッチから列単位でエンコード（カラムナ形式の抽出データは行タプルに戻さない）
+            batches = iter_columnar_batches(
+                data_to_insert, batch_size, self.config['pg_columns'], self.get_dictionary_pg_columns()
+            )
+        else:
+            batches = iter_adaptive_batches(data_to_insert, sizer) if sizer else iter_batches(data_to_insert, batch_size)
+        if sizer:
+            # バッチ数は開始時点のサイズでの見込み（実際のサイズは計測値に応じて変化）
+            batch_size = sizer.batch_size
+        
+        logger.info(f"PostgreSQLデータロード開始: {total_records:,}件 (バッチサイズ: {batch_size}件, 方式: {load_method})")
         logger.info(f"対象テーブル: {self.config['pg_table']}")
         
         try:
-            # バッチサイズで分割してインサート
+            # バッチサイズで分割してインサート（スピルバッファの場合はmmapから順次読み出し）
             batch_count = (total_records + batch_size - 1) // batch_size
             insert_start_time = datetime.now()
             processed_records = 0
+            batch_num = 0
+            self.loaded_count = 0
             
             logger.info(f"バッチ処理開始: 全{batch_count}バッチ")
             
-            for batch_num in range(batch_count):
+            for batch_num, batch_data in enumerate(batches):
+                span = trace_span('load_batch', batch=batch_num + 1)
                 batch_start_time = datetime.now()
                 
-                start_idx = batch_num * batch_size
-                end_idx = min((batch_num + 1) * batch_size, total_records)
-                batch_data = data_to_insert[start_idx:end_idx]
-                
-                extras.execute_values(
-                    self.pg_cursor,
-                    insert_query,
-                    batch_data,
-                    page_size=batch_size
-                )
+                # ロード件数をPostgreSQLの報告値（INSERTのrowcount / COPYの処理件数）で集計
+                self.loaded_count += sink.write_batch(batch_data)
                 
                 batch_duration = (datetime.now() - batch_start_time).total_seconds()
+                if sizer or span:
+                    byte_count = (sink.batch_bytes if load_method == 'copy'
+                                  else estimate_row_bytes(batch_data) * len(batch_data))
+                    span.end(rows=len(batch_data), bytes=byte_count)
+                if sizer:
+                    sizer.observe(len(batch_data), batch_duration, byte_count)
+                if self.load_detector:
+                    self.check_slow_batch(self.load_detector, len(batch_data), batch_duration)
+                    batch_count = max(batch_count, batch_num + 1)
                 processed_records += len(batch_data)
                 progress_percent = (processed_records / total_records) * 100
                 
@@ -225,25 +597,59 @@ class TableSyncProcessor:
             logger.info(f"データロード完了: {total_records:,}件 "
                       f"(総時間: {total_insert_duration:.2f}秒, 平均レート: {final_rate:.0f}件/秒)")
             
-            return total_records
+            trace_set(rows=self.loaded_count)
+            return self.loaded_count
             
         except psycopg2.Error as e:
             logger.error(f"データロード失敗 (バッチ {batch_num + 1}/{batch_count}): {str(e)}")
             raise
+        finally:
+            sink.close()
+            if transform_pool:
+                transform_pool.close()
     
+    def open_extra_sinks(self):
+        """追加シンク（Parquetスナップショット等）を開いて並行書き込みを準備"""
+        sink_specs = self.options.get('sinks') or []
+        if not sink_specs:
+            return None
+        
+        # Parquet等のスキーマは同期先テーブルの列定義から決定する
+        target_columns = fetch_target_columns(self.pg_conn, self.config['pg_table'])
+        sinks = [create_sink(spec, self.table_name, target_columns) for spec in sink_specs]
+        logger.info(f"追加シンク: {[sink.name for sink in sinks]}")
+        
+        fanout = SinkFanout(sinks)
+        try:
+            fanout.start()
+        except Exception:
+            fanout.abort()
+            raise
+        return fanout
+    
+    @traced('validate')
     def validate_transfer(self):
-        """転送結果の検証（SQL Serverへの追加リクエストなし）"""
+        """
+        転送結果の検証（SQL Serverへの追加リクエストなし）
+        
+        コミット前に同一トランザクション内で実行し、ロード時に集計した件数と抽出件数を比較する
+        deep_validate オプション指定時のみ SELECT COUNT(*) による全件スキャンで比較する
+        """
         if not self.pg_conn or not hasattr(self, 'extracted_count'):
             raise RuntimeError("データベース接続または抽出数が不明")
         
         try:
-            # PostgreSQLのレコード数のみチェック
-            pg_count_query = f"SELECT COUNT(*) FROM {self.config['pg_table']}"
-            self.pg_cursor.execute(pg_count_query)
-            pg_count = self.pg_cursor.fetchone()[0]
+            if self.options.get('deep_validate'):
+                # PostgreSQLのレコード数を全件スキャンでチェック
+                self.pg_cursor.execute(self.spec.count_query)
+                pg_count = self.pg_cursor.fetchone()[0]
+                count_source = 'COUNT(*)'
+            else:
+                pg_count = self.loaded_count
+                count_source = 'ロード件数'
             
             # 事前に取得したSQL Serverの件数と比較
-            logger.info(f"転送検証: SQL Server={self.extracted_count}件, PostgreSQL={pg_count}件")
+            logger.info(f"転送検証: SQL Server={self.extracted_count}件, PostgreSQL={pg_count}件 ({count_source})")
             
             if self.extracted_count == pg_count:
                 logger.info("転送検証成功: レコード数が一致")
@@ -256,6 +662,86 @@ class TableSyncProcessor:
             logger.error(f"転送検証エラー: {str(e)}")
             return False
     
+    @traced('analyze')
+    def check_table_statistics(self):
+        """ANALYZE後の pg_class.reltuples による件数の簡易チェック（全件スキャンなし）"""
+        table_name = self.config['pg_table']
+        
+        try:
+            analyze_start_time = datetime.now()
+            self.pg_cursor.execute(f"ANALYZE {table_name}")
+            self.pg_cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                (table_name,)
+            )
+            reltuples = self.pg_cursor.fetchone()[0]
+            self.pg_conn.commit()
+            analyze_duration = (datetime.now() - analyze_start_time).total_seconds()
+            
+            # reltuples はサンプリングによる推定値のため許容誤差付きで比較
+            tolerance = max(1, int(self.extracted_count * 0.1))
+            within_tolerance = abs(reltuples - self.extracted_count) <= tolerance
+            
+            if within_tolerance:
+                logger.info(f"統計情報チェック: reltuples={reltuples}件 ({analyze_duration:.2f}秒)")
+            else:
+                logger.warning(f"統計情報チェック: reltuples={reltuples}件が抽出件数 {self.extracted_count}件 と乖離しています")
+            
+            return {
+                'reltuples': reltuples,
+                'within_tolerance': within_tolerance
+            }
+            
+        except Exception as e:
+            logger.error(f"統計情報チェックエラー: {str(e)}")
+            return {
+                'reltuples': None,
+                'within_tolerance': False,
+                'error': str(e)
+            }
+    
+    @traced('validate_content')
+    def validate_content(self):
+        """主キー範囲の集約ハッシュ比較による内容検証"""
+        try:
+            # スプールから再ロードした場合はSQL Server未接続
+            if not self.sql_conn:
+                self.connect_sql_server()
+            
+            validator = ContentValidator(self.table_name, self.sql_cursor, self.pg_cursor)
+            return validator.validate()
+            
+        except Exception as e:
+            logger.error(f"内容検証エラー: {str(e)}")
+            return {
+                'matched': False,
+                'error': str(e)
+            }
+    
+    @traced('validate_sample')
+    def validate_sample(self):
+        """決定的サンプリングによる列単位の内容検証"""
+        try:
+            # スプールから再ロードした場合はSQL Server未接続
+            if not self.sql_conn:
+                self.connect_sql_server()
+            
+            # 同一run_idのリトライでは同じサンプルを比較し、実行ごとに異なるサンプルを選ぶ
+            salt = self.options.get('run_id') or datetime.now().strftime('%Y%m%d%H')
+            validator = SampleValidator(
+                self.table_name, self.sql_cursor, self.pg_cursor,
+                modulus=int(self.options.get('sample_modulus') or 1000),
+                salt=salt
+            )
+            return validator.validate(total_rows=self.loaded_count)
+            
+        except Exception as e:
+            logger.error(f"サンプリング検証エラー: {str(e)}")
+            return {
+                'matched': False,
+                'error': str(e)
+            }
+    
     def sync_table(self):
         """テーブル同期の実行"""
         start_time = datetime.now()
@@ -267,41 +753,146 @@ class TableSyncProcessor:
             'error': None,
             'validation_passed': False
         }
+        fanout = None
+        spool = None
+        table_span = trace_span(f"table:{self.table_name}")
         
         logger.info(f"=== テーブル同期開始: {self.table_name} ({self.config['description']}) ===")
         
         try:
+            # 前回失敗時のスプールがあればSQL Serverへ再クエリしない
+            spool = self.open_spool()
+            reuse_spool = spool is not None and spool.is_reusable()
+            
             # 1. データベース接続
-            self.connect_sql_server()
+            if not reuse_spool:
+                self.connect_sql_server()
+                if self.fetch_detector:
+                    # 遅い取得の診断で抽出セッションを特定するため、抽出開始前にセッションIDを取得
+                    self.sql_cursor.execute("SELECT @@SPID")
+                    self.sql_session_id = self.sql_cursor.fetchone()[0]
             self.connect_postgresql()
             
-            # 2. データ抽出
-            data_to_insert = self.extract_data_from_sql_server()
+            # 保存済みバッチサイズの読み込み（コミットを伴うためロック取得前に行う）
+            if self.options.get('adaptive_batch'):
+                self.load_batch_tuning()
+            
+            # スキーマ変更の検出（データ転送前に中止。コミットを伴うためロック取得前に行う）
+            if self.options.get('schema_check') or self.options.get('schema_migrate'):
+                result['schema_check'] = check_schema(
+                    self.table_name, self.config, self.sql_conn, self.pg_conn,
+                    migrate=bool(self.options.get('schema_migrate'))
+                )
             
-            if not data_to_insert:
-                logger.warning("転送対象データが0件です")
+            # 同じテーブルを同期中の実行があればスキップ（SQL Serverからの抽出前に判定）
+            if not self.acquire_table_lock():
                 result.update({
                     'success': True,
-                    'transferred_count': 0,
+                    'skipped_locked': True,
                     'validation_passed': True
                 })
                 return result
             
-            # 3. テーブルクリア
-            self.clear_postgresql_table()
+            if self.options.get('load_method') == 'stream' and not reuse_spool:
+                # 2-4. 抽出データを保持せず、SQL ServerからPostgreSQLへCOPYで直接転送
+                if self.options.get('sinks'):
+                    logger.warning("load_method: 'stream' では追加シンクへ書き込みません")
+                self.clear_postgresql_table()
+                transferred_count = self.stream_sql_server_to_postgresql()
+                
+                if self.extracted_count == 0:
+                    # 抽出0件の場合はテーブルクリアを取り消す（通常の抽出と同様にテーブルを変更しない）
+                    self.pg_conn.rollback()
+                    logger.warning("転送対象データが0件です")
+                    result.update({
+                        'success': True,
+                        'transferred_count': 0,
+                        'validation_passed': True
+                    })
+                    return result
+            else:
+                # 2. データ抽出
+                if reuse_spool:
+                    data_to_insert = self.extract_data_from_spool(spool)
+                    result['loaded_from_spool'] = True
+                else:
+                    data_to_insert = self.extract_data_from_sql_server()
+            
+                if not data_to_insert:
+                    logger.warning("転送対象データが0件です")
+                    result.update({
+                        'success': True,
+                        'transferred_count': 0,
+                        'validation_passed': True
+                    })
+                    return result
             
-            # 4. データロード
-            transferred_count = self.load_data_to_postgresql(data_to_insert)
+                # ロードと並行して抽出データをスプールへ保存
+                if spool and not reuse_spool:
+                    spool.write_async(iter_batches(data_to_insert, self.config['batch_size']))
             
-            # 5. コミット
+                # 3. テーブルクリア
+                self.clear_postgresql_table()
+            
+                # 追加シンクへは別スレッドで同じデータを並行書き込み
+                fanout = self.open_extra_sinks()
+                if fanout:
+                    if isinstance(data_to_insert, ColumnarBuffer):
+                        # カラムナ形式のまま配布（行タプルへの変換は必要なシンクの書き込みスレッドで行う）
+                        fanout.feed_async(iter_columnar_batches(
+                            data_to_insert, self.config['batch_size'], self.config['pg_columns']
+                        ))
+                    else:
+                        fanout.feed_async(iter_batches(data_to_insert, self.config['batch_size']))
+            
+                # 4. データロード
+                transferred_count = self.load_data_to_postgresql(data_to_insert)
+            
+            # 5. 検証（コミット前に同一トランザクション内で件数を確認し、不一致ならロールバック）
+            validation_passed = self.validate_transfer()
+            if not validation_passed:
+                raise RuntimeError(
+                    f"転送検証失敗のためロールバックします "
+                    f"(抽出: {self.extracted_count}件, ロード: {self.loaded_count}件)"
+                )
+            
+            # 6. コミット
             logger.info("トランザクションコミット開始...")
             commit_start_time = datetime.now()
-            self.pg_conn.commit()
+            with trace_span('commit'):
+                self.pg_conn.commit()
             commit_duration = (datetime.now() - commit_start_time).total_seconds()
             logger.info(f"トランザクションコミット完了 ({commit_duration:.2f}秒)")
             
-            # 6. 検証
-            validation_passed = self.validate_transfer()
+            if self.load_sizer:
+                result['batch_tuning'] = self.save_batch_tuning()
+            
+            if self.transform_workers:
+                result['transform_workers'] = self.transform_workers
+            
+            if self.options.get('analyze'):
+                result['table_statistics'] = self.check_table_statistics()
+            
+            if self.options.get('validation') == 'content':
+                content_result = self.validate_content()
+                result['content_validation'] = content_result
+                validation_passed = validation_passed and content_result['matched']
+            elif self.options.get('validation') == 'sample':
+                sample_result = self.validate_sample()
+                result['sample_validation'] = sample_result
+                validation_passed = validation_passed and sample_result['matched']
+            
+            # 追加シンクの書き込み完了を待って確定
+            if fanout:
+                sink_results = fanout.finish()
+                fanout = None
+                result['sink_results'] = sink_results
+                result['sinks_success'] = all(r['success'] for r in sink_results.values())
+            
+            # 成功時はリトライ用スプールは不要
+            if spool:
+                spool.wait()
+                spool.discard()
             
             # 7. 結果更新
             result.update({
@@ -313,6 +904,14 @@ class TableSyncProcessor:
         except Exception as e:
             logger.error(f"テーブル同期エラー: {str(e)}")
             
+            if fanout:
+                fanout.abort()
+            
+            # 失敗時はスプールを残して次回リトライで再利用
+            if spool and spool.wait() and spool.exists():
+                logger.info(f"スプールを保持: {spool.data_path} (run_id={spool.run_id})")
+                result['spool_retained'] = True
+            
             # ロールバック
             if self.pg_conn:
                 try:
@@ -325,15 +924,25 @@ class TableSyncProcessor:
                 'success': False,
                 'error': str(e)
             })
+            if isinstance(e, SchemaDriftError):
+                result['schema_drift'] = True
             
         finally:
             # 接続クローズ
             self.close_connections()
             
+            # スピルファイル削除（並行書き込みスレッドの終了後）
+            if self.row_buffer is not None:
+                self.row_buffer.close()
+                self.row_buffer = None
+            
             # 実行時間計算
             end_time = datetime.now()
             execution_time = (end_time - start_time).total_seconds()
             result['execution_time'] = execution_time
+            if self.slow_batches:
+                result['slow_batches'] = self.slow_batches
+            table_span.end(rows=result['transferred_count'], success=result['success'])
             
             logger.info(f"=== テーブル同期終了: {self.table_name} (実行時間: {execution_time:.2f}秒) ===")
             
@@ -361,8 +970,7 @@ class TableSyncProcessor:
                 self.connect_sql_server()
                 
                 # テーブル存在確認
-                table_check_query = f"SELECT COUNT(*) FROM {self.config['sql_table']} WITH (NOLOCK)"
-                self.sql_cursor.execute(table_check_query)
+                self.sql_cursor.execute(self.spec.source_count_query)
                 count = self.sql_cursor.fetchone()[0]
                 
                 logger.info(f"SQL Server テーブル確認: {count}件")
@@ -376,8 +984,7 @@ class TableSyncProcessor:
                 self.connect_postgresql()
                 
                 # テーブル存在確認
-                table_check_query = f"SELECT COUNT(*) FROM {self.config['pg_table']}"
-                self.pg_cursor.execute(table_check_query)
+                self.pg_cursor.execute(self.spec.count_query)
                 count = self.pg_cursor.fetchone()[0]
                 
                 logger.info(f"PostgreSQL テーブル確認: {count}件")
@@ -395,11 +1002,11 @@ class TableSyncProcessor:
         return result
     
     def close_connections(self):
-        """データベース接続をクローズ"""
+        """データベース接続をクローズ（共有接続はカーソルのみクローズ）"""
         try:
             if self.sql_cursor:
                 self.sql_cursor.close()
-            if self.sql_conn:
+            if self.sql_conn and self.owns_sql_conn:
                 self.sql_conn.close()
                 logger.info("SQL Server接続クローズ")
         except:
@@ -408,9 +1015,12 @@ class TableSyncProcessor:
         try:
             if self.pg_cursor:
                 self.pg_cursor.close()
-            if self.pg_conn:
+            if self.pg_conn and self.owns_pg_conn:
                 self.pg_conn.close()
                 logger.info("PostgreSQL接続クローズ")
+            elif self.pg_conn and not self.pg_conn.closed:
+                # 検証クエリ等で開始したトランザクションを次のテーブルに持ち越さない
+                self.pg_conn.rollback()
         except:
             pass
 
@@ -425,14 +1035,19 @@ if __name__ == '__main__':
     )
     
     if len(sys.argv) < 2:
-        print("使用方法: python table_sync_processor.py <table_name> [test|sync]")
+        print("使用方法: python table_sync_processor.py <table_name> [test|sync] [--sinks=parquet,sqlite]")
         print("利用可能テーブル: customer, mctm_module, voipdb_customer, voipdb_useragent")
         sys.exit(1)
     
     table_name = sys.argv[1]
     mode = sys.argv[2] if len(sys.argv) > 2 else 'sync'
     
-    processor = TableSyncProcessor(table_name)
+    options = {}
+    for arg in sys.argv[3:]:
+        if arg.startswith('--sinks='):
+            options['sinks'] = arg.split('=')[1].split(',')
+    
+    processor = TableSyncProcessor(table_name, options=options)
     
     if mode == 'test':
         result = processor.test_connections()
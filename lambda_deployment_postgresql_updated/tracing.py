@@ -0,0 +1,303 @@
+"""
+スパンによる処理時間のトレース（実行 → テーブル → フェーズ → バッチ）
+各スパンの開始・終了時刻（単調増加クロック）と件数・バイト数を記録し、
+Chrome trace-event 形式のJSON（chrome://tracing / Perfetto）と
+フレームグラフ用の collapsed-stack 形式（flamegraph.pl / speedscope）で /tmp に出力する
+
+トレース無効時は記録しないダミーのスパンを返すため、計測箇所のオーバーヘッドは関数呼び出しのみ
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from functools import wraps
+from config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+# トレースファイルの保存先（Lambdaでは /tmp のみ書き込み可能）
+DEFAULT_TRACE_DIR = '/tmp'
+
+
+class Span:
+    """記録中のスパン"""
+
+    __slots__ = ('tracer', 'name', 'args', 'path', 'tid', 'start', 'end_time')
+
+    def __init__(self, tracer, name, args, path, tid):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.path = path
+        self.tid = tid
+        self.start = time.perf_counter()
+        self.end_time = None
+
+    def set(self, **args):
+        """属性（rows / bytes など）を追加"""
+        self.args.update(args)
+
+    def end(self, **args):
+        """スパンを終了して記録"""
+        if self.end_time is not None:
+            return
+        self.end_time = time.perf_counter()
+        if args:
+            self.args.update(args)
+        self.tracer.finish(self)
+
+    @property
+    def duration(self):
+        return (self.end_time or time.perf_counter()) - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.end()
+        return False
+
+
+class _NullSpan:
+    """トレース無効時のスパン（何も記録しない）"""
+
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def end(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __bool__(self):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """スパンを記録するクラス（スレッドごとに入れ子のスタックを持つ）"""
+
+    def __init__(self, name, **args):
+        """
+        初期化（ルートスパンを開始）
+
+        Args:
+            name (str): ルートスパン名（例: 'run:multi_sync'）
+            args: ルートスパンの属性（run_id など）
+        """
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.spans = []
+        self.thread_names = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.root = Span(self, name, args, (name,), threading.get_ident())
+        self.thread_names[self.root.tid] = threading.current_thread().name
+
+    def stack(self):
+        """現在のスレッドのスパンのスタック（別スレッドではルートスパンの直下から始まる）"""
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+            tid = threading.get_ident()
+            if tid not in self.thread_names:
+                with self.lock:
+                    self.thread_names[tid] = threading.current_thread().name
+        return stack
+
+    def begin(self, name, **args):
+        """スパンを開始（end() または with で終了する）"""
+        stack = self.stack()
+        parent_path = stack[-1].path if stack else self.root.path
+        span = Span(self, name, args, parent_path + (name,), threading.get_ident())
+        stack.append(span)
+        return span
+
+    def finish(self, span):
+        if span is self.root:
+            return
+        stack = self.stack()
+        # 例外で終了しなかった子スパンはスタックから除く（記録しない）
+        while stack and stack[-1] is not span:
+            stack.pop()
+        if stack:
+            stack.pop()
+        with self.lock:
+            self.spans.append(span)
+
+    def current(self):
+        stack = self.stack()
+        return stack[-1] if stack else self.root
+
+    def chrome_trace(self):
+        """Chrome trace-event 形式（完了イベント 'X'、時刻はマイクロ秒）"""
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': thread_name}}
+            for tid, thread_name in self.thread_names.items()
+        ]
+        for span in [self.root] + self.spans:
+            events.append({
+                'name': span.name,
+                'cat': span.path[1] if len(span.path) > 1 else span.name,
+                'ph': 'X',
+                'ts': round((span.start - self.origin) * 1e6, 1),
+                'dur': round(span.duration * 1e6, 1),
+                'pid': self.pid,
+                'tid': span.tid,
+                'args': span.args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def collapsed_stacks(self):
+        """
+        collapsed-stack 形式（'親;子;孫 マイクロ秒' の行）
+
+        各スパンの自身のみの時間（子スパンの時間を除く）を呼び出し経路ごとに集計する
+        """
+        self_times = {}
+        for span in [self.root] + self.spans:
+            self_times[span.path] = self_times.get(span.path, 0.0) + span.duration
+        for span in self.spans:
+            parent_path = span.path[:-1]
+            self_times[parent_path] = self_times.get(parent_path, 0.0) - span.duration
+
+        # 並行スレッドの子スパンの合計が親を超える場合は0とする
+        return "\n".join(
+            f"{';'.join(path)} {max(0, int(seconds * 1e6))}"
+            for path, seconds in sorted(self_times.items())
+        ) + "\n"
+
+    def summary(self, top=5):
+        """
+        フェーズ（スパン名）ごとの集計と遅いバッチ
+
+        Returns:
+            dict: span_count, duration_seconds, phases, slowest_batches
+        """
+        phases = {}
+        for span in self.spans:
+            if span.name.startswith('table:'):
+                continue
+            phase = phases.setdefault(span.name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            phase['count'] += 1
+            phase['total_seconds'] += span.duration
+            phase['max_seconds'] = max(phase['max_seconds'], span.duration)
+        for phase in phases.values():
+            phase['total_seconds'] = round(phase['total_seconds'], 4)
+            phase['max_seconds'] = round(phase['max_seconds'], 4)
+
+        batches = sorted(
+            (span for span in self.spans if span.name.endswith('_batch')), key=lambda span: span.duration, reverse=True
+        )[:top]
+        return {
+            'span_count': len(self.spans) + 1,
+            'duration_seconds': round(self.root.duration, 4),
+            'phases': phases,
+            'slowest_batches': [
+                {'path': ';'.join(span.path[1:]), 'seconds': round(span.duration, 4), **span.args}
+                for span in batches
+            ]
+        }
+
+    def export(self, trace_dir=None):
+        """
+        ルートスパンを終了し、トレースファイルを出力
+
+        Returns:
+            dict: summary() に出力ファイルのパスを追加したもの
+        """
+        self.root.end()
+        trace_dir = trace_dir or DatabaseConfig.get_optional_env('TRACE_DIR', DEFAULT_TRACE_DIR)
+        run_id = re.sub(r'[^0-9A-Za-z_.-]', '', str(self.root.args.get('run_id') or '')) \
+            or datetime.now().strftime('%Y%m%d%H%M%S')
+        result = self.summary()
+
+        try:
+            os.makedirs(trace_dir, exist_ok=True)
+            trace_file = os.path.join(trace_dir, f"trace_{run_id}.json")
+            with open(trace_file, 'w', encoding='utf-8') as f:
+                json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+            collapsed_file = os.path.join(trace_dir, f"trace_{run_id}.folded")
+            with open(collapsed_file, 'w', encoding='utf-8') as f:
+                f.write(self.collapsed_stacks())
+            result.update({'trace_file': trace_file, 'collapsed_file': collapsed_file})
+            logger.info(f"トレース出力: {trace_file} ({result['span_count']}スパン)")
+        except OSError as e:
+            logger.warning(f"トレース出力エラー: {str(e)}")
+            result['error'] = str(e)
+        return result
+
+
+class _NullTracer:
+    """トレース無効時のトレーサー"""
+
+    def begin(self, name, **args):
+        return NULL_SPAN
+
+    def current(self):
+        return NULL_SPAN
+
+
+_NULL_TRACER = _NullTracer()
+_tracer = _NULL_TRACER
+
+
+def set_tracer(tracer):
+    """実行のトレーサーを設定（Noneの場合はトレース無効）"""
+    global _tracer
+    _tracer = tracer or _NULL_TRACER
+
+
+def get_tracer():
+    return _tracer
+
+
+def trace_span(name, **args):
+    """スパンを開始（with で使用、トレース無効時は記録しない）"""
+    return _tracer.begin(name, **args)
+
+
+def trace_set(**args):
+    """現在のスパンに属性を追加"""
+    _tracer.current().set(**args)
+
+
+def traced(name):
+    """メソッド全体をスパンとして記録するデコレータ"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is _NULL_TRACER:
+                return func(*args, **kwargs)
+            with _tracer.begin(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_trace():
+    """
+    実行のトレースを出力してトレースを無効化
+
+    Returns:
+        dict: トレースのサマリー（トレース無効時はNone）
+    """
+    tracer = _tracer
+    set_tracer(None)
+    if tracer is _NULL_TRACER:
+        return None
+    return tracer.export()
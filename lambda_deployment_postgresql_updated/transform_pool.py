@@ -0,0 +1,160 @@
+"""
+COPYデータ変換の並列処理
+COPY形式へのエンコード（CPU処理）を子プロセスで並列に行い、
+親プロセスは送信可能なバイト列を受け取ってCOPYするだけにする（GILによる直列化を回避）
+型変換（column_types）は抽出時に済ませるため、スプール・追加シンクと同じ変換済みの行を受け取る
+
+Lambdaには /dev/shm がなく multiprocessing.Pool / Queue（セマフォを使用）が動作しないため、
+ワーカーごとに Process + Pipe を使い、バッチはスピルファイルと同じバイナリ形式（1つのbytes）で受け渡す
+ワーカーはロード開始時点で他のスレッド（スプール書き込み・追加シンク）が動作しているため、
+ロックを保持したまま複製される fork ではなく spawn で起動する
+"""
+
+import os
+import struct
+import logging
+import multiprocessing
+from columnar_batch import ColumnarBatch
+from spill_buffer import encode_batch, decode_batch
+
+logger = logging.getLogger(__name__)
+
+# 送受信ヘッダ: 行数（uint32）。ERROR_ROW_COUNT は子プロセスでのエラー（以降はエラーメッセージ）
+_HEADER = struct.Struct('<I')
+ERROR_ROW_COUNT = 0xFFFFFFFF
+
+# ワーカープロセスの起動方式（スレッドの保持するロックを引き継がない spawn）
+_MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def get_transform_worker_count(requested):
+    """
+    変換ワーカー数を決定（Lambdaはメモリ設定に応じたvCPU数）
+
+    Args:
+        requested (bool | int): transform_workers オプション（trueの場合は利用可能なCPU数）
+
+    Returns:
+        int: ワーカー数（0の場合は並列変換なし）
+    """
+    if not requested:
+        return 0
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+    if requested is True:
+        return cpu_count
+    return max(1, int(requested))
+
+
+def _transform_worker(conn, pg_columns, dictionary_columns):
+    """子プロセス: バイナリ形式の変換済みバッチを受け取り、エンコードしたCOPYデータを返す"""
+    while True:
+        payload = conn.recv_bytes()
+        if not payload:
+            break
+        try:
+            (row_count,) = _HEADER.unpack_from(payload, 0)
+            rows = decode_batch(payload, _HEADER.size, row_count)
+            batch = ColumnarBatch.from_rows(rows, pg_columns, dictionary_columns)
+            copy_data = batch.to_copy_text().encode('utf-8')
+            conn.send_bytes(_HEADER.pack(row_count) + copy_data)
+        except Exception as e:
+            conn.send_bytes(_HEADER.pack(ERROR_ROW_COUNT) + f"{type(e).__name__}: {str(e)}".encode('utf-8'))
+    conn.close()
+
+
+class TransformedBatch:
+    """子プロセスで変換済みのバッチ（COPYでそのまま送信できるバイト列）"""
+
+    __slots__ = ('row_count', 'copy_data')
+
+    def __init__(self, row_count, copy_data):
+        self.row_count = row_count
+        self.copy_data = copy_data
+
+    def __len__(self):
+        return self.row_count
+
+    def to_copy_text(self):
+        return self.copy_data
+
+
+class TransformPool:
+    """変換ワーカープロセス群（ワーカーごとに1バッチずつ処理し、投入順に結果を返す）"""
+
+    def __init__(self, config, worker_count, dictionary_columns=None):
+        """
+        初期化（ワーカープロセスを起動）
+
+        Args:
+            config (dict): テーブル設定（pg_columns）
+            worker_count (int): ワーカー数
+            dictionary_columns (list): 辞書エンコードする列名（PostgreSQLカラム名）
+        """
+        self.worker_count = worker_count
+        self.connections = []
+        self.processes = []
+
+        for worker_idx in range(worker_count):
+            parent_conn, child_conn = _MP_CONTEXT.Pipe()
+            process = _MP_CONTEXT.Process(
+                target=_transform_worker,
+                args=(child_conn, config['pg_columns'], list(dictionary_columns or ())),
+                name=f"transform-{worker_idx}",
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        logger.info(f"変換ワーカー起動: {worker_count}プロセス")
+
+    def receive(self, worker_idx):
+        payload = self.connections[worker_idx].recv_bytes()
+        (row_count,) = _HEADER.unpack_from(payload, 0)
+        if row_count == ERROR_ROW_COUNT:
+            raise RuntimeError(f"変換ワーカーエラー: {payload[_HEADER.size:].decode('utf-8')}")
+        return TransformedBatch(row_count, payload[_HEADER.size:])
+
+    def imap(self, batches):
+        """
+        行バッチを順にワーカーへ振り分け、変換結果を投入順に返す
+
+        各ワーカーの未受信の結果は最大1件とする（送受信のパイプが互いに詰まらないように）
+
+        Args:
+            batches (iterable): 行タプルのリストのストリーム
+
+        Yields:
+            TransformedBatch: 変換済みバッチ
+        """
+        pending = []
+        next_worker = 0
+        for rows in batches:
+            if not rows:
+                continue
+            if len(pending) >= self.worker_count:
+                yield self.receive(pending.pop(0))
+            self.connections[next_worker].send_bytes(_HEADER.pack(len(rows)) + encode_batch(rows))
+            pending.append(next_worker)
+            next_worker = (next_worker + 1) % self.worker_count
+
+        while pending:
+            yield self.receive(pending.pop(0))
+
+    def close(self):
+        """ワーカープロセスを停止"""
+        for conn in self.connections:
+            try:
+                conn.send_bytes(b'')
+                conn.close()
+            except (OSError, ValueError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
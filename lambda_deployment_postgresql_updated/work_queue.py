@@ -0,0 +1,667 @@
+"""
+分散ワークキュー
+PostgreSQLの制御テーブルに「テーブル × 主キー範囲」の作業単位（チャンク）を登録し、
+複数のLambda呼び出し（またはローカルの複数プロセス）が SELECT ... FOR UPDATE SKIP LOCKED で
+チャンクを取得してステージングテーブルへロードする。全チャンク完了後にファイナライザが
+件数検証と本テーブルへの入れ替えを1トランザクションで行う
+
+    planner   : チャンク分割してキューに登録（ステージングテーブルを初期化）
+    worker    : チャンクを取得 → SQL Serverから範囲抽出 → ステージングへロード → 完了登録
+                （処理中はハートビートでリースを延長し、リース切れのチャンクは他のワーカーが再取得）
+    finalizer : 全チャンク完了したテーブルを検証し、TRUNCATE + INSERT SELECT で本テーブルへ反映
+"""
+
+import os
+import json
+import socket
+import logging
+import threading
+from datetime import datetime
+from psycopg2 import extras
+from config import DatabaseConfig
+from table_configs import get_table_config, get_table_spec
+from sinks import iter_batches, PostgreSQLSink
+from row_converters import build_row_converter
+from string_interning import ColumnInterner
+from db_connections import POSTGRESQL_SOURCE, open_source_connection, close_connections, acquire_table_lock
+
+logger = logging.getLogger(__name__)
+
+# 既定のチャンク行数
+DEFAULT_CHUNK_ROWS = 100000
+# チャンクの最大試行回数（超えたチャンクは failed）
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def get_queue_table():
+    """キュー制御テーブル名（環境変数 WORK_QUEUE_TABLE で変更可能）"""
+    return DatabaseConfig.get_optional_env('WORK_QUEUE_TABLE', 'sync_work_queue')
+
+
+def get_staging_table(table_name):
+    """テーブルのステージングテーブル名"""
+    return f"{get_table_config(table_name)['pg_table']}_staging"
+
+
+class WorkQueue:
+    """PostgreSQLの制御テーブルによるチャンク単位のワークキュー"""
+
+    def __init__(self, pg_conn, table=None, lease_seconds=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        初期化
+
+        Args:
+            pg_conn: キュー操作用のPostgreSQL接続（操作ごとにコミットする）
+            table (str): キュー制御テーブル名
+            lease_seconds (int): チャンク取得時のリース秒数（ハートビートで延長）
+            max_attempts (int): チャンクの最大試行回数
+        """
+        self.pg_conn = pg_conn
+        self.table = table or get_queue_table()
+        self.runs_table = f"{self.table}_runs"
+        self.lease_seconds = lease_seconds or DatabaseConfig.get_optional_env('WORK_QUEUE_LEASE_SECONDS', 120)
+        self.max_attempts = max_attempts
+
+    def ensure_tables(self):
+        """キュー制御テーブルが存在しない場合は作成"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.runs_table} (
+                    run_id TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'planned',
+                    chunk_count INTEGER NOT NULL,
+                    row_count BIGINT,
+                    error TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    finalized_at TIMESTAMPTZ,
+                    PRIMARY KEY (run_id, table_name)
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id BIGSERIAL PRIMARY KEY,
+                    run_id TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    chunk_no INTEGER NOT NULL,
+                    key_from JSONB,
+                    key_to JSONB,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires_at TIMESTAMPTZ,
+                    heartbeat_at TIMESTAMPTZ,
+                    row_count BIGINT,
+                    error TEXT,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    UNIQUE (run_id, table_name, chunk_no)
+                )
+            """)
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_status_idx ON {self.table} (status, id)"
+            )
+        self.pg_conn.commit()
+
+    # ---- planner ----
+
+    def plan_table(self, run_id, table_name, sql_cursor, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        テーブルを主キー範囲のチャンクに分割してキューに登録
+
+        同じテーブルの未完了の実行は superseded とし、そのチャンクは削除する
+        （処理中のワーカーの完了登録は行が存在しないため失敗し、ロールバックされる）
+
+        Returns:
+            int: 登録したチャンク数
+        """
+        config = get_table_config(table_name)
+        key = f"[{config['primary_key']}]"
+
+        # ROW_NUMBER で chunk_rows 件ごとの境界キーを取得（任意の型の主キーに対応）
+        sql_cursor.execute(
+            f"SELECT k FROM (SELECT {key} AS k, ROW_NUMBER() OVER (ORDER BY {key}) AS rn "
+            f"FROM {config['sql_table']} WITH (NOLOCK)) s WHERE rn %% %d = 1 ORDER BY k",
+            (int(chunk_rows),)
+        )
+        boundaries = [row[0] for row in sql_cursor.fetchall()]
+
+        # 先頭・末尾は範囲を開放（計画後に追加された範囲外のキーも取り込む）
+        edges = [None] + boundaries[1:] + [None]
+        chunks = [(chunk_no, edges[chunk_no], edges[chunk_no + 1]) for chunk_no in range(len(edges) - 1)]
+
+        staging = get_staging_table(table_name)
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.runs_table} SET status = 'superseded' "
+                f"WHERE table_name = %s AND status = 'planned'",
+                (table_name,)
+            )
+            cursor.execute(f"DELETE FROM {self.table} WHERE table_name = %s", (table_name,))
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {staging} (LIKE {config['pg_table']} INCLUDING DEFAULTS)"
+            )
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.execute(
+                f"INSERT INTO {self.runs_table} (run_id, table_name, chunk_count) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (run_id, table_name) DO UPDATE SET status = 'planned', "
+                f"chunk_count = EXCLUDED.chunk_count, row_count = NULL, error = NULL, finalized_at = NULL",
+                (run_id, table_name, len(chunks))
+            )
+            extras.execute_values(
+                cursor,
+                f"INSERT INTO {self.table} (run_id, table_name, chunk_no, key_from, key_to) VALUES %s",
+                [
+                    (run_id, table_name, chunk_no, self.encode_key(key_from), self.encode_key(key_to))
+                    for chunk_no, key_from, key_to in chunks
+                ]
+            )
+        self.pg_conn.commit()
+
+        logger.info(f"キュー登録: {table_name} {len(chunks)}チャンク (run_id: {run_id}, {chunk_rows:,}件/チャンク)")
+        return len(chunks)
+
+    @staticmethod
+    def encode_key(value):
+        return None if value is None else extras.Json(value, dumps=lambda v: json.dumps(v, default=str))
+
+    # ---- worker ----
+
+    def claim(self, worker_id):
+        """
+        未処理（またはリース切れ）のチャンクを1件取得
+
+        Returns:
+            dict: チャンク情報（取得できない場合はNone）
+        """
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET status = 'running', worker_id = %s, attempts = attempts + 1, "
+                f"lease_expires_at = now() + make_interval(secs => %s), heartbeat_at = now(), updated_at = now() "
+                f"WHERE id = ("
+                f"  SELECT id FROM {self.table} "
+                f"  WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < now())) "
+                f"    AND attempts < %s "
+                f"  ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED"
+                f") RETURNING id, run_id, table_name, chunk_no, key_from, key_to, attempts",
+                (worker_id, self.lease_seconds, self.max_attempts)
+            )
+            row = cursor.fetchone()
+        self.pg_conn.commit()
+
+        if row is None:
+            return None
+        chunk_id, run_id, table_name, chunk_no, key_from, key_to, attempts = row
+        return {
+            'id': chunk_id,
+            'run_id': run_id,
+            'table_name': table_name,
+            'chunk_no': chunk_no,
+            'key_from': key_from,
+            'key_to': key_to,
+            'attempts': attempts
+        }
+
+    def heartbeat(self, chunk_id, worker_id):
+        """リースを延長（他のワーカーに取得し直されていた場合はFalse）"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET heartbeat_at = now(), "
+                f"lease_expires_at = now() + make_interval(secs => %s) "
+                f"WHERE id = %s AND worker_id = %s AND status = 'running'",
+                (self.lease_seconds, chunk_id, worker_id)
+            )
+            alive = cursor.rowcount == 1
+        self.pg_conn.commit()
+        return alive
+
+    def fail(self, chunk_id, worker_id, error):
+        """チャンクの失敗を登録（試行回数が上限に達した場合は failed、それ以外は再取得可能に戻す）"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET "
+                f"status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END, "
+                f"error = %s, lease_expires_at = NULL, updated_at = now() "
+                f"WHERE id = %s AND worker_id = %s AND status = 'running'",
+                (self.max_attempts, str(error)[:1000], chunk_id, worker_id)
+            )
+        self.pg_conn.commit()
+
+    # ---- finalizer ----
+
+    def finalize_ready(self):
+        """
+        全チャンクが完了（または失敗）した実行を確定
+
+        Returns:
+            list: 確定処理の結果
+        """
+        results = []
+
+        # 試行回数の上限に達したままリースが切れたチャンク（ワーカーのタイムアウト等）は失敗扱い
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET status = 'failed', error = COALESCE(error, 'リース切れ'), updated_at = now() "
+                f"WHERE status = 'running' AND lease_expires_at < now() AND attempts >= %s",
+                (self.max_attempts,)
+            )
+        self.pg_conn.commit()
+
+        while True:
+            with self.pg_conn.cursor() as cursor:
+                # ファイナライザの同時実行は SKIP LOCKED で1テーブル1プロセスに制限
+                cursor.execute(
+                    f"SELECT r.run_id, r.table_name, "
+                    f"  (SELECT COUNT(*) FROM {self.table} q WHERE q.run_id = r.run_id "
+                    f"     AND q.table_name = r.table_name AND q.status = 'failed'), "
+                    f"  (SELECT COALESCE(SUM(q.row_count), 0) FROM {self.table} q WHERE q.run_id = r.run_id "
+                    f"     AND q.table_name = r.table_name AND q.status = 'done') "
+                    f"FROM {self.runs_table} r WHERE r.status = 'planned' "
+                    f"AND NOT EXISTS (SELECT 1 FROM {self.table} q WHERE q.run_id = r.run_id "
+                    f"  AND q.table_name = r.table_name AND q.status IN ('pending', 'running')) "
+                    f"ORDER BY r.created_at LIMIT 1 FOR UPDATE OF r SKIP LOCKED"
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    self.pg_conn.rollback()
+                    return results
+                run_result = self.finalize_run(cursor, *row)
+                results.append(run_result)
+                if run_result.get('skipped_locked'):
+                    # 通常の同期が同じテーブルを処理中のため、次回のファイナライズで再試行
+                    return results
+
+    def finalize_run(self, cursor, run_id, table_name, failed_chunks, expected_rows):
+        """ステージングの件数を検証して本テーブルへ反映（呼び出し元で実行行をロック済み）"""
+        start_time = datetime.now()
+        spec = get_table_spec(table_name)
+        config = spec.config
+        staging = get_staging_table(table_name)
+        result = {'run_id': run_id, 'table_name': table_name, 'success': False}
+
+        if not acquire_table_lock(cursor, config['pg_table']):
+            self.pg_conn.rollback()
+            logger.warning(f"ファイナライズ延期: {table_name} は他の実行が同期中です")
+            result['skipped_locked'] = True
+            return result
+
+        try:
+            if failed_chunks:
+                raise RuntimeError(f"失敗したチャンクがあります: {failed_chunks}件")
+
+            cursor.execute(f"SELECT COUNT(*) FROM {staging}")
+            staging_rows = cursor.fetchone()[0]
+            if staging_rows != expected_rows:
+                raise RuntimeError(f"ステージング件数不一致: {staging_rows}件 (チャンク合計: {expected_rows}件)")
+
+            cursor.execute(f"TRUNCATE {config['pg_table']}")
+            cursor.execute(
+                f"INSERT INTO {config['pg_table']} ({spec.pg_columns_sql}) SELECT {spec.pg_columns_sql} FROM {staging}"
+            )
+            if cursor.rowcount != staging_rows:
+                raise RuntimeError(f"反映件数不一致: {cursor.rowcount}件 (ステージング: {staging_rows}件)")
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.execute(
+                f"UPDATE {self.runs_table} SET status = 'finalized', row_count = %s, finalized_at = now() "
+                f"WHERE run_id = %s AND table_name = %s",
+                (staging_rows, run_id, table_name)
+            )
+            self.pg_conn.commit()
+
+            result.update({'success': True, 'transferred_count': staging_rows})
+            logger.info(f"ファイナライズ完了: {table_name} {staging_rows:,}件 "
+                        f"(run_id: {run_id}, {(datetime.now() - start_time).total_seconds():.2f}秒)")
+
+        except Exception as e:
+            self.pg_conn.rollback()
+            with self.pg_conn.cursor() as error_cursor:
+                error_cursor.execute(
+                    f"UPDATE {self.runs_table} SET status = 'failed', error = %s "
+                    f"WHERE run_id = %s AND table_name = %s",
+                    (str(e)[:1000], run_id, table_name)
+                )
+            self.pg_conn.commit()
+            result['error'] = str(e)
+            logger.error(f"ファイナライズ失敗: {table_name} (run_id: {run_id}): {str(e)}")
+
+        return result
+
+    def status(self):
+        """実行ごとのチャンク状態の集計"""
+        with self.pg_conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT r.run_id, r.table_name, r.status, r.chunk_count, "
+                f"  COUNT(*) FILTER (WHERE q.status = 'done'), COUNT(*) FILTER (WHERE q.status = 'failed') "
+                f"FROM {self.runs_table} r LEFT JOIN {self.table} q "
+                f"  ON q.run_id = r.run_id AND q.table_name = r.table_name "
+                f"WHERE r.status IN ('planned', 'failed') OR r.finalized_at > now() - interval '1 day' "
+                f"GROUP BY r.run_id, r.table_name, r.status, r.chunk_count, r.created_at ORDER BY r.created_at"
+            )
+            rows = cursor.fetchall()
+        self.pg_conn.rollback()
+        return [
+            {'run_id': run_id, 'table_name': table_name, 'status': status,
+             'chunk_count': chunk_count, 'done_chunks': done, 'failed_chunks': failed}
+            for run_id, table_name, status, chunk_count, done, failed in rows
+        ]
+
+
+class QueueWorker:
+    """キューからチャンクを取得してステージングテーブルへロードするワーカー"""
+
+    def __init__(self, worker_id=None, options=None, remaining_time_fn=None):
+        """
+        初期化
+
+        Args:
+            worker_id (str): ワーカーID（未指定時はホスト名とPID）
+            options (dict): 同期オプション（load_method）
+            remaining_time_fn (callable): 残り実行時間（ミリ秒）を返す関数（Lambdaの context.get_remaining_time_in_millis）
+        """
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.options = options or {}
+        self.remaining_time_fn = remaining_time_fn
+        # 残り時間がこれを下回ったら新たなチャンクを取得しない
+        self.min_remaining_seconds = DatabaseConfig.get_optional_env('WORK_QUEUE_MIN_REMAINING_SECONDS', 120)
+        self.connections = {}
+        # テーブルごとの値共有と型変換（通常の同期処理と同じ変換でロードする）
+        self.row_preparers = {}
+
+    def get_connection(self, source, database=None):
+        """ソースごとの接続を遅延オープンして再利用"""
+        conn = self.connections.get(source)
+        if conn is None or getattr(conn, 'closed', 0):
+            conn = open_source_connection(source, database)
+            self.connections[source] = conn
+        return conn
+
+    def has_time_for_chunk(self):
+        if self.remaining_time_fn is None:
+            return True
+        return self.remaining_time_fn() / 1000 > self.min_remaining_seconds
+
+    def start_heartbeat(self, queue, chunk_id, stop_event):
+        """チャンク処理中のリース延長スレッド（キュー用とは別の接続を使用）"""
+        def run():
+            heartbeat_queue = WorkQueue(open_source_connection(POSTGRESQL_SOURCE), queue.table, queue.lease_seconds)
+            try:
+                while not stop_event.wait(max(1, queue.lease_seconds / 3)):
+                    if not heartbeat_queue.heartbeat(chunk_id, self.worker_id):
+                        logger.warning(f"チャンク {chunk_id} のリースを失いました")
+                        return
+            except Exception as e:
+                logger.warning(f"ハートビートエラー (チャンク {chunk_id}): {str(e)}")
+            finally:
+                heartbeat_queue.pg_conn.close()
+
+        thread = threading.Thread(target=run, name=f"heartbeat-{chunk_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def prepare_rows(self, table_name, rows):
+        """
+        取得した行の値共有と型変換（TableSyncProcessor.prepare_rows と同じ変換）
+
+        bit → boolean、JSON文字列の検証、timestamptz 列へのタイムゾーン付与などを行う
+        """
+        if table_name not in self.row_preparers:
+            config = get_table_config(table_name)
+            self.row_preparers[table_name] = (
+                ColumnInterner(config['columns'], config.get('dictionary_columns')),
+                build_row_converter(config)
+            )
+        interner, row_converter = self.row_preparers[table_name]
+        return row_converter.convert_rows(interner.intern_rows(rows))
+
+    def extract_chunk(self, chunk):
+        """SQL Serverからチャンクの主キー範囲を抽出"""
+        spec = get_table_spec(chunk['table_name'])
+        query, params = spec.range_select_query(chunk['key_from'], chunk['key_to'])
+
+        cursor = self.get_connection(spec.config['db_type'], spec.config['sql_server_db']).cursor()
+        try:
+            cursor.execute(query, params)
+            return self.prepare_rows(chunk['table_name'], cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def load_chunk(self, queue, chunk, rows):
+        """
+        チャンクをステージングへロードし、同一トランザクションで完了登録
+
+        リースを失っていた場合（他のワーカーが再取得済み）はロールバックしてFalseを返す
+        ロードと完了登録は同時にコミットするため、失敗した試行のロード分はステージングに残らない
+        """
+        staging = get_staging_table(chunk['table_name'])
+        pg_conn = queue.pg_conn
+        loaded_count = 0
+
+        with pg_conn.cursor() as cursor:
+            # 書き込みは本テーブルへのロード・追加シンクと共通（キューの接続のトランザクション内）
+            load_method = 'copy' if self.options.get('load_method') == 'copy' else 'insert'
+            sink = PostgreSQLSink(chunk['table_name'], pg_table=staging, method=load_method, conn=pg_conn, cursor=cursor)
+            sink.begin()
+            for batch in iter_batches(rows, sink.config['batch_size']):
+                loaded_count += sink.write_batch(batch)
+
+            if loaded_count != len(rows):
+                raise RuntimeError(f"ロード件数不一致: {loaded_count}件 (抽出: {len(rows)}件)")
+
+            cursor.execute(
+                f"UPDATE {queue.table} SET status = 'done', row_count = %s, lease_expires_at = NULL, "
+                f"error = NULL, updated_at = now() WHERE id = %s AND worker_id = %s AND status = 'running'",
+                (loaded_count, chunk['id'], self.worker_id)
+            )
+            if cursor.rowcount != 1:
+                pg_conn.rollback()
+                return False
+
+        pg_conn.commit()
+        return True
+
+    def process_chunk(self, queue, chunk):
+        """1チャンクを処理"""
+        start_time = datetime.now()
+        stop_event = threading.Event()
+        heartbeat_thread = self.start_heartbeat(queue, chunk['id'], stop_event)
+        try:
+            rows = self.extract_chunk(chunk)
+            if not self.load_chunk(queue, chunk, rows):
+                logger.warning(f"チャンク破棄（リース喪失）: {chunk['table_name']}#{chunk['chunk_no']}")
+                return {'success': False, 'rows': 0, 'lease_lost': True}
+
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"チャンク完了: {chunk['table_name']}#{chunk['chunk_no']} {len(rows):,}件 ({duration:.2f}秒)")
+            return {'success': True, 'rows': len(rows)}
+
+        except Exception as e:
+            queue.pg_conn.rollback()
+            queue.fail(chunk['id'], self.worker_id, e)
+            logger.error(f"チャンク失敗: {chunk['table_name']}#{chunk['chunk_no']} "
+                         f"(試行 {chunk['attempts']}回目): {str(e)}")
+            return {'success': False, 'rows': 0, 'error': str(e)}
+
+        finally:
+            stop_event.set()
+            heartbeat_thread.join(timeout=5)
+
+    def run(self, finalize=True):
+        """
+        キューが空になるまで（または残り時間が尽きるまで）チャンクを処理
+
+        Args:
+            finalize (bool): キューが空になった後に完了した実行のファイナライズを試みる
+        """
+        start_time = datetime.now()
+        logger.info(f"=== キューワーカー開始: {self.worker_id} ===")
+        result = {
+            'worker_id': self.worker_id,
+            'processed_chunks': 0,
+            'failed_chunks': 0,
+            'transferred_count': 0,
+            'finalized': []
+        }
+
+        try:
+            queue = WorkQueue(self.get_connection(POSTGRESQL_SOURCE))
+            queue.ensure_tables()
+
+            while self.has_time_for_chunk():
+                chunk = queue.claim(self.worker_id)
+                if chunk is None:
+                    break
+                chunk_result = self.process_chunk(queue, chunk)
+                if chunk_result['success']:
+                    result['processed_chunks'] += 1
+                    result['transferred_count'] += chunk_result['rows']
+                else:
+                    result['failed_chunks'] += 1
+
+            if finalize:
+                result['finalized'] = queue.finalize_ready()
+
+            result['success'] = (
+                result['failed_chunks'] == 0 and all(r['success'] for r in result['finalized'])
+            )
+
+        except Exception as e:
+            logger.error(f"キューワーカーエラー: {str(e)}")
+            result.update({'success': False, 'error': str(e)})
+
+        finally:
+            close_connections(self.connections)
+            self.connections = {}
+
+        result['execution_time'] = (datetime.now() - start_time).total_seconds()
+        logger.info(f"=== キューワーカー終了: {result['processed_chunks']}チャンク "
+                    f"{result['transferred_count']:,}件 ({result['execution_time']:.2f}秒) ===")
+        return result
+
+
+def plan_run(run_id, table_names, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    対象テーブルをチャンク分割してキューに登録（planner）
+
+    Returns:
+        dict: 実行結果
+    """
+    start_time = datetime.now()
+    connections = {}
+    result = {'run_id': run_id, 'chunks': {}, 'success': False}
+
+    try:
+        pg_conn = open_source_connection(POSTGRESQL_SOURCE)
+        connections[POSTGRESQL_SOURCE] = pg_conn
+        queue = WorkQueue(pg_conn)
+        queue.ensure_tables()
+
+        for table_name in table_names:
+            config = get_table_config(table_name)
+            if config['db_type'] not in connections:
+                connections[config['db_type']] = open_source_connection(config['db_type'], config['sql_server_db'])
+            sql_cursor = connections[config['db_type']].cursor()
+            try:
+                result['chunks'][table_name] = queue.plan_table(run_id, table_name, sql_cursor, chunk_rows)
+            finally:
+                sql_cursor.close()
+
+        result['success'] = True
+
+    except Exception as e:
+        logger.error(f"キュー登録エラー: {str(e)}")
+        result['error'] = str(e)
+
+    finally:
+        close_connections(connections)
+
+    result['execution_time'] = (datetime.now() - start_time).total_seconds()
+    return result
+
+
+def finalize_runs():
+    """全チャンク完了した実行をファイナライズ（finalizer）"""
+    start_time = datetime.now()
+    pg_conn = None
+    try:
+        pg_conn = open_source_connection(POSTGRESQL_SOURCE)
+        queue = WorkQueue(pg_conn)
+        queue.ensure_tables()
+        finalized = queue.finalize_ready()
+        return {
+            'success': all(r['success'] for r in finalized),
+            'finalized': finalized,
+            'queue_status': queue.status(),
+            'execution_time': (datetime.now() - start_time).total_seconds()
+        }
+    except Exception as e:
+        logger.error(f"ファイナライズエラー: {str(e)}")
+        return {'success': False, 'error': str(e), 'execution_time': (datetime.now() - start_time).total_seconds()}
+    finally:
+        if pg_conn is not None:
+            pg_conn.close()
+
+
+def run_worker_process(worker_index, options):
+    """ローカル複数プロセス実行用のワーカー（子プロセスのエントリーポイント）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{worker_index} - %(levelname)s - %(message)s'
+    )
+    result = QueueWorker(worker_id=f"{socket.gethostname()}:{os.getpid()}:{worker_index}", options=options).run()
+    raise SystemExit(0 if result.get('success') else 1)
+
+
+# ローカル実行（1つのPostgreSQLに対して複数ワーカープロセスで処理）
+if __name__ == '__main__':
+    import sys
+    import uuid
+    import multiprocessing
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('plan', 'work', 'finalize', 'status'):
+        print("使用方法: python work_queue.py [plan|work|finalize|status] "
+              "[--tables=t1,t2] [--chunk-rows=100000] [--processes=4] [--load-method=copy]")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    table_names = None
+    chunk_rows = DEFAULT_CHUNK_ROWS
+    processes = 1
+    options = {}
+    for arg in sys.argv[2:]:
+        if arg.startswith('--tables='):
+            table_names = arg.split('=')[1].split(',')
+        elif arg.startswith('--chunk-rows='):
+            chunk_rows = int(arg.split('=')[1])
+        elif arg.startswith('--processes='):
+            processes = int(arg.split('=')[1])
+        elif arg.startswith('--load-method='):
+            options['load_method'] = arg.split('=')[1]
+
+    if command == 'plan':
+        from table_configs import DEFAULT_SYNC_ORDER
+        result = plan_run(f"local-{uuid.uuid4().hex[:12]}", table_names or DEFAULT_SYNC_ORDER, chunk_rows)
+    elif command == 'work':
+        workers = [
+            multiprocessing.Process(target=run_worker_process, args=(idx, options), name=f"queue-worker-{idx}")
+            for idx in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        result = {'success': all(worker.exitcode == 0 for worker in workers), 'processes': processes}
+    elif command == 'finalize':
+        result = finalize_runs()
+    else:
+        pg_conn = open_source_connection(POSTGRESQL_SOURCE)
+        try:
+            result = {'success': True, 'queue_status': WorkQueue(pg_conn).status()}
+        finally:
+            pg_conn.close()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    sys.exit(0 if result.get('success') else 1)